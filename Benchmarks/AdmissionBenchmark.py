@@ -0,0 +1,74 @@
+#
+# AdmissionBenchmark.py
+# Measured peak memory of a segmentation request against the admission control's estimate
+#
+import argparse
+import os
+import sys
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+sys.path.append(RepoRoot + "/Remote-Communication-Module-3D-Slicer/flask-server")
+
+from Models import Wire
+from Models.Segmentation.Inference import Infer
+from Admission import EstimatePeak
+from WireBenchmark import LoadVolume, EncodeNpz
+
+HeartModelPath = RepoRoot + "/Models/Segmentation/Models_Saved/Heart_Localization"
+
+
+def Request(Model, Format, Body):
+    """
+    Decodes The Volume, Segments it & Encodes The Mask The Way The Server Does
+    """
+    if Format == "stream":
+        # Streamed Volumes Are Only Prepared While They Arrive For The Resize Mode
+        Preparer = None
+
+        def OnSlab(Array, First, Last):
+            nonlocal Preparer
+            if Model.mode == "resize":
+                Preparer = Preparer or Model.slab_preparer(Array.shape)
+                Preparer.add(Array[First:Last], First)
+
+        Volume, _ = Wire.DecodeStream(BytesIO(Body), OnSlab)
+        Volume = Preparer.finish() if Preparer else Volume
+    elif Format == "raw":
+        Volume, _ = Wire.DecodeArray(Body)
+    else:
+        Volume = np.load(BytesIO(Body))["Volume"]
+    return Wire.EncodeArray(Model.predict(Volume), "zstd")
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Admission Control Estimate vs Measured Peak Memory")
+    Parser.add_argument("--model", default=HeartModelPath, help="SavedModel Directory")
+    Parser.add_argument("--input", type=int, nargs=3, default=[112, 112, 112], help="Model Input Shape")
+    Parser.add_argument("--shape", type=int, nargs=3, default=[200, 512, 512], help="Synthetic Volume Shape")
+    Parser.add_argument("--nifti", help="Use This NIfTI Volume Instead of a Synthetic One")
+    Args = Parser.parse_args()
+
+    Volume = LoadVolume(Args)
+    Bodies = {"raw": Wire.EncodeArray(Volume, "zstd"), "npz": EncodeNpz(Volume),
+              "stream": b"".join(Wire.EncodeStream(Volume, "zstd"))}
+    print(f"Volume {Volume.shape}, {Volume.nbytes / 1024 ** 2:.0f} MB")
+    print(f"{'Mode':8} {'Format':7} {'Estimate':>10} {'Measured':>10} {'Per Voxel':>10}")
+    for Mode in ("resize", "sliding"):
+        Model = Infer(model_path=Args.model, model_input=tuple(Args.input), mode=Mode)
+        Model.warm_up()
+        for Format, Body in Bodies.items():
+            Path = "prepared" if Format == "stream" and Mode == "resize" else Mode
+            # The Server Only Holds Raw Bodies Whole, npz Uploads Are Spooled To Disk
+            Estimate = EstimatePeak(Volume.shape, Volume.dtype, len(Body) if Format == "raw" else 0, Path)
+
+            tracemalloc.start()
+            Request(Model, Format, Body)
+            Peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{Mode:8} {Format:7} {Estimate / 1024 ** 2:8.0f}MB {Peak / 1024 ** 2:8.0f}MB "
+                  f"{Peak / Volume.size:9.2f}B")
@@ -0,0 +1,76 @@
+#
+# AgatstonBenchmark.py
+# Throughput of the vectorized Agatston scoring, lesion table & density index against a per-lesion Python loop
+#
+import argparse
+import os
+import sys
+
+import numpy as np
+from scipy import ndimage
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models.Segmentation.CAC import AgatstonScore, LesionTable, DensityIndex, DENSITY_STEPS, REFERENCE_THICKNESS
+from MaskBenchmark import HeartMask, CalcificationsMask
+from WireBenchmark import LoadVolume, Timed
+
+
+def LoopScore(Scan, Mask, Spacing, Threshold=130, MinArea=1.0):
+    """
+    Reference Agatston Score, Labels Each Slice & Scores Its Lesions One by One
+    """
+    Score = 0.0
+    PixelArea = Spacing[0] * Spacing[1]
+    for Slice, SliceMask in zip(Scan, Mask):
+        Labels, Count = ndimage.label((SliceMask > 0) & (Slice >= Threshold), structure=np.ones((3, 3)))
+        for Lesion in range(1, Count + 1):
+            Voxels = Slice[Labels == Lesion]
+            Area = Voxels.size * PixelArea
+            if Area >= MinArea:
+                Score += Area * (np.searchsorted(DENSITY_STEPS, Voxels.max(), side="right") + 1)
+    return Score * Spacing[2] / REFERENCE_THICKNESS
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Agatston Scoring Benchmark")
+    Parser.add_argument("--shape", type=int, nargs=3, default=[400, 512, 512], help="Synthetic Volume Shape")
+    Parser.add_argument("--nifti", help="Use This NIfTI Volume Instead of a Synthetic One")
+    Parser.add_argument("--spacing", type=float, nargs=3, default=[0.7, 0.7, 3.0], help="Voxel Spacing x y z")
+    Parser.add_argument("--lesions", type=int, default=40, help="Synthetic Calcifications")
+    Parser.add_argument("--noise", type=float, default=20, help="HU Noise of The Synthetic Heart")
+    Parser.add_argument("--runs", type=int, default=3)
+    Parser.add_argument("--no-loop", action="store_true", help="Skip The Slow Per Lesion Reference")
+    Args = Parser.parse_args()
+
+    Volume = LoadVolume(Args)
+    Shape = Volume.shape
+    # Calcifications Get Peaks in Every Density Band, The Scored Mask is The Heart With Them
+    Rng = np.random.default_rng(1)
+    Heart = HeartMask(Shape).astype(bool)
+    Calcifications = CalcificationsMask(Shape, Args.lesions).astype(bool)
+    if not Args.nifti:
+        Volume[Heart] = Rng.normal(40, Args.noise, int(Heart.sum()))
+    Volume[Calcifications] = Rng.integers(100, 900, int(Calcifications.sum()))
+    Mask = Heart | Calcifications
+
+    print(f"Volume {Shape}, {Volume.size / 1e6:.0f} M Voxels, {Args.lesions} Synthetic Calcifications")
+    Scores, Time = Timed(lambda: AgatstonScore(Volume, Mask, Args.spacing), Args.runs)
+    print(f"{'Vectorized':10} {Time * 1000:8.0f}ms {Volume.size / Time / 1e6:8.0f} M Voxels/s  "
+          f"Agatston {Scores['agatston']:.1f}, Volume {Scores['volume']:.1f} mm³, Mass {Scores['mass']:.1f} mg, "
+          f"{Scores['lesions']} Lesions")
+    Table, Time = Timed(lambda: LesionTable(Volume, Mask, Args.spacing), Args.runs)
+    print(f"{'Table':10} {Time * 1000:8.0f}ms {Volume.size / Time / 1e6:8.0f} M Voxels/s  {len(Table)} 3D Lesions")
+    Index, Time = Timed(lambda: DensityIndex(Volume, Mask, Args.spacing), 1)
+    Thresholds = np.arange(130, 600)
+    _, Query = Timed(lambda: [Index.score(Threshold) for Threshold in Thresholds], Args.runs)
+    for Threshold in (130, 300):
+        assert np.isclose(Index.score(Threshold)["agatston"],
+                          AgatstonScore(Volume, Mask, Args.spacing, Threshold)["agatston"])
+    print(f"{'Index':10} {Time * 1000:8.0f}ms {Volume.size / Time / 1e6:8.0f} M Voxels/s  "
+          f"{Query / len(Thresholds) * 1e6:.1f}µs per Threshold")
+    if not Args.no_loop:
+        Score, Time = Timed(lambda: LoopScore(Volume, Mask, Args.spacing), 1)
+        assert np.isclose(Score, Scores["agatston"]), (Score, Scores["agatston"])
+        print(f"{'Loop':10} {Time * 1000:8.0f}ms {Volume.size / Time / 1e6:8.0f} M Voxels/s  Agatston {Score:.1f}")
@@ -0,0 +1,340 @@
+#
+# InferenceBenchmark.py
+# Benchmarks & checks for the Infer class
+#
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models.Segmentation.Inference import Infer, upsample_mask
+from Models.Segmentation.Backends import configure_cpu
+from Models.crop_roi import GetSampleSlices
+
+HeartModelPath = RepoRoot + "/Models/Segmentation/Models_Saved/Heart_Localization"
+
+
+def RandomVolume(Shape, Seed=0):
+    """
+    Synthetic CT-Like Volume in HU, Air Background With a Brighter Block in The Middle
+    """
+    Rng = np.random.default_rng(Seed)
+    Volume = Rng.normal(-800, 100, Shape).astype(np.int16)
+    Center = tuple(slice(s // 4, 3 * s // 4) for s in Shape)
+    Volume[Center] = Rng.normal(40, 60, Volume[Center].shape).astype(np.int16)
+    return Volume
+
+
+def Stress(Args):
+    """
+    Shares One Infer Instance Between Many Threads Predicting Volumes of Different Shapes,
+    Each Prediction Must Come Back With The Shape of Its Own Input
+    """
+    Model = Infer(model_path=Args.model, model_input=tuple(Args.input))
+    Rng = np.random.default_rng(0)
+    Shapes = [tuple(int(i) for i in Rng.integers(32, 160, 3)) for _ in range(Args.requests)]
+
+    def Run(i):
+        Volume = RandomVolume(Shapes[i], Seed=i)
+        return Shapes[i], Model.predict(Volume).shape
+
+    Start = time.time()
+    with ThreadPoolExecutor(max_workers=Args.threads) as Pool:
+        Results = list(Pool.map(Run, range(Args.requests)))
+    Elapsed = time.time() - Start
+
+    Mismatches = [(Expected, Got) for Expected, Got in Results if Expected != Got]
+    print(f"{Args.requests} Predictions on {Args.threads} Threads in {Elapsed:.2f} Seconds")
+    for Expected, Got in Mismatches:
+        print(f"Shape Mismatch: Expected {Expected}, Got {Got}")
+    print("Passed" if not Mismatches else f"Failed, {len(Mismatches)} Mismatches")
+    return 1 if Mismatches else 0
+
+
+def Percentiles(Times):
+    Times = np.array(Times) * 1000
+    return (f"mean {Times.mean():8.1f} ms, p50 {np.percentile(Times, 50):8.1f} ms, "
+            f"p95 {np.percentile(Times, 95):8.1f} ms")
+
+
+def Latency(Args):
+    """
+    Forward Pass Latency of The Eager Model Next To The Compiled Graph (And XLA if Requested), on CPU
+    """
+    import tensorflow as tf
+
+    Variants = [("Eager", dict(compiled=False)), ("Compiled", dict(compiled=True))]
+    if Args.xla:
+        Variants.append(("Compiled + XLA", dict(compiled=True, xla=True)))
+
+    with tf.device("/CPU:0"):
+        Batch = tf.constant(Infer.range_scale(RandomVolume((Args.batch, *Args.input, 1))), dtype=tf.float32)
+        for Name, Options in Variants:
+            Model = Infer(model_path=Args.model, model_input=tuple(Args.input), **Options)
+            Start = time.time()
+            Model.warm_up()
+            WarmUp = time.time() - Start
+
+            Times = []
+            for _ in range(Args.runs):
+                Start = time.time()
+                Model.forward(Batch)
+                Times.append(time.time() - Start)
+            print(f"{Name:16} warm-up {WarmUp * 1000:8.1f} ms, {Percentiles(Times)}")
+    return 0
+
+
+def Partial(Args):
+    """
+    Partial Localization Latency, The 3 Sampled Views Predicted One by One vs Prepared in Parallel
+    & Predicted in a Single Forward Pass, Both Must Return The Same Masks
+    """
+    Views = GetSampleSlices(RandomVolume(tuple(Args.volume)))
+    Model = Infer(model_path=Args.model, model_input=tuple(Args.input))
+    Model.warm_up()
+
+    Variants = [("Per View", lambda: [Model.predict(View) for View in Views]),
+                ("Batched", lambda: Model.predict_batch(Views))]
+    Masks = {}
+    for Name, Run in Variants:
+        Run()
+        Times = []
+        for _ in range(Args.runs):
+            Start = time.time()
+            Masks[Name] = Run()
+            Times.append(time.time() - Start)
+        print(f"{Name:10} {Percentiles(Times)}")
+
+    Same = all(np.array_equal(A, B) for A, B in zip(Masks["Per View"], Masks["Batched"]))
+    print("Masks Match" if Same else "Masks Differ")
+    return 0 if Same else 1
+
+
+def BackendRun(Args):
+    """
+    Loads One Backend & Predicts a Volume, Run in a Separate Process by Backends() so RSS is Per Backend
+    """
+    Start = time.time()
+    Model = Infer(model_path=Args.model, model_input=tuple(Args.input))
+    LoadTime = time.time() - Start
+    Model.warm_up()
+
+    Volume = RandomVolume(tuple(Args.volume))
+    Times = []
+    for _ in range(Args.runs):
+        Start = time.time()
+        Mask = Model.predict(Volume)
+        Times.append(time.time() - Start)
+    np.save(Args.output, Mask)
+
+    print(json.dumps({"backend": Model.backend_name, "load": LoadTime, "times": Times,
+                      "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+    return 0
+
+
+def Dice(A, B):
+    A, B = A > 0, B > 0
+    Total = A.sum() + B.sum()
+    return 2 * np.logical_and(A, B).sum() / Total if Total else 1.0
+
+
+def CompareBackends(Args):
+    """
+    Latency, Peak RSS & Mask Parity of Each Exported Model Against The TF SavedModel
+    """
+    Reference = None
+    print(f"{'Backend':8} {'Load':>8} {'Mean':>9} {'p95':>9} {'Peak RSS':>10} {'Dice':>7} {'Agree':>8}  Model")
+    with tempfile.TemporaryDirectory() as Directory:
+        for i, Path in enumerate([Args.model] + Args.compare):
+            Output = os.path.join(Directory, f"{i}.npy")
+            Command = [sys.executable, os.path.realpath(__file__), "--model", Path,
+                       "--input", *[str(j) for j in Args.input], "backend-run", "--runs", str(Args.runs),
+                       "--volume", *[str(j) for j in Args.volume], "--output", Output]
+            Process = subprocess.run(Command, check=True, capture_output=True, text=True)
+            Result = json.loads(Process.stdout.splitlines()[-1])
+
+            Mask = np.load(Output)
+            if Reference is None:
+                Reference = Mask
+            Times = np.array(Result["times"]) * 1000
+            print(f"{Result['backend']:8} {Result['load']:7.2f}s {Times.mean():7.1f}ms "
+                  f"{np.percentile(Times, 95):7.1f}ms {Result['rss']:8.0f}MB {Dice(Reference, Mask):7.4f} "
+                  f"{np.mean(Reference == Mask):8.5f}  {Path}")
+    return 0
+
+
+def LegacyPostProcess(Prediction, Shape, Threshold):
+    """
+    Post-Processing as Done Before upsample_mask, float64 Resize Then Two Thresholding Passes
+    """
+    from skimage.transform import resize
+
+    Src = np.copy(Prediction)
+    Src = resize(Src, output_shape=Shape)
+    Src = np.moveaxis(Src, -1, 0)
+    Src[Src < Threshold] = 0.0
+    Src[Src >= Threshold] = 1.0
+    return Src
+
+
+def PostProcess(Args):
+    """
+    Peak Memory & Time of Upsampling a Model Resolution Prediction to The Volume's Shape
+    """
+    from scipy.ndimage import gaussian_filter
+
+    Rng = np.random.default_rng(0)
+    Prediction = gaussian_filter(Rng.random(tuple(Args.input)).astype(np.float32), 4)
+    Prediction = (Prediction - Prediction.min()) / (Prediction.max() - Prediction.min())
+    Shape = tuple(Args.volume)
+
+    Variants = [("Legacy float64", lambda: LegacyPostProcess(Prediction, Shape, Args.threshold)),
+                ("Linear uint8", lambda: upsample_mask(Prediction, Shape, Args.threshold, "linear")),
+                ("Nearest uint8", lambda: upsample_mask(Prediction, Shape, Args.threshold, "nearest"))]
+
+    Reference = None
+    for Name, Run in Variants:
+        tracemalloc.start()
+        Start = time.time()
+        Mask = Run()
+        Elapsed = time.time() - Start
+        Peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        Reference = Mask if Reference is None else Reference
+        print(f"{Name:16} {Elapsed:6.2f} s, peak {Peak / 1024 ** 2:8.1f} MB, output {Mask.nbytes / 1024 ** 2:8.1f} MB, "
+              f"agreement {np.mean(Reference == Mask):.5f}")
+        del Mask
+    return 0
+
+
+def ThreadsRun(Args):
+    """
+    One Worker of The Thread Sweep, Configured Before Its Model is Loaded
+    """
+    configure_cpu(intra_op_threads=Args.intra, inter_op_threads=Args.inter, onednn=Args.onednn,
+                  cpu_affinity=Args.affinity)
+    Model = Infer(model_path=Args.model, model_input=tuple(Args.input))
+    Model.warm_up()
+
+    Volume = RandomVolume(tuple(Args.volume))
+    Times = []
+    for _ in range(Args.runs):
+        Start = time.time()
+        Model.predict(Volume)
+        Times.append(time.time() - Start)
+    print(json.dumps({"times": Times}))
+    return 0
+
+
+def Threads(Args):
+    """
+    Sweeps Workers Per Node, Intra-Op & Inter-Op Threads, Each Worker is a Process Pinned to Its Own Share of
+    The Cores, Reports Aggregate Throughput & p95 Latency For Each Setting
+    """
+    Cores = sorted(os.sched_getaffinity(0))
+    print(f"{len(Cores)} Cores Available")
+    print(f"{'Workers':>7} {'Intra':>5} {'Inter':>5} {'oneDNN':>6} {'Throughput':>14} {'p50':>9} {'p95':>9}")
+
+    for Workers in Args.workers:
+        Share = len(Cores) // Workers
+        if Share == 0:
+            continue
+        for Intra in Args.intra or [Share]:
+            for Inter in Args.inter:
+                for OneDNN in Args.onednn:
+                    Processes = []
+                    for i in range(Workers):
+                        Affinity = ",".join(str(c) for c in Cores[i * Share:(i + 1) * Share])
+                        Command = [sys.executable, os.path.realpath(__file__), "--model", Args.model,
+                                   "--input", *[str(j) for j in Args.input], "threads-run",
+                                   "--intra", str(Intra), "--inter", str(Inter), "--affinity", Affinity,
+                                   "--runs", str(Args.runs), "--volume", *[str(j) for j in Args.volume]]
+                        Command += ["--onednn"] if OneDNN else ["--no-onednn"]
+                        Processes.append(subprocess.Popen(Command, stdout=subprocess.PIPE, text=True))
+
+                    Times = []
+                    Throughput = 0.0
+                    for Process in Processes:
+                        WorkerTimes = json.loads(Process.communicate()[0].splitlines()[-1])["times"]
+                        Times += WorkerTimes
+                        Throughput += len(WorkerTimes) / sum(WorkerTimes)
+
+                    Times = np.array(Times) * 1000
+                    print(f"{Workers:7} {Intra:5} {Inter:5} {'on' if OneDNN else 'off':>6} "
+                          f"{Throughput * 60:9.1f} /min {np.percentile(Times, 50):7.0f}ms "
+                          f"{np.percentile(Times, 95):7.0f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Infer Benchmarks")
+    Parser.add_argument("--model", default=HeartModelPath, help="SavedModel Directory")
+    Parser.add_argument("--input", type=int, nargs=3, default=[112, 112, 112], help="Model Input Shape")
+    Commands = Parser.add_subparsers(dest="command", required=True)
+
+    StressParser = Commands.add_parser("stress", help="Concurrent Predictions Sharing One Model")
+    StressParser.add_argument("--threads", type=int, default=8)
+    StressParser.add_argument("--requests", type=int, default=64)
+    StressParser.set_defaults(func=Stress)
+
+    LatencyParser = Commands.add_parser("latency", help="Eager vs Compiled Forward Pass Latency on CPU")
+    LatencyParser.add_argument("--runs", type=int, default=10)
+    LatencyParser.add_argument("--batch", type=int, default=1)
+    LatencyParser.add_argument("--xla", action="store_true", help="Also Benchmark The XLA Compiled Graph")
+    LatencyParser.set_defaults(func=Latency)
+
+    PartialParser = Commands.add_parser("partial", help="Per View vs Batched Partial Localization Latency")
+    PartialParser.add_argument("--runs", type=int, default=10)
+    PartialParser.add_argument("--volume", type=int, nargs=3, default=[400, 512, 512], help="Sampled Volume Shape")
+    PartialParser.set_defaults(func=Partial)
+
+    BackendsParser = Commands.add_parser("backends", help="Latency, RSS & Mask Parity of Exported Models vs TF")
+    BackendsParser.add_argument("compare", nargs="+", help="Exported .onnx/.tflite Models to Compare")
+    BackendsParser.add_argument("--runs", type=int, default=5)
+    BackendsParser.add_argument("--volume", type=int, nargs=3, default=[400, 512, 512], help="Test Volume Shape")
+    BackendsParser.set_defaults(func=CompareBackends)
+
+    BackendRunParser = Commands.add_parser("backend-run")
+    BackendRunParser.add_argument("--runs", type=int, default=5)
+    BackendRunParser.add_argument("--volume", type=int, nargs=3, default=[400, 512, 512])
+    BackendRunParser.add_argument("--output", required=True)
+    BackendRunParser.set_defaults(func=BackendRun)
+
+    PostProcessParser = Commands.add_parser("postprocess", help="Peak Memory of Mask Upsampling, No Model Needed")
+    PostProcessParser.add_argument("--volume", type=int, nargs=3, default=[512, 512, 400],
+                                   help="Volume Shape, Axial Axis Last")
+    PostProcessParser.add_argument("--threshold", type=float, default=0.9)
+    PostProcessParser.set_defaults(func=PostProcess)
+
+    ThreadsParser = Commands.add_parser("threads", help="Sweep Workers & CPU Thread Settings")
+    ThreadsParser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ThreadsParser.add_argument("--intra", type=int, nargs="+", help="Defaults to The Cores Given to Each Worker")
+    ThreadsParser.add_argument("--inter", type=int, nargs="+", default=[1, 2])
+    ThreadsParser.add_argument("--onednn", type=int, nargs="+", choices=[0, 1], default=[1])
+    ThreadsParser.add_argument("--runs", type=int, default=5)
+    ThreadsParser.add_argument("--volume", type=int, nargs=3, default=[400, 512, 512])
+    ThreadsParser.set_defaults(func=Threads)
+
+    ThreadsRunParser = Commands.add_parser("threads-run")
+    ThreadsRunParser.add_argument("--intra", type=int)
+    ThreadsRunParser.add_argument("--inter", type=int)
+    ThreadsRunParser.add_argument("--onednn", action=argparse.BooleanOptionalAction)
+    ThreadsRunParser.add_argument("--affinity")
+    ThreadsRunParser.add_argument("--runs", type=int, default=5)
+    ThreadsRunParser.add_argument("--volume", type=int, nargs=3, default=[400, 512, 512])
+    ThreadsRunParser.set_defaults(func=ThreadsRun)
+
+    Arguments = Parser.parse_args()
+    sys.exit(Arguments.func(Arguments))
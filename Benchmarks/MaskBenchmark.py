@@ -0,0 +1,67 @@
+#
+# MaskBenchmark.py
+# Response size & encode/decode time of the mask formats returned by the segmentation routes
+#
+import argparse
+import os
+import sys
+
+import numpy as np
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models import Wire
+from WireBenchmark import EncodeNpz, DecodeNpz, Timed
+
+
+def HeartMask(Shape):
+    """
+    Synthetic Heart Mask, an Ellipsoid Filling About 4% of The Volume
+    """
+    Z, Y, X = np.ogrid[tuple(slice(0, Size) for Size in Shape)]
+    Center = [Size * Position for Size, Position in zip(Shape, (0.5, 0.55, 0.45))]
+    Radii = [Size * Fraction for Size, Fraction in zip(Shape, (0.3, 0.18, 0.18))]
+    return ((((Z - Center[0]) / Radii[0]) ** 2 + ((Y - Center[1]) / Radii[1]) ** 2 +
+             ((X - Center[2]) / Radii[2]) ** 2) <= 1).astype(np.uint8)
+
+
+def CalcificationsMask(Shape, Count=40, Seed=0):
+    """
+    Synthetic Calcifications, Small Blobs Scattered Around The Heart
+    """
+    Rng = np.random.default_rng(Seed)
+    Mask = np.zeros(Shape, dtype=np.uint8)
+    for _ in range(Count):
+        Center = [int(Rng.uniform(0.3, 0.7) * Size) for Size in Shape]
+        Radius = Rng.integers(1, 4, 3)
+        Mask[tuple(slice(C - R, C + R + 1) for C, R in zip(Center, Radius))] = 1
+    return Mask
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Mask Transfer Format Benchmark")
+    Parser.add_argument("--shape", type=int, nargs=3, default=[400, 512, 512], help="Synthetic Mask Shape")
+    Parser.add_argument("--runs", type=int, default=3)
+    Args = Parser.parse_args()
+
+    Formats = [("npz", "zlib", EncodeNpz, DecodeNpz)]
+    for Compression in Wire.AvailableCompressions():
+        Formats.append(("raw", Compression, lambda M, C=Compression: Wire.EncodeArray(M, C),
+                        lambda D: Wire.DecodeArray(D)[0]))
+    for Encoding in Wire.MaskEncodings:
+        for Compression in Wire.AvailableCompressions():
+            Formats.append((Encoding, Compression, lambda M, E=Encoding, C=Compression: Wire.EncodeMask(M, E, C),
+                            lambda D: Wire.DecodeMask(D)[0]))
+
+    Masks = [("Heart", HeartMask(tuple(Args.shape))), ("Calcifications", CalcificationsMask(tuple(Args.shape)))]
+    for Name, Mask in Masks:
+        print(f"{Name} Mask {Mask.shape}, {Mask.mean() * 100:.2f}% Foreground, {Mask.nbytes / 1024 ** 2:.1f} MB")
+        print(f"{'Format':8} {'Codec':6} {'Size':>10} {'Encode':>9} {'Decode':>9}")
+        for Format, Compression, Encode, Decode in Formats:
+            Body, EncodeTime = Timed(lambda: Encode(Mask), Args.runs)
+            Decoded, DecodeTime = Timed(lambda: Decode(Body), Args.runs)
+            assert np.array_equal(Decoded, Mask)
+            print(f"{Format:8} {Compression:6} {len(Body) / 1024:8.1f}KB {EncodeTime * 1000:7.0f}ms "
+                  f"{DecodeTime * 1000:7.0f}ms")
+        print()
@@ -0,0 +1,132 @@
+#
+# MaskMemoryBenchmark.py
+# Peak RSS of a full scoring run with uint8 masks against the float64 masks the pipeline used to pass around
+#
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models import Pipeline, Wire
+from Models.Segmentation.CAC import RegionSlices
+from MaskBenchmark import HeartMask, CalcificationsMask
+from WireBenchmark import LoadVolume
+
+
+def LegacyThresholdCAC(scan, threshold=130, roi=None):
+    """
+    Thresholding as Done Before Compact Masks, a Copy of The Scan or its Region With Its dtype
+    """
+    src = np.copy(scan if roi is None else scan[RegionSlices(roi)])
+    src[src < threshold] = 0
+    src[src >= threshold] = 1
+    return src
+
+
+def LegacyQuantifyCAC(scan_threshold, pred, voxel_spacing, roi=None):
+    """
+    Quantification as Done Before Compact Masks, float64 Masks The Size of The Volume or its Region
+    """
+    voxel_vol = (voxel_spacing[0] * voxel_spacing[1] * voxel_spacing[2]) / 3
+    if roi is not None:
+        # The Candidates of The Region Inside The Heart Are Counted
+        FinalPred = ((scan_threshold > 0) & (pred > 0)).astype(np.float64)
+        return FinalPred, np.count_nonzero(FinalPred) * voxel_vol
+    masked_out_pred = scan_threshold * pred
+    shape = scan_threshold.shape
+    xmin = int(shape[1] * 0.165)
+    xmax = shape[1] - xmin
+    masked_out = np.zeros(shape)
+    masked_out[5:shape[0] - 4, xmin:xmax, :] = scan_threshold[5:shape[0] - 4, xmin:xmax, :]
+    FinalPred = masked_out + masked_out_pred
+    FinalPred[FinalPred > 0] = 1
+    candidate_voxels = np.count_nonzero(FinalPred)
+    return FinalPred, candidate_voxels * voxel_vol
+
+
+def MemoryMB(Field):
+    """
+    Peak ("VmHWM") or Current ("VmRSS") RSS of This Process in MB, Linux's ru_maxrss Would Start From The RSS of
+    The Parent That Forked it
+    """
+    with open("/proc/self/status") as Status:
+        for Line in Status:
+            if Line.startswith(Field + ":"):
+                return int(Line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def ScoreRun(Args):
+    """
+    Scores The Saved Volume With One Mask Type, Run in a Separate Process by main() so Peak RSS is Per Mask Type
+    """
+    Volume = np.load(os.path.join(Args.directory, "volume.npy"))
+    Heart = np.load(os.path.join(Args.directory, "heart.npy"))
+    if Args.run == "legacy":
+        # The Heart Model Returned float64 Masks & The Scoring Steps Kept Them
+        SegmentHeart = lambda V: Heart.astype(np.float64)
+        Pipeline.ThresholdCAC, Pipeline.QuantifyCAC = LegacyThresholdCAC, LegacyQuantifyCAC
+        Pipeline.AsMask = lambda Mask: Mask
+    else:
+        # The Model's Output is a New uint8 Mask
+        SegmentHeart = lambda V: Heart.copy()
+    Baseline = MemoryMB("VmRSS")
+
+    Start = time.time()
+    Result = Pipeline.CaScore(Volume, Args.spacing, SegmentHeart, Crop=not Args.no_crop)
+    Time = time.time() - Start
+    Peak = MemoryMB("VmHWM")
+    Masks = [Result["heart"], Result["calcifications"]]
+    print(json.dumps({"baseline": Baseline, "peak": Peak, "time": Time, "score": Result["score"],
+                      "agatston": Result["scores"]["agatston"], "dtype": str(Masks[1].dtype),
+                      "bytes": sum(Mask.nbytes for Mask in Masks),
+                      "packed": sum(len(Wire.EncodeMask(Mask, "packbits")) for Mask in Masks)}))
+    return 0
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Peak RSS of Scoring With Compact Masks")
+    Parser.add_argument("--shape", type=int, nargs=3, default=[200, 512, 512], help="Synthetic Volume Shape")
+    Parser.add_argument("--nifti", help="Use This NIfTI Volume Instead of a Synthetic One")
+    Parser.add_argument("--spacing", type=float, nargs=3, default=[0.7, 0.7, 3.0], help="Voxel Spacing x y z")
+    Parser.add_argument("--lesions", type=int, default=40, help="Synthetic Calcifications")
+    Parser.add_argument("--no-crop", action="store_true", help="Score The Whole Volume")
+    Parser.add_argument("--run", choices=["legacy", "compact"], help=argparse.SUPPRESS)
+    Parser.add_argument("--directory", help=argparse.SUPPRESS)
+    Args = Parser.parse_args()
+    if Args.run:
+        sys.exit(ScoreRun(Args))
+
+    Volume = LoadVolume(Args)
+    Calcifications = CalcificationsMask(Volume.shape, Args.lesions).astype(bool)
+    Volume[Calcifications] = np.random.default_rng(1).integers(100, 900, int(Calcifications.sum()))
+    print(f"Volume {Volume.shape}, {Volume.nbytes / 1024 ** 2:.0f} MB, {Args.lesions} Synthetic Calcifications")
+    print(f"{'Mask':8} {'Time':>8} {'Peak RSS':>10} {'Above Load':>11} {'Masks':>10} {'Packed':>10}")
+    Results = {}
+    with tempfile.TemporaryDirectory() as Directory:
+        # Both Runs Load The Same Arrays, Nothing Generated in The Runs Adds To Their Peak
+        np.save(os.path.join(Directory, "volume.npy"), Volume)
+        np.save(os.path.join(Directory, "heart.npy"), HeartMask(Volume.shape))
+        del Volume, Calcifications
+        for Run in ("legacy", "compact"):
+            Command = [sys.executable, os.path.realpath(__file__), "--run", Run, "--directory", Directory,
+                       "--spacing", *[str(i) for i in Args.spacing]] + (["--no-crop"] if Args.no_crop else [])
+            Process = subprocess.run(Command, check=True, capture_output=True, text=True)
+            Result = Results[Run] = json.loads(Process.stdout.splitlines()[-1])
+            print(f"{Result['dtype']:8} {Result['time'] * 1000:6.0f}ms {Result['peak']:8.0f}MB "
+                  f"{Result['peak'] - Result['baseline']:9.0f}MB {Result['bytes'] / 1024 ** 2:8.1f}MB "
+                  f"{Result['packed'] / 1024:8.1f}KB")
+
+    Legacy, Compact = Results["legacy"], Results["compact"]
+    assert np.isclose(Legacy["score"], Compact["score"]) and np.isclose(Legacy["agatston"], Compact["agatston"])
+    Ratio = (Legacy["peak"] - Legacy["baseline"]) / max(Compact["peak"] - Compact["baseline"], 1)
+    print(f"Peak RSS Above Load {Ratio:.1f}x Lower, Scores Match")
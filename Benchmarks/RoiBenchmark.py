@@ -0,0 +1,45 @@
+#
+# RoiBenchmark.py
+# Thresholding & quantification time over the whole scan against the heart's box, for scans around the same heart
+#
+import argparse
+import os
+import sys
+
+import numpy as np
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models.Segmentation.CAC import ThresholdCAC, QuantifyCAC, BoundingBox
+from MaskBenchmark import HeartMask
+from WireBenchmark import Timed
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Whole Scan vs Heart Box Quantification Benchmark")
+    Parser.add_argument("--heart", type=int, nargs=3, default=[120, 512, 512], help="Shape The Heart is Made For")
+    Parser.add_argument("--slices", type=int, nargs="+", default=[120, 240, 480], help="Slices of Each Scan")
+    Parser.add_argument("--spacing", type=float, nargs=3, default=[0.7, 0.7, 3.0], help="Voxel Spacing x y z")
+    Parser.add_argument("--threshold", type=float, default=160)
+    Parser.add_argument("--runs", type=int, default=3)
+    Args = Parser.parse_args()
+
+    Rng = np.random.default_rng(0)
+    Heart = HeartMask(Args.heart)
+    print(f"{'Scan':>16} {'Heart Box':>16} {'Whole Scan':>11} {'Heart Box':>10} {'Speedup':>8}")
+    for Slices in Args.slices:
+        # The Same Heart in Longer Scans, Centred Along The Axial Axis
+        Shape = (Slices, *Args.heart[1:])
+        Scan = Rng.normal(40, 120, Shape).astype(np.int16)
+        Pred = np.zeros(Shape, dtype=np.uint8)
+        Start = (Slices - Args.heart[0]) // 2
+        Pred[Start:Start + Args.heart[0]] = Heart
+        ROI = [Bound for Axis in BoundingBox(Pred) for Bound in (int(Axis.start), int(Axis.stop) - 1)]
+
+        _, WholeTime = Timed(lambda: QuantifyCAC(ThresholdCAC(Scan, Args.threshold), Pred, Args.spacing), Args.runs)
+        _, BoxTime = Timed(lambda: QuantifyCAC(ThresholdCAC(Scan, Args.threshold, ROI), Pred, Args.spacing, ROI),
+                           Args.runs)
+        Box = tuple(ROI[2 * Axis + 1] - ROI[2 * Axis] + 1 for Axis in range(3))
+        print(f"{str(Shape):>16} {str(Box):>16} {WholeTime * 1000:9.0f}ms {BoxTime * 1000:8.0f}ms "
+              f"{WholeTime / BoxTime:7.1f}x")
@@ -0,0 +1,140 @@
+#
+# ServeBenchmark.py
+# Startup time, per-worker memory & aggregate throughput of the pre-fork launcher at several worker counts
+#
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models.Client import PostVolume
+from WireBenchmark import LoadVolume
+
+Launcher = RepoRoot + "/Remote-Communication-Module-3D-Slicer/flask-server/serve.py"
+
+
+def MemoryKB(Pid):
+    """
+    Resident & Proportional Set Sizes, Pages Shared With Other Workers Count Fully in RSS But Split in PSS
+    """
+    Values = {}
+    for Path, Field in [(f"/proc/{Pid}/status", "VmRSS:"), (f"/proc/{Pid}/smaps_rollup", "Pss:")]:
+        try:
+            with open(Path) as File:
+                Values[Field] = next(int(Line.split()[1]) for Line in File if Line.startswith(Field))
+        except (OSError, StopIteration):
+            Values[Field] = 0
+    return Values["VmRSS:"], Values["Pss:"]
+
+
+def Children(Pid):
+    with open(f"/proc/{Pid}/task/{Pid}/children") as File:
+        return [int(i) for i in File.read().split()]
+
+
+def WaitForWorkers(URL, Workers, Timeout):
+    """
+    Polls The Health Check Until Every Worker Has Answered
+    :return: Seconds Until The First & Until The Last Worker Answered
+    """
+    Start = time.time()
+    First = None
+    Seen = set()
+    while time.time() - Start < Timeout:
+        try:
+            Seen.add(requests.get(URL + "/healthz", timeout=5).json()["pid"])
+            First = First or time.time() - Start
+            if len(Seen) >= Workers:
+                return First, time.time() - Start
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    raise TimeoutError(f"{len(Seen)} of {Workers} Workers Answered in {Timeout} Seconds")
+
+
+def Load(URL, Route, Volume, Clients, Duration, Restart=None):
+    """
+    Posts The Volume From Concurrent Clients For The Duration
+    :param Restart: Called Half Way Through, e.g. To Restart The Workers
+    :return: Request Latencies & Number of Failed Requests
+    """
+    Latencies = []
+    Failures = []
+    Deadline = time.time() + Duration
+
+    def Client():
+        # Each Request Changes a Voxel, So Every Volume Misses The Result Cache
+        Own = Volume.copy()
+        while time.time() < Deadline:
+            Own.flat[0] = Own.flat[0] + 1 if Own.flat[0] < 3000 else -1024
+            Start = time.time()
+            try:
+                PostVolume(URL + Route, Own, "raw", "none")
+                Latencies.append(time.time() - Start)
+            except Exception as e:
+                Failures.append(e)
+
+    Threads = [threading.Thread(target=Client) for _ in range(Clients)]
+    for Thread in Threads:
+        Thread.start()
+    if Restart:
+        time.sleep(Duration / 2)
+        Restart()
+    for Thread in Threads:
+        Thread.join()
+    return Latencies, len(Failures)
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Pre-Fork Launcher Benchmark")
+    Parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    Parser.add_argument("--clients", type=int, help="Concurrent Clients, Defaults To Twice The Workers")
+    Parser.add_argument("--duration", type=float, default=30, help="Seconds of Load Per Worker Count")
+    Parser.add_argument("--route", default="/segment/volume")
+    Parser.add_argument("--shape", type=int, nargs=3, default=[128, 512, 512], help="Synthetic Volume Shape")
+    Parser.add_argument("--nifti", help="Use This NIfTI Volume Instead of a Synthetic One")
+    Parser.add_argument("--port", type=int, default=5099)
+    Parser.add_argument("--launcher", default=Launcher, help="Launcher Script")
+    Parser.add_argument("--no-preload", action="store_true", help="Each Worker Loads Its Own Models")
+    Parser.add_argument("--restart", action="store_true",
+                        help="Restart The Workers With SIGHUP Half Way Through, No Request Should Fail")
+    Args = Parser.parse_args()
+
+    Volume = LoadVolume(Args)
+    URL = f"http://127.0.0.1:{Args.port}"
+    print(f"Volume {Volume.shape}, {Args.route}")
+    print(f"{'Workers':>7} {'First':>7} {'All':>7} {'Launcher':>9} {'RSS/W':>8} {'PSS/W':>8} "
+          f"{'Req/s':>7} {'p50':>7} {'p95':>7} {'Failed':>6}")
+
+    for Workers in Args.workers:
+        Command = [sys.executable, Args.launcher, "--workers", str(Workers), "--port", str(Args.port)]
+        Server = subprocess.Popen(Command + (["--no-preload"] if Args.no_preload else []),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            First, All = WaitForWorkers(URL, Workers, Timeout=600)
+            # One Request Per Worker Before Measuring, So Lazily Created State Counts in The Memory
+            Load(URL, Args.route, Volume, Workers, 0.1)
+            Pids = Children(Server.pid)
+            Memory = [MemoryKB(Pid) for Pid in Pids]
+            LauncherRSS = MemoryKB(Server.pid)[0]
+
+            Restart = (lambda: Server.send_signal(signal.SIGHUP)) if Args.restart else None
+            Start = time.time()
+            Latencies, Failed = Load(URL, Args.route, Volume, Args.clients or 2 * Workers, Args.duration, Restart)
+            Elapsed = time.time() - Start
+        finally:
+            Server.send_signal(signal.SIGTERM)
+            Server.wait()
+
+        p50, p95 = np.percentile(Latencies, [50, 95]) if Latencies else (0.0, 0.0)
+        print(f"{Workers:>7} {First:6.1f}s {All:6.1f}s {LauncherRSS / 1024:7.0f}MB "
+              f"{np.mean([m[0] for m in Memory]) / 1024:6.0f}MB {np.mean([m[1] for m in Memory]) / 1024:6.0f}MB "
+              f"{len(Latencies) / Elapsed:7.2f} {p50:6.2f}s {p95:6.2f}s {Failed:>6}")
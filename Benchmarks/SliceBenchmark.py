@@ -0,0 +1,55 @@
+#
+# SliceBenchmark.py
+# Size, encode time & round trip latency of the sampled slice formats sent to /crop & /segment/slices
+#
+import argparse
+import os
+import sys
+
+import numpy as np
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models import Wire
+from Models.Client import SlicesRequest, SegmentSlices, CropCoordinates
+from Models.crop_roi import GetSampleSlices, SliceNames
+from WireBenchmark import LoadVolume, Timed
+
+
+def RequestSize(Arguments):
+    if "files" in Arguments:
+        return sum(len(File.getvalue()) for File in Arguments["files"].values())
+    return len(Arguments["data"])
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Sampled Slice Format Benchmark")
+    Parser.add_argument("--shape", type=int, nargs=3, default=[400, 512, 512], help="Synthetic Volume Shape")
+    Parser.add_argument("--nifti", help="Use This NIfTI Volume Instead of a Synthetic One")
+    Parser.add_argument("--url", help="Server URL, Also Measures The Round Trip Through The Route")
+    Parser.add_argument("--route", default="/crop", choices=["/crop", "/segment/slices"])
+    Parser.add_argument("--runs", type=int, default=5)
+    Args = Parser.parse_args()
+
+    Volume = LoadVolume(Args)
+    Slices, SampleTime = Timed(lambda: GetSampleSlices(Volume), Args.runs)
+    print(f"Volume {Volume.shape} {Volume.dtype}, Slices Sampled in {SampleTime * 1000:.1f}ms")
+
+    Formats = [("png", "none")] + [("bundle", Compression) for Compression in Wire.AvailableCompressions()]
+
+    print(f"{'Format':6} {'Codec':6} {'Size':>9} {'Encode':>9} {'Round Trip':>11}")
+    for Format, Compression in Formats:
+        Arguments, EncodeTime = Timed(lambda: SlicesRequest(Slices, Format, Compression), Args.runs)
+        if Format == "bundle":
+            Decoded = Wire.DecodeBundle(Arguments["data"])
+            assert all(np.array_equal(Decoded[Name], View) for Name, View in zip(SliceNames, Slices))
+
+        RoundTrip = ""
+        if Args.url:
+            Send = CropCoordinates if Args.route == "/crop" else SegmentSlices
+            _, RoundTripTime = Timed(lambda: Send(Args.url + Args.route, Slices, Format, Compression), Args.runs)
+            RoundTrip = f"{RoundTripTime * 1000:9.1f}ms"
+
+        print(f"{Format:6} {Compression:6} {RequestSize(Arguments) / 1024:7.0f}KB {EncodeTime * 1000:7.1f}ms "
+              f"{RoundTrip:>11}")
@@ -0,0 +1,107 @@
+#
+# WireBenchmark.py
+# Size, encode/decode time & upload latency of the volume transfer formats
+#
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+
+RepoRoot = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(RepoRoot)
+
+from Models import Wire
+
+
+def LoadVolume(Args):
+    """
+    Loads a NIfTI Volume if Given, Otherwise Creates a Synthetic int16 CT-Like Volume
+    """
+    if Args.nifti:
+        import nibabel as nib
+        return np.moveaxis(np.asanyarray(nib.load(Args.nifti).dataobj).astype(np.int16), -1, 0)
+
+    Rng = np.random.default_rng(0)
+    Volume = np.full(Args.shape, -1000, dtype=np.int16)
+    Z, Y, X = Args.shape
+    Body = (slice(None), slice(Y // 8, 7 * Y // 8), slice(X // 8, 7 * X // 8))
+    Volume[Body] = Rng.normal(40, 80, Volume[Body].shape).astype(np.int16)
+    return Volume
+
+
+def EncodeNpz(Volume):
+    Compressed = BytesIO()
+    np.savez_compressed(Compressed, Volume=Volume)
+    return Compressed.getvalue()
+
+
+def DecodeNpz(Data):
+    Loaded = np.load(BytesIO(Data))
+    Volume = Loaded["Volume"]
+    Loaded.close()
+    return Volume
+
+
+def Post(URL, Format, Body, Route="/wire"):
+    import requests
+
+    if Format == "npz":
+        return requests.post(URL + Route, files={"Volume": BytesIO(Body)})
+    if Format == "stream":
+        # Body is a Generator Here, Slabs Are Encoded While Earlier Ones Are Sent
+        return requests.post(URL + Route, data=Body, headers={"Content-Type": Wire.StreamContentType})
+    return requests.post(URL + Route, data=Body, headers={"Content-Type": Wire.ContentType})
+
+
+def Timed(Function, Runs):
+    Times = []
+    for _ in range(Runs):
+        Start = time.time()
+        Result = Function()
+        Times.append(time.time() - Start)
+    return Result, float(np.median(Times))
+
+
+if __name__ == '__main__':
+    Parser = argparse.ArgumentParser(description="Volume Transfer Format Benchmark")
+    Parser.add_argument("--shape", type=int, nargs=3, default=[400, 512, 512], help="Synthetic Volume Shape")
+    Parser.add_argument("--nifti", help="Use This NIfTI Volume Instead of a Synthetic One")
+    Parser.add_argument("--url", help="Server URL, Also Measures Upload Latency Through POST /wire")
+    Parser.add_argument("--route", default="/wire",
+                        help="Route Measured With --url, e.g. /segment/volume To Include The Server's Processing")
+    Parser.add_argument("--runs", type=int, default=3)
+    Args = Parser.parse_args()
+
+    Volume = LoadVolume(Args)
+    print(f"Volume {Volume.shape} {Volume.dtype}, {Volume.nbytes / 1024 ** 2:.1f} MB")
+
+    Formats = [("npz", "zlib", EncodeNpz, DecodeNpz)]
+    for Compression in Wire.AvailableCompressions():
+        Formats.append(("raw", Compression, lambda V, C=Compression: Wire.EncodeArray(V, C),
+                        lambda D: Wire.DecodeArray(D)[0]))
+    for Compression in Wire.AvailableCompressions():
+        Formats.append(("stream", Compression, lambda V, C=Compression: b"".join(Wire.EncodeStream(V, C)),
+                        lambda D: Wire.DecodeStream(BytesIO(D))[0]))
+
+    print(f"{'Format':6} {'Codec':6} {'Size':>10} {'Ratio':>6} {'Encode':>9} {'Decode':>9} {'Upload':>9}")
+    for Format, Compression, Encode, Decode in Formats:
+        Body, EncodeTime = Timed(lambda: Encode(Volume), Args.runs)
+        Decoded, DecodeTime = Timed(lambda: Decode(Body), Args.runs)
+        assert np.array_equal(Decoded, Volume)
+
+        Upload = ""
+        if Args.url and Format == "stream":
+            # Encoding, Transfer & Decoding Overlap, So The Request Alone is End To End
+            _, UploadTime = Timed(lambda: Post(Args.url, Format, Wire.EncodeStream(Volume, Compression),
+                                               Args.route).raise_for_status(), Args.runs)
+            Upload = f"{UploadTime * 1000:7.0f}ms"
+        elif Args.url:
+            _, UploadTime = Timed(lambda: Post(Args.url, Format, Body, Args.route).raise_for_status(), Args.runs)
+            # End To End: Encoding on The Client, Transfer & Decoding on The Server
+            Upload = f"{(EncodeTime + UploadTime) * 1000:7.0f}ms"
+
+        print(f"{Format:6} {Compression:6} {len(Body) / 1024 ** 2:8.1f}MB {Volume.nbytes / len(Body):6.2f} "
+              f"{EncodeTime * 1000:7.0f}ms {DecodeTime * 1000:7.0f}ms {Upload:>9}")
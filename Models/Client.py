@@ -0,0 +1,240 @@
+# Import Required Packages
+import base64
+import time
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+
+from Models.Wire import EncodeArray, EncodeStream, EncodeBundle, DecodeBundle, DecodeMask, ReadArrayResponse, \
+    ArrayDigest, ContentType, StreamContentType, BundleContentType, MaskContentType, AcceptCompressionHeader, \
+    MaskEncodingHeader, VolumeDigestHeader
+from Models.crop_roi import SliceNames
+from Models.Segmentation.CAC import TableFromColumns
+
+
+def VolumeRequest(VolumeArray, WireFormat="npz", Compression="none", Digest=None, MaskEncoding=None):
+    """
+    Builds The Request Arguments Sending a Volume To The Server
+    :param VolumeArray: NumPy Array of The Volume
+    :param WireFormat: "raw" Sends The Volume as a Raw Array, "stream" as Chunks of Axial Slabs The Server
+                       Processes While The Rest Arrive, "npz" as a Compressed npz File
+    :param Compression: Compression Used With The Raw & Stream Formats, "none", "lz4" or "zstd"
+    :param Digest: Digest of The Volume in The Server's Volume Store, Sent Instead of The Volume
+    :param MaskEncoding: Asks For The Resulting Mask as Its Bounding Box & a "packbits" or "rle" Payload
+    :return: Keyword Arguments For requests.post
+    """
+    Headers = ResultHeaders(WireFormat, Compression, MaskEncoding)
+    if Digest:
+        Headers[VolumeDigestHeader] = Digest
+        return {"headers": Headers}
+    if WireFormat == "stream":
+        # A Generator Body is Sent With Chunked Transfer Encoding, One Slab at a Time
+        Headers["Content-Type"] = StreamContentType
+        return {"data": EncodeStream(VolumeArray, Compression), "headers": Headers}
+    if WireFormat == "raw":
+        # Send The Raw Array, Compressed With a Fast Codec if The Server Supports One
+        Headers["Content-Type"] = ContentType
+        return {"data": EncodeArray(VolumeArray, Compression), "headers": Headers}
+    CompressedVolume = BytesIO()
+    np.savez_compressed(CompressedVolume, Volume=VolumeArray)
+    CompressedVolume.seek(0)
+    return {"files": {"Volume": CompressedVolume}, "headers": Headers}
+
+
+def ResultHeaders(WireFormat="npz", Compression="none", MaskEncoding=None):
+    """
+    Headers Asking The Server For a Compact Mask When a Mask Encoding is Given, & For a Raw Array Result When
+    The Raw or Stream Formats Are Used
+    """
+    Headers = {}
+    Accept = []
+    if MaskEncoding:
+        Accept.append(MaskContentType)
+        Headers[MaskEncodingHeader] = MaskEncoding
+    if WireFormat in ("raw", "stream"):
+        Accept.append(ContentType)
+    if Accept:
+        Headers["Accept"] = ", ".join(Accept)
+        Headers[AcceptCompressionHeader] = Compression
+    return Headers
+
+
+def StoreVolume(ServerURL, VolumeArray, WireFormat="npz", Compression="none"):
+    """
+    Makes Sure The Server's Volume Store Holds The Volume, it's Only Uploaded if The Server Doesn't Have it
+    :param ServerURL: URL of The Server
+    :return: The Volume's Digest, Sent To Processing Routes Instead of The Volume
+    """
+    Digest = ArrayDigest(VolumeArray)
+    if requests.head(ServerURL + "/volumes/" + Digest).status_code != 200:
+        Response = requests.post(ServerURL + "/volumes", **VolumeRequest(VolumeArray, WireFormat, Compression))
+        Response.raise_for_status()
+    return Digest
+
+
+# Times a Volume Refused With 429 by The Server's Admission Control is Sent Again, After The Advised Delay
+Retries = 3
+
+
+def _Post(URL, VolumeArray, WireFormat, Compression, Digest, MaskEncoding, **Arguments):
+    for Attempt in range(Retries + 1):
+        Response = requests.post(URL, **VolumeRequest(VolumeArray, WireFormat, Compression, Digest, MaskEncoding),
+                                 **Arguments)
+        if Digest and Response.status_code == 404:
+            # The Stored Volume Expired Since it Was Checked, Send The Volume Itself
+            Digest = None
+            Response = requests.post(URL, **VolumeRequest(VolumeArray, WireFormat, Compression, None, MaskEncoding),
+                                     **Arguments)
+        if Response.status_code != 429 or Attempt == Retries:
+            break
+        time.sleep(float(Response.headers.get("Retry-After", "5")))
+    Response.raise_for_status()
+    return Response
+
+
+def PostVolume(URL, VolumeArray, WireFormat="npz", Compression="none", Key="Segmentation", Digest=None,
+               MaskEncoding=None):
+    """
+    Sends a Volume To a Processing Route & Waits For The Resulting Array in The Same Request
+    :param URL: Full URL of The Route
+    :param Digest: Digest Returned by StoreVolume, Sent Instead of The Volume
+    :param MaskEncoding: "packbits" or "rle" Receives The Mask as Its Bounding Box & Encoded Voxels
+    :return: NumPy Array Returned by The Server
+    """
+    Response = _Post(URL, VolumeArray, WireFormat, Compression, Digest, MaskEncoding)
+    return ReadArrayResponse(Response.content, Response.headers.get("Content-Type"), Key)
+
+
+def RunJob(ServerURL, Task, VolumeArray, WireFormat="npz", Compression="none", PollInterval=1.0, Timeout=None,
+           ProgressCallback=None, Key="Segmentation", Digest=None, MaskEncoding=None):
+    """
+    Submits a Volume as an Asynchronous Job & Polls it Till it's Done, So No Connection is Held Open
+    While The Server Runs The Inference
+    :param ServerURL: URL of The Server
+    :param Task: Job Type, "heart" or "calcifications"
+    :param PollInterval: Seconds Between Status Requests
+    :param Timeout: Seconds To Wait For The Job Before Giving Up, None Waits Forever
+    :param ProgressCallback: Called With The Job's Progress (0 To 1) & Current Stage
+    :param Digest: Digest Returned by StoreVolume, Sent Instead of The Volume
+    :param MaskEncoding: "packbits" or "rle" Receives The Mask as Its Bounding Box & Encoded Voxels
+    :return: NumPy Array Returned by The Server
+    """
+    Response = _Post(ServerURL + "/jobs", VolumeArray, WireFormat, Compression, Digest, MaskEncoding,
+                     params={"task": Task})
+    Job = Response.json()
+
+    Start = time.time()
+    while Job["status"] not in ("done", "failed"):
+        if Timeout is not None and time.time() - Start > Timeout:
+            raise TimeoutError(f"Job {Job['id']} Didn't Finish in {Timeout} Seconds")
+        time.sleep(PollInterval)
+        Response = requests.get(ServerURL + "/jobs/" + Job["id"])
+        Response.raise_for_status()
+        Job = Response.json()
+        if ProgressCallback:
+            ProgressCallback(Job["progress"], Job["stage"])
+
+    if Job["status"] == "failed":
+        raise RuntimeError(f"Job {Job['id']} Failed: {Job['error']}")
+
+    Response = requests.get(ServerURL + "/jobs/" + Job["id"] + "/result",
+                            headers=ResultHeaders(WireFormat, Compression, MaskEncoding))
+    Response.raise_for_status()
+    return ReadArrayResponse(Response.content, Response.headers.get("Content-Type"), Key)
+
+
+def ScoreVolume(ServerURL, VolumeArray, Spacing, WireFormat="npz", Compression="none", Method="deep", Crop=True,
+                Masks=(), MaskEncoding="rle", Threshold=160, Digest=None, Table=False):
+    """
+    Scores a Volume on The Server's /cascore Route, Which Runs Heart Segmentation, Cropping, Calcification
+    Detection & Quantification Without The Volume or Masks Crossing The Network in Between
+    :param ServerURL: URL of The Server
+    :param Spacing: Voxel Spacing
+    :param Method: "deep" Finds Calcifications With The Model, "threshold" by Thresholding at Threshold HU
+    :param Crop: Crop The Volume To The Heart Before Finding Calcifications
+    :param Masks: Masks To Return, "heart" & "calcifications", in The Cropped Volume's Frame When Cropping
+    :param MaskEncoding: "packbits" or "rle", How The Masks Are Encoded
+    :param Digest: Digest Returned by StoreVolume, Sent Instead of The Volume
+    :param Table: Also Return The Lesion Table
+    :return: The Server's Result, The Calcifications Volume in mm³ is "score", The Agatston, Volume & Mass Scores
+             Are "scores", Masks Are Decoded To uint8 Arrays & The Lesion Table To a Structured Array
+    """
+    Arguments = {"spacing": ",".join(str(float(i)) for i in Spacing), "method": Method, "crop": int(Crop),
+                 "threshold": Threshold, "masks": ",".join(Masks), "table": int(Table)}
+    Response = _Post(ServerURL + "/cascore", VolumeArray, WireFormat, Compression, Digest, MaskEncoding,
+                     params=Arguments)
+    Result = Response.json()
+    Result["masks"] = {Name: DecodeMask(base64.b64decode(Data))[0] for Name, Data in Result["masks"].items()}
+    if Result.get("table"):
+        Result["table"] = TableFromColumns(Result["table"])
+    return Result
+
+
+def EncodeSlicesPNG(Slices):
+    """
+    Legacy Slice Format, Each Slice is Shifted To Non-Negative Values, as Negative Values Are Lost in PNG
+    Conversion, & Saved as a PNG
+    :param Slices: Axial, Sagittal & Coronal Stacks of 3 Slices, From crop_roi.GetSampleSlices
+    :return: PNG Files & The Shift Values Needed To Restore The Slices, Sent as The Request's Files & Form
+    """
+    Files = {}
+    ShiftValues = {}
+    for Name, View in zip(SliceNames, Slices):
+        for i, Slice in enumerate(View):
+            SliceName = f"{Name}{i + 1}"
+            Shift = min(int(Slice.min()), 0)
+            ShiftValues[SliceName] = Shift
+
+            SliceBytes = BytesIO()
+            Image.fromarray(Slice - Shift).save(SliceBytes, format="PNG")
+            SliceBytes.seek(0, 0)
+            Files[SliceName] = SliceBytes
+    return Files, ShiftValues
+
+
+def SlicesRequest(Slices, SliceFormat="png", Compression="none"):
+    """
+    Builds The Request Arguments Sending The Sampled Slices To The Server
+    :param Slices: Axial, Sagittal & Coronal Stacks of 3 Slices, From crop_roi.GetSampleSlices
+    :param SliceFormat: "bundle" Sends All Slices as One Body of int16 Arrays, "png" as 9 PNG Files
+    :param Compression: Compression Used With The Bundle Format, Also Requested For The Response
+    :return: Keyword Arguments For requests.post
+    """
+    if SliceFormat == "bundle":
+        return {"data": EncodeBundle(dict(zip(SliceNames, Slices)), Compression),
+                "headers": {"Content-Type": BundleContentType, "Accept": BundleContentType,
+                            AcceptCompressionHeader: Compression}}
+    Files, ShiftValues = EncodeSlicesPNG(Slices)
+    return {"files": Files, "data": ShiftValues}
+
+
+def SegmentSlices(URL, Slices, SliceFormat="png", Compression="none"):
+    """
+    Sends The Sampled Slices To a Partial Segmentation Route
+    :param URL: Full URL of The Route
+    :return: Axial, Sagittal & Coronal Masks, Each a Stack of 3 Slices
+    """
+    Response = requests.post(URL, **SlicesRequest(Slices, SliceFormat, Compression))
+    Response.raise_for_status()
+    if (Response.headers.get("Content-Type") or "").startswith(BundleContentType):
+        Masks = DecodeBundle(Response.content)
+        return [Masks[Name] for Name in SliceNames]
+
+    # The npz Response Names The Sagittal Masks "Cor" & The Coronal Masks "Sag"
+    Data = np.load(BytesIO(Response.content))
+    Masks = [np.copy(Data["Ax"]), np.copy(Data["Cor"]), np.copy(Data["Sag"])]
+    Data.close()
+    return Masks
+
+
+def CropCoordinates(URL, Slices, SliceFormat="png", Compression="none"):
+    """
+    Sends The Sampled Slices To The Cropping Route
+    :param URL: Full URL of The Route
+    :return: Bounding Box of The Heart [z1, z2, x1, x2, y1, y2]
+    """
+    Response = requests.post(URL, **SlicesRequest(Slices, SliceFormat, Compression))
+    Response.raise_for_status()
+    return Response.json()["Coor"]
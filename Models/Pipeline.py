@@ -0,0 +1,81 @@
+# Import Required Packages
+import time
+
+import numpy as np
+
+from Models.crop_roi import GetCoords
+from Models.Segmentation.CAC import ThresholdCAC, QuantifyCAC, AgatstonScore, LesionTable, AsMask, RegionSlices
+
+
+def AddMargin(Shape, ROICoordinates, Margin):
+    """
+    Widens The Cropping Coordinates by a Margin, Kept Inside The Volume
+    :param Shape: Shape of The Volume
+    :param ROICoordinates: [z1, z2, x1, x2, y1, y2], Both Ends Included
+    :param Margin: Voxels Added on Each Side
+    :return: Coordinates With The Margin
+    """
+    Coordinates = []
+    for Axis, Size in enumerate(Shape):
+        Coordinates.append(max(ROICoordinates[2 * Axis] - Margin, 0))
+        Coordinates.append(min(ROICoordinates[2 * Axis + 1] + Margin, Size - 1))
+    return Coordinates
+
+
+def CaScore(VolumeArray, Spacing, SegmentHeart, SegmentCalcifications=None, Crop=True, Margin=0, Threshold=160):
+    """
+    Runs The Whole Scoring Chain on a Volume, The Same Steps The Slicer Module Runs One by One: Heart Segmentation,
+    Cropping To The Heart, Deep or Threshold Calcification Detection & Quantification Inside The Heart. When Cropping,
+    Calcifications Are Found & Counted Only in The Heart's Box, Through Views of The Volume
+    :param VolumeArray: Volume of Shape (Z, X, Y)
+    :param Spacing: Voxel Spacing
+    :param SegmentHeart: Function Returning The Heart Mask of a Volume
+    :param SegmentCalcifications: Function Returning The Calcifications Mask of The Cropped Volume,
+                                  None Finds Them by Thresholding
+    :param Crop: Crop The Volume To The Heart Before Finding Calcifications
+    :param Margin: Voxels Added Around The Heart When Cropping
+    :param Threshold: HU Threshold Used When No Calcification Model is Given
+    :return: Dictionary of The Calcifications Volume in mm³ ("score"), Number of Calcified Voxels, The Agatston,
+             Volume & Mass Scores ("scores"), The Lesion Table ("table"), Crop Coordinates (None When Not Cropped), The
+             Heart & Calcifications uint8 Masks & The Table in The Cropped Volume's Frame & The Time Taken by Each Stage
+    """
+    Timings = {}
+
+    Start = time.time()
+    Heart = AsMask(SegmentHeart(VolumeArray))
+    Timings["heart"] = time.time() - Start
+
+    # A Volume Without a Detected Heart is Scored Whole
+    Start = time.time()
+    Coordinates = None
+    Volume = VolumeArray
+    if Crop and np.any(Heart):
+        Coordinates = AddMargin(VolumeArray.shape, GetCoords(Heart, Partial=False), Margin)
+        Region = RegionSlices(Coordinates)
+        Volume = VolumeArray[Region]
+        Heart = Heart[Region]
+    Timings["crop"] = time.time() - Start
+
+    Start = time.time()
+    if SegmentCalcifications is not None:
+        Calcifications = AsMask(SegmentCalcifications(Volume))
+    else:
+        Calcifications = ThresholdCAC(VolumeArray, Threshold, Coordinates)
+    Timings["calcifications"] = time.time() - Start
+
+    Start = time.time()
+    CalcificationsMasked, CalVolume = QuantifyCAC(Calcifications, Heart, Spacing, Coordinates)
+    Scores = AgatstonScore(Volume, CalcificationsMasked, Spacing)
+    Table = LesionTable(Volume, CalcificationsMasked, Spacing)
+    Timings["quantification"] = time.time() - Start
+
+    return {
+        "score": float(CalVolume),
+        "voxels": int(np.count_nonzero(CalcificationsMasked)),
+        "scores": Scores,
+        "table": Table,
+        "coordinates": Coordinates,
+        "heart": Heart,
+        "calcifications": CalcificationsMasked,
+        "timings": Timings
+    }
@@ -0,0 +1,220 @@
+#
+# Backends.py
+# Runtimes able to execute the segmentation models, used by Infer
+#
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+
+# Thread Counts Set by configure_cpu
+cpu_settings = {}
+
+
+def parse_cpu_list(cpus: str) -> set:
+    """
+        Parse a Linux Style CPU List, e.g. "0-3,8"
+    """
+    cores = set()
+    for part in cpus.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cores.update(range(int(first), int(last) + 1))
+        elif part.strip():
+            cores.add(int(part))
+    return cores
+
+
+def configure_cpu(intra_op_threads: int = None, inter_op_threads: int = None, onednn: bool = None,
+                  cpu_affinity=None):
+    """
+        Process Wide CPU Settings for Inference, Must be Called before Tensor Flow Runs anything, Several
+        Workers on one Machine should each get a Disjoint Set of Cores and Matching Thread Counts
+    :param intra_op_threads: Threads Used inside a Single Operation (e.g. a Convolution)
+    :param inter_op_threads: Operations Allowed to Run in Parallel
+    :param onednn: Enable or Disable Tensor Flow's oneDNN Optimizations, Only Applied before Tensor Flow
+                   is Imported
+    :param cpu_affinity: Cores this Process is Pinned to, a Set of Core Ids or a CPU List String like "0-3,8"
+    """
+    if cpu_affinity:
+        cores = parse_cpu_list(cpu_affinity) if isinstance(cpu_affinity, str) else set(cpu_affinity)
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        else:
+            logging.warning("CPU Affinity is not Supported on this Platform")
+
+    if onednn is not None:
+        if "tensorflow" in sys.modules:
+            logging.warning("Tensor Flow is Already Imported, the oneDNN Setting is Ignored")
+        os.environ["TF_ENABLE_ONEDNN_OPTS"] = "1" if onednn else "0"
+
+    if intra_op_threads:
+        # oneDNN and other OpenMP Based Kernels Use their own Pool
+        os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+
+    # Thread Counts are Applied by each Backend when it's Loaded
+    if intra_op_threads:
+        cpu_settings["intra_op_threads"] = intra_op_threads
+    if inter_op_threads:
+        cpu_settings["inter_op_threads"] = inter_op_threads
+
+
+class TFBackend:
+    def __init__(self, model_path: str, model_input: tuple, compiled: bool = True, xla: bool = False):
+        """
+        Runs a Tensor Flow SavedModel
+
+        :param model_path: Tensor Flow's SavedModel Format Directory path
+        :param model_input: The Saved Model's Input Shape
+        :param compiled: Run the Model through a tf.function with a Fixed Input Signature instead of Eagerly
+        :param xla: JIT Compile the tf.function with XLA
+        """
+        import tensorflow as tf
+
+        try:
+            if "intra_op_threads" in cpu_settings:
+                tf.config.threading.set_intra_op_parallelism_threads(cpu_settings["intra_op_threads"])
+            if "inter_op_threads" in cpu_settings:
+                tf.config.threading.set_inter_op_parallelism_threads(cpu_settings["inter_op_threads"])
+        except RuntimeError as e:
+            # Thread Pools can't Change once the Runtime is Initialized, e.g. by a Previously Loaded Model
+            logging.warning(f"Tensor Flow Thread Settings Ignored: {e}")
+
+        # Define GPU Usage by the Server
+        gpus = tf.config.list_physical_devices('GPU')
+        if gpus:
+            try:
+                # Currently, memory growth needs to be the same across GPUs
+                for gpu in gpus:
+                    tf.config.experimental.set_memory_growth(gpu, True)
+                logical_gpus = tf.config.experimental.list_logical_devices('GPU')
+                print(len(gpus), "Physical GPUs,", len(logical_gpus), "Logical GPUs")
+            except RuntimeError as e:
+                # Memory growth must be set before GPUs have been initialized
+                print(e)
+
+        self.model = tf.keras.models.load_model(model_path)
+
+        # A Single Graph Serves every Batch Size, Only the Batch Axis is Left Unknown so Changing
+        # Volume Shapes Never Trigger Retracing, Inputs are Resized to the Model's Shape Anyway
+        self.input_signature = [tf.TensorSpec(shape=(None, *model_input, 1), dtype=tf.float32)]
+        if compiled:
+            self.forward = tf.function(lambda x: self.model(x, training=False),
+                                       input_signature=self.input_signature, jit_compile=xla)
+            self.forward.get_concrete_function()
+        else:
+            self.forward = self.model
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.forward(batch))
+
+    @property
+    def size(self) -> int:
+        return int(sum(np.prod(v.shape) * v.dtype.size for v in self.model.variables))
+
+
+class ONNXBackend:
+    def __init__(self, model_path: str, model_input: tuple, threads: int = None):
+        """
+        Runs an ONNX Graph Exported by Export.py using ONNX Runtime on the CPU
+
+        :param model_path: Path of the .onnx File
+        :param model_input: The Model's Input Shape
+        :param threads: Intra-Op Threads Used by ONNX Runtime, Defaults to configure_cpu's Setting
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The ONNX Backend Requires onnxruntime, Install it using pip install onnxruntime")
+
+        options = ort.SessionOptions()
+        threads = threads or cpu_settings.get("intra_op_threads")
+        if threads:
+            options.intra_op_num_threads = threads
+        if "inter_op_threads" in cpu_settings:
+            options.inter_op_num_threads = cpu_settings["inter_op_threads"]
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = model_path
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        # Sessions are Safe to Run from Multiple Threads
+        return self.session.run(None, {self.input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+
+class TFLiteBackend:
+    def __init__(self, model_path: str, model_input: tuple, threads: int = None):
+        """
+        Runs a TFLite Flat Buffer Exported by Export.py, the tflite_runtime Package is Used when Installed
+        so Tensor Flow isn't Required
+
+        :param model_path: Path of the .tflite File
+        :param model_input: The Model's Input Shape
+        :param threads: Threads Used by the Interpreter, Defaults to configure_cpu's Setting
+        """
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=model_path,
+                                       num_threads=threads or cpu_settings.get("intra_op_threads"))
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.path = model_path
+
+        # The Interpreter holds its Tensors Internally, so it Can't Run Concurrently
+        self.lock = threading.Lock()
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.asarray(batch, dtype=np.float32)
+        res = []
+        with self.lock:
+            # The Graph is Exported with a Batch of One
+            for i in range(batch.shape[0]):
+                self.interpreter.set_tensor(self.input_index, batch[i:i + 1])
+                self.interpreter.invoke()
+                res.append(np.copy(self.interpreter.get_tensor(self.output_index)))
+        return np.concatenate(res, axis=0)
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+
+Backends = {
+    "tf": TFBackend,
+    "onnx": ONNXBackend,
+    "tflite": TFLiteBackend
+}
+
+
+def backend_from_path(model_path: str) -> str:
+    """
+        Guess the Backend from the Model's Path, SavedModels are Directories
+    """
+    extension = os.path.splitext(model_path.rstrip("/"))[1].lower()
+    return {".onnx": "onnx", ".tflite": "tflite"}.get(extension, "tf")
+
+
+def load_backend(model_path: str, model_input: tuple, backend: str = None, **options):
+    """
+        Load the Model using the Given Backend
+    :param model_path: Model Path, a SavedModel Directory or an Exported .onnx/.tflite File
+    :param model_input: The Model's Input Shape
+    :param backend: "tf", "onnx" or "tflite", Guessed from the Path when not Given
+    :param options: Backend Specific Options
+    :return: Callable Taking a (Batch, *model_input, 1) float32 Array
+    """
+    backend = backend or backend_from_path(model_path)
+    if backend not in Backends:
+        raise ValueError(f"Unknown Inference Backend {backend}")
+    return Backends[backend](model_path, model_input, **options)
@@ -0,0 +1,131 @@
+#
+# Batching.py
+# Groups concurrent prediction requests into a single forward pass
+#
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchScheduler:
+    def __init__(self, get_model, max_batch_size: int = 4, max_wait: float = 0.02):
+        """
+        Collects Requests Targeting the Same Model and Runs them Together, a Batch is Sent once it
+        Reaches the Maximum Size or once the First Request in it has Waited for the Time Window
+
+        :param get_model: Callable Returning the Infer Instance to Use, Called once per Batch
+        :param max_batch_size: Maximum Number of Volumes Stacked in a Single Forward Pass
+        :param max_wait: Time Window in Seconds to Wait for more Requests after the First one Arrives
+        """
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batch_sizes = {}
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_queue_wait = 0.0
+
+        self.worker = threading.Thread(target=self.__run, daemon=True)
+        self.worker.start()
+
+    def submit(self, data: np.ndarray, timings: dict = None) -> Future:
+        """
+            Queue a Volume for Prediction
+        :param data: Input Volume
+        :param timings: Dictionary Filled with the Seconds Spent Waiting in the Queue ("queue") and the Stages
+                        of the Batch the Volume was Predicted in, see Infer.predict
+        :return: Future Holding the Prediction
+        """
+        future = Future()
+        self.queue.put((data, future, time.time(), timings))
+        return future
+
+    def predict(self, data: np.ndarray, timings: dict = None) -> np.ndarray:
+        """
+            Queue a Volume and Block Until its Batch is Processed
+        """
+        return self.submit(data, timings).result()
+
+    def report(self) -> dict:
+        """
+            Batch Size Distribution and Time Spent by Requests in the Queue
+        """
+        with self.lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "requests": self.requests,
+                "batches": batches,
+                "batch_sizes": dict(self.batch_sizes),
+                "mean_batch_size": self.requests / batches if batches else 0.0,
+                "mean_queue_wait": self.total_wait / self.requests if self.requests else 0.0,
+                "max_queue_wait": self.max_queue_wait,
+                "queued": self.queue.qsize()
+            }
+
+    def __collect(self) -> list:
+        # Block for the First Request, then Gather more Until the Window Closes or the Batch is Full
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def __run(self):
+        while True:
+            batch = self.__collect()
+            start = time.time()
+
+            with self.lock:
+                size = len(batch)
+                self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+                self.requests += size
+                for _, _, queued, _ in batch:
+                    self.total_wait += start - queued
+                    self.max_queue_wait = max(self.max_queue_wait, start - queued)
+
+            stages = {}
+            model = None
+            try:
+                model = self.get_model()
+                predictions = model.predict_batch([data for data, _, _, _ in batch], stages)
+            except Exception as e:
+                logging.exception("Batched Prediction Failed")
+                if model is None or len(batch) == 1:
+                    for _, future, _, _ in batch:
+                        future.set_exception(e)
+                else:
+                    self.__retry(model, batch, start)
+                continue
+
+            # Every Request of the Batch Shares its Stages
+            for (_, future, queued, timings), prediction in zip(batch, predictions):
+                if timings is not None:
+                    timings.update(stages, queue=start - queued)
+                future.set_result(prediction)
+
+    @staticmethod
+    def __retry(model, batch: list, start: float):
+        # A Single Bad Volume Fails the Whole Forward Pass, so each Request is Predicted on its own and only
+        # the Ones that Fail Again are Failed
+        for data, future, queued, timings in batch:
+            try:
+                prediction = model.predict(data, timings)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            if timings is not None:
+                timings["queue"] = start - queued
+            future.set_result(prediction)
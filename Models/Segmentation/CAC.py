@@ -5,26 +5,380 @@
 #
 import numpy as np
 
+# scipy & skimage Are Imported Where Lesions Are Labelled, so The Slicer Module Loads Before its Dependency
+# Check Installs Them
+# Agatston Density Weights, 1 From The Scoring Threshold, Then 2, 3 & 4 From These Peak HU Values
+DENSITY_STEPS = (200, 300, 400)
+# Agatston Scores Are Defined on 3 mm Slices, Thinner Slices Are Scaled Down
+REFERENCE_THICKNESS = 3.0
+# Axial Slices Are Labelled Independently, Lesions Are 8-Connected in-Plane & Never Across Slices
+IN_PLANE = np.zeros((3, 3, 3), dtype=bool)
+IN_PLANE[1] = True
+# Columns of The Lesion Table, The Box is [z1, z2, x1, x2, y1, y2] With Both Ends Included & The Centroid in Voxels
+LESION_DTYPE = np.dtype([("id", np.int32), ("voxels", np.int64), ("volume", np.float64), ("box", np.int32, (6,)),
+                         ("centroid", np.float64, (3,)), ("max_hu", np.float64), ("mean_hu", np.float64),
+                         ("weight", np.int8)])
 
-def ThresholdCAC(scan: np.ndarray, threshold: float = 130) -> np.ndarray:
-    src = np.copy(scan)
-    src[src < threshold] = 0
-    src[src >= threshold] = 1
-    return src
 
+def AsMask(mask: np.ndarray) -> np.ndarray:
+    """
+    The Pipeline's Mask Type, uint8 of 0 & 1 at 1 Byte Per Voxel, bool Masks Are Viewed Without a Copy & uint8
+    Masks Are Taken as They Are
+    """
+    if mask.dtype == np.bool_:
+        return mask.view(np.uint8)
+    if mask.dtype == np.uint8:
+        return mask
+    return (mask != 0).view(np.uint8)
 
-def QuantifyCAC(scan_threshold: np.ndarray, pred: np.ndarray, voxel_spacing: list):
-    masked_out_pred = scan_threshold * pred
-    shape = scan_threshold.shape
+
+def RegionSlices(roi) -> tuple:
+    """
+    Slices of a Region of Interest Given as [z1, z2, x1, x2, y1, y2] With Both Ends Included, as From GetCoords
+    """
+    return tuple(slice(int(roi[2 * axis]), int(roi[2 * axis + 1]) + 1) for axis in range(3))
+
+
+def RegionShape(roi) -> tuple:
+    return tuple(int(roi[2 * axis + 1]) - int(roi[2 * axis]) + 1 for axis in range(3))
+
+
+def ThresholdCAC(scan: np.ndarray, threshold: float = 130, roi=None) -> np.ndarray:
+    """
+    Candidate Calcifications, Voxels at or Above The Threshold
+    :param roi: Only This Region, e.g. The Heart's Bounding Box, is Thresholded Through a View of The Scan & The
+                Mask Has The Region's Shape
+    """
+    if roi is not None:
+        scan = scan[RegionSlices(roi)]
+    return AsMask(scan >= threshold)
+
+
+def ScoringRegion(pred: np.ndarray) -> np.ndarray:
+    """
+    Voxels Where Thresholded Calcifications Are Counted: The Heart Mask & a Central Box Leaving Out The First 5 &
+    Last 4 Slices & 16.5% of Each Side Along x
+    """
+    shape = pred.shape
     # Cropped = np.copy(scan_threshold)
     # Cropped[0:4, 0:40, :] = 0
     # Cropped[shape[0] - 4:shape[0], shape[1]-40:shape[1], :] = 0
     xmin = int(shape[1]*0.165)
     xmax = shape[1] - xmin
-    masked_out = np.zeros(shape)
-    masked_out[5:shape[0] - 4, xmin:xmax, :] = scan_threshold[5:shape[0] - 4, xmin:xmax, :]
-    FinalPred = masked_out + masked_out_pred
-    FinalPred[FinalPred > 0] = 1
-    candidate_voxels = np.count_nonzero(FinalPred)
+    region = pred > 0
+    region[5:shape[0] - 4, xmin:xmax, :] = True
+    return region
+
+
+def CandidateVolume(candidate_voxels: int, voxel_spacing: list) -> float:
     voxel_vol = (voxel_spacing[0] * voxel_spacing[1] * voxel_spacing[2]) / 3
-    return FinalPred, candidate_voxels * voxel_vol
+    return candidate_voxels * voxel_vol
+
+
+def QuantifyCAC(scan_threshold: np.ndarray, pred: np.ndarray, voxel_spacing: list, roi=None):
+    """
+    Calcifications & Their Volume: The Candidates Inside The Heart or The Central Box of ScoringRegion
+    :param scan_threshold: Candidates Mask, e.g. From ThresholdCAC, Nonzero Voxels of Any Mask Type Are Candidates
+    :param pred: Heart Mask of The Same Shape, or of The ROI's Shape When an ROI is Given
+    :param roi: [z1, z2, x1, x2, y1, y2] of The Heart's Bounding Box, Which Takes The Place of The Central Box:
+                Only The Candidates Inside The Heart Are Counted & Only The Box is Read. The Candidates & The Heart
+                May Be The ROI's Masks or The Whole Volume's, Which Are Read Through Views, & The Result is The
+                ROI's Mask, See FullMask
+    """
+    if roi is not None:
+        shape = RegionShape(roi)
+        candidates = scan_threshold if scan_threshold.shape == shape else scan_threshold[RegionSlices(roi)]
+        heart = pred if pred.shape == shape else pred[RegionSlices(roi)]
+        # The Box Holds Ribs, Spine & Aorta Too, Only The Heart's Candidates Are Kept
+        FinalPred = np.logical_and(candidates, heart)
+        return AsMask(FinalPred), CandidateVolume(np.count_nonzero(FinalPred), voxel_spacing)
+
+    # The Region is Narrowed To The Candidates in Place
+    FinalPred = ScoringRegion(pred)
+    np.logical_and(FinalPred, scan_threshold, out=FinalPred)
+    candidate_voxels = np.count_nonzero(FinalPred)
+    return AsMask(FinalPred), CandidateVolume(candidate_voxels, voxel_spacing)
+
+
+def FullMask(mask: np.ndarray, shape: tuple, roi) -> np.ndarray:
+    """
+    Places The Mask of a Region of Interest in an Empty Mask of The Whole Volume, For When The Whole Frame is Needed
+    """
+    full = np.zeros(shape, dtype=np.uint8)
+    full[RegionSlices(roi)] = mask
+    return full
+
+
+def BoundingBox(mask: np.ndarray) -> tuple:
+    """
+    Slices of The Smallest Box Holding Every Non-Zero Voxel, The Whole Volume When There is None
+    """
+    return tuple(slice(np.argmax(axis), len(axis) - np.argmax(axis[::-1])) for axis in
+                 (mask.any(axis=(1, 2)), mask.any(axis=(0, 2)), mask.any(axis=(0, 1))))
+
+
+def GroupMax(values: np.ndarray, groups: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """
+    Maximum of Each Group's Values, Sorting The Values by Group & Reducing Each Group's Run
+    :param values: Values of The Labelled Voxels
+    :param groups: Group of Each Value, 1 To len(sizes)
+    :param sizes: Number of Values in Each Group, None Empty
+    """
+    if not len(sizes):
+        return np.zeros(0, dtype=values.dtype)
+    return np.maximum.reduceat(values[np.argsort(groups, kind="stable")], np.cumsum(sizes) - sizes)
+
+
+def DensityWeight(peak_hu: np.ndarray, threshold: float = 130) -> np.ndarray:
+    """
+    Agatston Density Weights of Lesions From Their Peak HU, 0 Under The Threshold
+    """
+    return np.where(peak_hu >= threshold, np.digitize(peak_hu, DENSITY_STEPS) + 1, 0).astype(np.int8)
+
+
+def LabelLesions(scan: np.ndarray, mask: np.ndarray, voxel_spacing: list, threshold: float = 130) -> dict:
+    """
+    Labels The Lesions of Every Axial Slice in One Pass & Reduces Each Lesion's Voxels Without Python Loops
+    :param scan: Volume of Shape (Z, X, Y) in HU
+    :param mask: Calcifications Mask of The Same Shape, Voxels Under The Threshold Are Ignored
+    :param voxel_spacing: Voxel Spacing as (x, y, z) in mm
+    :param threshold: HU Threshold of a Calcified Voxel
+    :return: Per Lesion Arrays: Axial Slice, Voxel Count, Area in mm², Peak & Summed HU
+    """
+    from scipy import ndimage
+
+    candidates = (mask > 0) & (scan >= threshold)
+    # Only The Bounding Box of The Candidates is Labelled, Usually a Small Part of The Volume
+    box = BoundingBox(candidates)
+    labels, count = ndimage.label(candidates[box], structure=IN_PLANE)
+
+    voxels = np.flatnonzero(labels)
+    lesion = labels.ravel()[voxels]
+    hu = scan[box].ravel()[voxels].astype(np.float64)
+    sizes = np.bincount(lesion, minlength=count + 1)[1:]
+    # A Lesion Lies in One Slice, The Slice of Any of its Voxels
+    first_slice = np.zeros(count, dtype=np.int64)
+    first_slice[lesion - 1] = voxels // (labels.shape[1] * labels.shape[2]) + box[0].start
+
+    return {
+        "slice": first_slice,
+        "voxels": sizes,
+        "area": sizes * (voxel_spacing[0] * voxel_spacing[1]),
+        "peak": GroupMax(hu, lesion, sizes),
+        "hu_sum": np.bincount(lesion, weights=hu, minlength=count + 1)[1:]
+    }
+
+
+def AgatstonScore(scan: np.ndarray, mask: np.ndarray, voxel_spacing: list, threshold: float = 130,
+                  min_area: float = 1.0, calibration: float = 0.8) -> dict:
+    """
+    Agatston, Volume & Mass Scores of The Calcifications Inside The Mask
+    :param scan: Volume of Shape (Z, X, Y) in HU
+    :param mask: Calcifications Mask of The Same Shape, e.g. From QuantifyCAC
+    :param voxel_spacing: Voxel Spacing as (x, y, z) in mm, z is Taken as The Slice Thickness
+    :param threshold: HU Threshold of a Calcified Voxel
+    :param min_area: Lesions Smaller Than This Area in mm² Are Noise & Not Scored
+    :param calibration: mg of Hydroxyapatite per cm³ per HU, Typical of 120 kVp, Use a Phantom's When Available
+    :return: Dictionary of The Agatston Score, Volume in mm³, Mass in mg & Number of Scored Lesions
+    """
+    lesions = LabelLesions(scan, mask, voxel_spacing, threshold)
+    keep = lesions["area"] >= min_area
+    weights = DensityWeight(lesions["peak"][keep], threshold)
+    voxel_volume = voxel_spacing[0] * voxel_spacing[1] * voxel_spacing[2]
+    return {
+        "agatston": float(np.dot(lesions["area"][keep], weights) * voxel_spacing[2] / REFERENCE_THICKNESS),
+        "volume": float(lesions["voxels"][keep].sum() * voxel_volume),
+        "mass": float(lesions["hu_sum"][keep].sum() * voxel_volume * calibration / 1000),
+        "lesions": int(keep.sum())
+    }
+
+
+def LesionTable(scan: np.ndarray, mask: np.ndarray, voxel_spacing: list, origin: tuple = (0, 0, 0)) -> np.ndarray:
+    """
+    Labels The 26-Connected Lesions of a Calcifications Mask & Fills Their Table in One Sweep, Boxes From
+    find_objects & Every Other Column From Reductions Grouped by Lesion
+    :param scan: Volume of Shape (Z, X, Y) in HU
+    :param mask: Calcifications Mask of The Same Shape, e.g. From QuantifyCAC
+    :param voxel_spacing: Voxel Spacing as (x, y, z) in mm
+    :param origin: Added To Boxes & Centroids, The Region's Start When The Scan is a View of a Region of Interest
+    :return: Structured Array of LESION_DTYPE, One Row per Lesion, Boxes & Centroids in The Volume's Frame
+    """
+    from scipy import ndimage
+
+    box = BoundingBox(mask > 0)
+    labels, count = ndimage.label(mask[box] > 0, structure=np.ones((3, 3, 3), dtype=bool))
+    table = np.zeros(count, dtype=LESION_DTYPE)
+    if not count:
+        return table
+
+    voxels = np.flatnonzero(labels)
+    lesion = labels.ravel()[voxels]
+    hu = scan[box].ravel()[voxels].astype(np.float64)
+    sizes = np.bincount(lesion, minlength=count + 1)[1:]
+    offset = np.array([axis.start for axis in box]) + np.asarray(origin, dtype=np.int64)
+    table["id"] = np.arange(1, count + 1)
+    table["voxels"] = sizes
+    table["volume"] = sizes * (voxel_spacing[0] * voxel_spacing[1] * voxel_spacing[2])
+    # find_objects Returns Each Label's Slices, Stops Are Exclusive
+    objects = np.array([[(axis.start, axis.stop - 1) for axis in slices] for slices in ndimage.find_objects(labels)])
+    table["box"] = objects.reshape(count, 6) + np.repeat(offset, 2)
+    for axis, coordinate in enumerate(np.unravel_index(voxels, labels.shape)):
+        table["centroid"][:, axis] = np.bincount(lesion, weights=coordinate, minlength=count + 1)[1:] / sizes + \
+                                     offset[axis]
+    table["max_hu"] = GroupMax(hu, lesion, sizes)
+    table["mean_hu"] = np.bincount(lesion, weights=hu, minlength=count + 1)[1:] / sizes
+    table["weight"] = DensityWeight(table["max_hu"])
+    return table
+
+
+def TableColumns(table: np.ndarray) -> dict:
+    """
+    Lesion Table as a Dictionary of Column Lists, Compact in JSON
+    """
+    return {name: table[name].tolist() for name in table.dtype.names}
+
+
+def TableFromColumns(columns: dict) -> np.ndarray:
+    """
+    Lesion Table From The Dictionary of Column Lists Returned by TableColumns
+    """
+    table = np.zeros(len(columns["id"]), dtype=LESION_DTYPE)
+    for name in LESION_DTYPE.names if len(table) else ():
+        table[name] = columns[name]
+    return table
+
+
+class DensityIndex:
+    """
+    Scores The Calcifications Inside a Region at Any Threshold Above a Base One Without Thresholding The Volume
+    Again. A Max-Tree of The Lesions Found at The Base Threshold Holds Every Lesion a Higher Threshold Would Find:
+    a Tree Node is The Lesion Found From its Parent's HU up To its Own, So Each Node Adds its Scores Over That
+    Interval & a Threshold Only Takes Binary Searches in Precomputed Sums
+    """
+
+    def __init__(self, scan: np.ndarray, region: np.ndarray, voxel_spacing: list, base_threshold: float = 130,
+                 min_area: float = 1.0, calibration: float = 0.8):
+        """
+        :param scan: Volume of Shape (Z, X, Y) in HU
+        :param region: Mask of The Voxels That May Be Scored, e.g. From ScoringRegion or The Heart Inside The
+                       Region of Interest Given To QuantifyCAC, None Scores The Whole Scan
+        :param voxel_spacing: Voxel Spacing as (x, y, z) in mm
+        :param base_threshold: Lowest Threshold That Can Be Scored
+        :param min_area: Lesions Smaller Than This Area in mm² Are Noise & Not Scored
+        :param calibration: mg of Hydroxyapatite per cm³ per HU, as in AgatstonScore
+        """
+        from scipy import ndimage
+        from skimage.morphology import max_tree
+
+        self.base_threshold = base_threshold
+        self.voxel_spacing = voxel_spacing
+        pixel_area = voxel_spacing[0] * voxel_spacing[1]
+        voxel_volume = pixel_area * voxel_spacing[2]
+
+        candidates = scan >= base_threshold
+        if region is not None:
+            candidates &= region > 0
+        box = BoundingBox(candidates)
+        labels, count = ndimage.label(candidates[box], structure=IN_PLANE)
+        levels = self.__pack(scan[box], labels, count, np.floor(base_threshold) - 1)
+        parent, _ = max_tree(levels, connectivity=2)
+        levels = levels.ravel()
+        parent = parent.ravel()
+
+        # Every Voxel's Subtree Voxel Count, HU Sum & Peak, Accumulated From The Deepest Voxels up
+        depth = self.__depth(parent)
+        voxels = (levels >= base_threshold).astype(np.int64)
+        hu_sum = np.where(voxels > 0, levels, 0)
+        peak = levels.copy()
+        order = np.argsort(depth, kind="stable")
+        bounds = np.searchsorted(depth[order], np.arange(depth.max(initial=0), 0, -1))
+        for first, last in zip(bounds, np.r_[len(order), bounds[:-1]]):
+            nodes = order[first:last]
+            np.add.at(voxels, parent[nodes], voxels[nodes])
+            np.add.at(hu_sum, parent[nodes], hu_sum[nodes])
+            np.maximum.at(peak, parent[nodes], peak[nodes])
+
+        # A Node's Canonical Voxel is The One Whose Parent Has a Lower HU, The Node's Lesion Exists For
+        # Thresholds Above The Parent's HU up To The Node's
+        node = (levels[parent] < levels) & (levels >= base_threshold)
+        area = voxels[node] * pixel_area
+        scored = area >= min_area
+        contributions = np.stack([
+            np.where(scored, area * DensityWeight(peak[node], base_threshold), 0) * voxel_spacing[2] /
+            REFERENCE_THICKNESS,
+            np.where(scored, voxels[node] * voxel_volume, 0),
+            np.where(scored, hu_sum[node] * voxel_volume * calibration / 1000, 0),
+            scored.astype(np.float64)
+        ], axis=1)
+        self.upper, self.upper_sums = self.__suffix_sums(levels[node], contributions)
+        self.lower, self.lower_sums = self.__suffix_sums(levels[parent[node]], contributions)
+        self.hu = np.sort(levels[levels >= base_threshold])
+
+    def score(self, threshold: float) -> dict:
+        """
+        :param threshold: HU Threshold, Not Under The Base Threshold
+        :return: Dictionary of AgatstonScore's Scores & The Number of Candidate Voxels Before The Area Rule
+        """
+        if threshold < self.base_threshold:
+            raise ValueError(f"The Index Starts at {self.base_threshold} HU, Can't Score at {threshold} HU")
+        # Nodes With The Threshold in (Parent's HU, Node's HU]: Those up To The Threshold Minus Those Starting
+        # Above it
+        sums = self.upper_sums[np.searchsorted(self.upper, threshold)] - \
+            self.lower_sums[np.searchsorted(self.lower, threshold)]
+        return {
+            "agatston": float(sums[0]),
+            "volume": float(sums[1]),
+            "mass": float(sums[2]),
+            "lesions": int(round(sums[3])),
+            "voxels": int(len(self.hu) - np.searchsorted(self.hu, threshold))
+        }
+
+    @staticmethod
+    def __pack(scan: np.ndarray, labels: np.ndarray, count: int, floor: float) -> np.ndarray:
+        """
+        Copies Each Lesion Found at The Base Threshold Into Its Own Place in One Image, Sorted by Height Into Rows
+        & Separated by Voxels Under The Base Threshold, so The Max-Tree Only Spends Time on The Lesions
+        """
+        from scipy import ndimage
+
+        if not count:
+            return np.full((3, 3), floor, dtype=np.float64)
+        boxes = np.array([(x.start, x.stop, y.start, y.stop) for _, x, y in ndimage.find_objects(labels)])
+        origins = boxes[:, [0, 2]]
+        # One Voxel Wider & Higher Than The Lesion, Keeping it Apart From The Next
+        sizes = boxes[:, [1, 3]] - origins + 1
+
+        # Rows of Lesions, Each Row as High as its First, Highest Lesion & About as Wide as The Image is High
+        order = np.argsort(-sizes[:, 0], kind="stable")
+        width = max(int(np.sqrt(np.prod(sizes, axis=1).sum())), sizes[:, 1].max())
+        start = np.cumsum(sizes[order, 1]) - sizes[order, 1]
+        row = start // width
+        heights = GroupMax(sizes[order, 0], row + 1, np.bincount(row))
+        places = np.zeros_like(origins)
+        places[order] = np.stack([(np.cumsum(heights) - heights)[row], start - row * width], axis=1)
+
+        voxels = np.flatnonzero(labels)
+        lesion = labels.ravel()[voxels] - 1
+        _, x, y = np.unravel_index(voxels, labels.shape)
+        # The Max-Tree Needs 3 Voxels Along Each Axis For Its Neighbourhood
+        packed = np.full((max(heights.sum(), 3), max(width + sizes[:, 1].max(), 3)), floor, dtype=np.float64)
+        packed[places[lesion, 0] + x - origins[lesion, 0], places[lesion, 1] + y - origins[lesion, 1]] = \
+            scan.ravel()[voxels]
+        return packed
+
+    @staticmethod
+    def __depth(parent: np.ndarray) -> np.ndarray:
+        # Pointer Jumping, Each Pass Doubles The Distance Every Voxel Has Looked up
+        depth = (parent != np.arange(len(parent))).astype(np.int64)
+        ancestor = parent
+        while np.any(ancestor[ancestor] != ancestor):
+            depth = depth + depth[ancestor]
+            ancestor = ancestor[ancestor]
+        return depth
+
+    @staticmethod
+    def __suffix_sums(keys: np.ndarray, values: np.ndarray) -> tuple:
+        # Sums of The Values Whose Key is at Least Each Sorted Key, With a Trailing Zero For Keys Above All
+        order = np.argsort(keys, kind="stable")
+        sums = np.cumsum(values[order][::-1], axis=0)[::-1]
+        return keys[order], np.vstack([sums, np.zeros((1, values.shape[1]))])
@@ -0,0 +1,85 @@
+#
+# Export.py
+# Converts the SavedModels in Models_Saved to ONNX or TFLite for the CPU inference backends
+#
+import argparse
+import os
+
+import tensorflow as tf
+
+
+def export_onnx(model_path: str, model_input: tuple, output_path: str, precision: str = "fp32"):
+    """
+        Convert a SavedModel to an ONNX Graph
+    :param model_path: Tensor Flow's SavedModel Format Directory path
+    :param model_input: The Saved Model's Input Shape
+    :param output_path: Path of the .onnx File
+    :param precision: "fp32", "fp16" Weights or "int8" Dynamically Quantized Weights
+    """
+    import tf2onnx
+
+    model = tf.keras.models.load_model(model_path)
+    signature = (tf.TensorSpec(shape=(None, *model_input, 1), dtype=tf.float32, name="input"),)
+    onnx_model, _ = tf2onnx.convert.from_keras(model, input_signature=signature, opset=13)
+
+    if precision == "fp16":
+        from onnxconverter_common import float16
+        # Inputs & Outputs Stay float32 so the Backend doesn't Change
+        onnx_model = float16.convert_float_to_float16(onnx_model, keep_io_types=True)
+
+    if precision == "int8":
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        float_path = output_path + ".fp32"
+        with open(float_path, "wb") as f:
+            f.write(onnx_model.SerializeToString())
+        quantize_dynamic(float_path, output_path, weight_type=QuantType.QInt8)
+        os.remove(float_path)
+    else:
+        with open(output_path, "wb") as f:
+            f.write(onnx_model.SerializeToString())
+
+
+def export_tflite(model_path: str, model_input: tuple, output_path: str, precision: str = "fp32"):
+    """
+        Convert a SavedModel to a TFLite Flat Buffer with a Batch of One
+    :param model_path: Tensor Flow's SavedModel Format Directory path
+    :param model_input: The Saved Model's Input Shape
+    :param output_path: Path of the .tflite File
+    :param precision: "fp32", "fp16" Weights or "int8" Dynamic Range Quantized Weights
+    """
+    model = tf.keras.models.load_model(model_path)
+    forward = tf.function(lambda x: model(x, training=False),
+                          input_signature=[tf.TensorSpec(shape=(1, *model_input, 1), dtype=tf.float32)])
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([forward.get_concrete_function()], model)
+
+    if precision in ("fp16", "int8"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if precision == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+
+Exporters = {
+    "onnx": export_onnx,
+    "tflite": export_tflite
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a SavedModel for the ONNX Runtime or TFLite Backends")
+    parser.add_argument("model", help="SavedModel Directory, e.g. Models_Saved/Heart_Localization")
+    parser.add_argument("--input", type=int, nargs=3, required=True, help="Model Input Shape, e.g. 112 112 112")
+    parser.add_argument("--format", choices=list(Exporters), default="onnx")
+    parser.add_argument("--precision", choices=["fp32", "fp16", "int8"], default="fp32")
+    parser.add_argument("--output", help="Output File, Defaults to <model>[-precision].<format>")
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        suffix = "" if args.precision == "fp32" else f"-{args.precision}"
+        output = f"{args.model.rstrip('/')}{suffix}.{args.format}"
+
+    Exporters[args.format](args.model, tuple(args.input), output, args.precision)
+    print(f"Exported {args.model} to {output} ({os.path.getsize(output) / 1024 ** 2:.1f} MB)")
@@ -3,62 +3,349 @@
 # Author: Ahmad Abdalmageed
 # Date: 6/10/21
 #
-import logging
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
 import numpy as np
+from scipy import ndimage
 from skimage.transform import resize
-import tensorflow as tf
+
+try:
+    from Backends import load_backend, backend_from_path, configure_cpu
+except ImportError:
+    from Models.Segmentation.Backends import load_backend, backend_from_path, configure_cpu
+
+
+def _mirror_coords(size: int, source_size: int):
+    # Source Coordinates of each Output Voxel, Voxel Centers are Aligned and Coordinates past the Edges are
+    # Mirrored as in skimage's resize
+    coords = np.abs((np.arange(size) + 0.5) * (source_size / size) - 0.5)
+    coords = np.clip(np.where(coords > source_size - 1, 2 * (source_size - 1) - coords, coords), 0, source_size - 1)
+    low = np.floor(coords).astype(np.intp)
+    high = np.minimum(low + 1, source_size - 1)
+    return low, high, (coords - low).astype(np.float32)
+
+
+def _interpolate(src: np.ndarray, axis: int, coords: tuple, nearest: bool) -> np.ndarray:
+    low, high, weight = coords
+    if nearest:
+        return np.take(src, np.where(weight < 0.5, low, high), axis=axis)
+    shape = [1] * src.ndim
+    shape[axis] = -1
+    lower = np.take(src, low, axis=axis)
+    return lower + (np.take(src, high, axis=axis) - lower) * weight.reshape(shape)
+
+
+def upsample_mask(prediction: np.ndarray, output_shape: tuple, threshold: float, method: str = "linear",
+                  axial_first: bool = True, slab: int = 8) -> np.ndarray:
+    """
+        Resize a Probability Map to the Volume's Shape and Threshold it, One Slab of Axial Slices
+        at a Time so the only Full Resolution Array is the uint8 Output
+    :param prediction: Model Resolution Probabilities, Axial Axis Last
+    :param output_shape: Volume Shape, Axial Axis Last
+    :param threshold: Probabilities Above it are Set to 1
+    :param method: "linear" Interpolates the Probabilities as skimage's resize does, Smoothing the Axes
+                   that are Downsampled with its Anti-Aliasing Gaussian, "nearest" Thresholds at Model Resolution
+                   first, Valid as Thresholding Commutes with Nearest Neighbour Sampling
+    :param axial_first: Return the Mask with the Axial Axis First
+    :param slab: Number of Axial Slices Interpolated Together
+    :return: uint8 Mask of 0 & 1
+    """
+    nearest = method == "nearest"
+    src = prediction >= threshold if nearest else prediction.astype(np.float32, copy=False)
+    # Downsampled Axes are Smoothed at Model Resolution, with the Sigma & Edge Mode resize Uses
+    sigma = np.maximum(0, (np.divide(src.shape, output_shape) - 1) / 2)
+    if not nearest and np.any(sigma > 0):
+        src = ndimage.gaussian_filter(src, sigma, mode="mirror")
+    coords = [_mirror_coords(size, source_size) for size, source_size in zip(output_shape, src.shape)]
+
+    out_shape = (output_shape[2], output_shape[0], output_shape[1]) if axial_first else tuple(output_shape)
+    out = np.empty(out_shape, dtype=np.uint8)
+    for start in range(0, output_shape[2], slab):
+        end = min(start + slab, output_shape[2])
+        part = _interpolate(src, 2, tuple(c[start:end] for c in coords[2]), nearest)
+        part = _interpolate(part, 0, coords[0], nearest)
+        part = _interpolate(part, 1, coords[1], nearest)
+        part = part if nearest else part >= threshold
+
+        if axial_first:
+            out[start:end] = np.moveaxis(part, -1, 0)
+        else:
+            out[:, :, start:end] = part
+    return out
+
+
+class PreparedVolume(NamedTuple):
+    """
+        A Volume Already Resized and Scaled to the Model's Input, Accepted by predict and predict_batch
+    """
+    data: np.ndarray
+    shape: tuple
 
 
 class Infer:
-    def __init__(self, model_path: str, model_input: tuple, threshold: float = 0.9, axial_first: bool = True):
+    def __init__(self, model_path: str, model_input: tuple, threshold: float = 0.9, axial_first: bool = True,
+                 mode: str = "resize", patch_size: tuple = None, overlap: float = 0.25, batch_size: int = 4,
+                 compiled: bool = True, xla: bool = False, backend: str = None, upsample: str = "linear",
+                 intra_op_threads: int = None, inter_op_threads: int = None, onednn: bool = None,
+                 cpu_affinity=None, workers: int = 3):
         """
         Inference Model Script
 
-        :param model_path: Tensor Flow's SavedModel Format Directory path
+        :param model_path: Tensor Flow's SavedModel Format Directory path, or an .onnx/.tflite File
+                           Exported by Export.py
         :param model_input: The Saved Model's Input Shape, used in resizing Input Data
         :param threshold: Prediction Output Thresholding, useful in case of Binary Prediction
         :param axial_first: a Boolean Indicator that the Axial Slices appear first in the Input shape,
                             happens when loading Data in 3D Slicer.
+        :param mode: "resize" Resizes the Whole Volume to the Model's Input, "sliding" Runs the Model over
+                     Overlapping Patches at the Volume's Native Resolution
+        :param patch_size: Sliding Window Patch Shape, Defaults to the Model's Input Shape
+        :param overlap: Fraction of the Patch Shared by Neighbouring Patches in the Sliding Window Mode
+        :param batch_size: Number of Patches Predicted Together in the Sliding Window Mode
+        :param compiled: Run the Model through a tf.function with a Fixed Input Signature instead of Eagerly
+        :param xla: JIT Compile the tf.function with XLA
+        :param backend: "tf", "onnx" or "tflite", Guessed from the Model's Path when not Given
+        :param upsample: "linear" Interpolates the Probabilities then Thresholds, "nearest" Thresholds at the
+                         Model's Resolution then Repeats Voxels, Both Return a uint8 Mask
+        :param intra_op_threads: CPU Threads Used inside a Single Operation, see Backends.configure_cpu
+        :param inter_op_threads: CPU Operations Allowed to Run in Parallel
+        :param onednn: Enable or Disable Tensor Flow's oneDNN Optimizations
+        :param cpu_affinity: Cores the Process is Pinned to, e.g. "0-3"
+        :param workers: Threads Preparing and Post-Processing the Volumes of a Batch in Parallel
         """
+        if mode not in ("resize", "sliding"):
+            raise ValueError(f"Unknown Inference Mode {mode}")
+        if upsample not in ("linear", "nearest"):
+            raise ValueError(f"Unknown Upsampling Method {upsample}")
+
         self.path = model_path
 
         self.model_input = model_input
-        self.data_shape = None
         self.threshold = threshold
         self.axial_first = axial_first
 
-        self.model = tf.keras.models.load_model(self.path)
+        self.mode = mode
+        self.patch_size = tuple(patch_size) if patch_size is not None else tuple(model_input)
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.upsample = upsample
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Prepare") if workers > 1 else None
 
-        # Define GPU Usage by the Server
-        gpus = tf.config.list_physical_devices('GPU')
-        if gpus:
-            try:
-                # Currently, memory growth needs to be the same across GPUs
-                for gpu in gpus:
-                    tf.config.experimental.set_memory_growth(gpu, True)
-                logical_gpus = tf.config.experimental.list_logical_devices('GPU')
-                print(len(gpus), "Physical GPUs,", len(logical_gpus), "Logical GPUs")
-            except RuntimeError as e:
-                # Memory growth must be set before GPUs have been initialized
-                print(e)
-
-    def predict(self, data: np.ndarray):
-        slices = self.__prepare_data(data)
-        res = self.model(slices)
-        return self.__post_process(res)
+        # CPU Settings are Process Wide, so they Must be Applied before the First Model is Loaded
+        if any(option is not None for option in (intra_op_threads, inter_op_threads, onednn, cpu_affinity)):
+            configure_cpu(intra_op_threads, inter_op_threads, onednn, cpu_affinity)
+
+        # The Runtime Executing the Model, Takes a (Batch, *model_input, 1) float32 Array
+        self.backend_name = backend or backend_from_path(model_path)
+        options = dict(compiled=compiled, xla=xla) if self.backend_name == "tf" else {}
+        self.backend = load_backend(model_path, model_input, self.backend_name, **options)
+        self.forward = self.backend
+        self.model = getattr(self.backend, "model", None)
+
+    def warm_up(self):
+        """
+            Run a Single Forward Pass on a Zero Tensor of the Model's Input Shape,
+            Moves the One-Time Graph Building and Memory Allocation Costs out of the First Request
+        """
+        self.forward(np.zeros((1, *self.model_input, 1), dtype=np.float32))
+
+    def close(self):
+        """
+            Shut Down the Preparation Pool, Callers Still Holding the Model Keep Working
+            with Volumes Prepared One by One
+        """
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    @property
+    def model_size(self) -> int:
+        """
+            Approximate Memory Held by the Model's Weights in Bytes
+        """
+        return self.backend.size
+
+    def predict(self, data: np.ndarray, timings: dict = None):
+        """
+            Predict a Single Volume, Safe to Call from Multiple Threads Sharing the same Instance
+            as all per-Call State is Kept Local
+        :param data: Input Volume
+        :param timings: Dictionary the Seconds Spent in the "preprocess", "forward" and "postprocess"
+                        Stages are Added to
+        :return: Thresholded uint8 Prediction with the Input's Shape
+        """
+        if self.mode == "sliding" and not isinstance(data, PreparedVolume):
+            return self.predict_sliding(data, timings)
+        start = time.time()
+        slices, shape = self.__prepare_data(data)
+        start = self.__record(timings, "preprocess", start)
+        res = self.forward(slices)
+        start = self.__record(timings, "forward", start)
+        mask = self.__post_process(res, shape)
+        self.__record(timings, "postprocess", start)
+        return mask
+
+    def predict_batch(self, data: list, timings: dict = None) -> list:
+        """
+            Predict a List of Volumes in a Single Forward Pass, Volumes are Stacked Along the Batch Axis
+            after Resizing and the Predictions are Split Back and Resized to each Volume's Shape.
+            Volumes are Prepared and Post-Processed in Parallel, e.g. the 3 Views of Partial Localization.
+            In the Sliding Window Mode, Volumes that are not Already Prepared are Predicted One by One with
+            predict_sliding, as predict Does, and only the Prepared Ones Share a Forward Pass
+        :param data: List of Input Volumes, Shapes can Differ
+        :param timings: Dictionary the Seconds Spent in each Stage of the Whole Batch are Added to, see predict
+        :return: List of Predictions in the Same Order
+        """
+        if self.mode == "sliding":
+            masks = [None if isinstance(volume, PreparedVolume) else self.predict_sliding(volume, timings)
+                     for volume in data]
+            prepared = [i for i, mask in enumerate(masks) if mask is None]
+            if prepared:
+                for i, mask in zip(prepared, self.__predict_resized([data[i] for i in prepared], timings)):
+                    masks[i] = mask
+            return masks
+        return self.__predict_resized(data, timings)
+
+    def __predict_resized(self, data: list, timings: dict = None) -> list:
+        start = time.time()
+        batch, shapes = zip(*self.__map(self.__prepare_data, data))
+        start = self.__record(timings, "preprocess", start)
+        res = self.forward(np.concatenate(batch, axis=0))
+        start = self.__record(timings, "forward", start)
+        masks = self.__map(lambda i: self.__post_process(res[i:i + 1], shapes[i]), range(len(shapes)))
+        self.__record(timings, "postprocess", start)
+        return masks
+
+    @staticmethod
+    def __record(timings: dict, stage: str, start: float) -> float:
+        # Adds the Time Since start to the Stage and Returns the Current Time as the Next Stage's Start
+        now = time.time()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + now - start
+        return now
+
+    def __map(self, function, items) -> list:
+        items = list(items)
+        pool = self.pool
+        if pool is None or len(items) < 2:
+            return [function(item) for item in items]
+        try:
+            futures = [pool.submit(function, item) for item in items]
+        except RuntimeError:
+            # Closed While this Call was Running
+            return [function(item) for item in items]
+        return [future.result() for future in futures]
+
+    def predict_sliding(self, data: np.ndarray, timings: dict = None) -> np.ndarray:
+        """
+            Predict the Volume Patch by Patch at its Native Resolution, Overlapping Patches are Blended
+            using a Gaussian Weight that Favours Patch Centers. Apart from the Output, Memory Use
+            is Bounded by the Batch of Patches
+        :param data: Input Volume
+        :param timings: Dictionary the Seconds Spent in each Stage are Added to, Patch Extraction Counts as
+                        "preprocess" and Blending as "postprocess"
+        :return: Thresholded uint8 Prediction with the Input's Shape
+        """
+        clock = time.time()
+        src = np.moveaxis(data, 0, -1) if self.axial_first else data
+        shape = src.shape
+        patch = self.patch_size
+
+        # Patch Start Positions along each Axis, the Last Patch is Aligned to the Volume's End
+        starts = []
+        for size, p in zip(shape, patch):
+            step = max(1, int(p * (1 - self.overlap)))
+            axis_starts = list(range(0, max(size - p, 0) + 1, step))
+            if axis_starts[-1] + p < size:
+                axis_starts.append(size - p)
+            starts.append(axis_starts)
+
+        # Separable Gaussian Weights, The Normalization Map is an Outer Product of 1D Sums
+        weights_1d = [self.__gaussian(p) for p in patch]
+        norms_1d = []
+        for size, p, w, axis_starts in zip(shape, patch, weights_1d, starts):
+            norm = np.zeros(size, dtype=np.float32)
+            for start in axis_starts:
+                end = min(start + p, size)
+                norm[start:end] += w[:end - start]
+            norms_1d.append(norm)
+        weight = weights_1d[0][:, None, None] * weights_1d[1][None, :, None] * weights_1d[2][None, None, :]
+
+        out = np.zeros(shape, dtype=np.float32)
+        positions = itertools.product(*starts)
+        while True:
+            batch_positions = list(itertools.islice(positions, self.batch_size))
+            if not batch_positions:
+                break
+
+            batch = np.stack([self.__extract_patch(src, start) for start in batch_positions])
+            clock = self.__record(timings, "preprocess", clock)
+            res = np.asarray(self.forward(batch[..., np.newaxis]))[..., 0]
+            clock = self.__record(timings, "forward", clock)
+
+            for start, pred in zip(batch_positions, res):
+                if pred.shape != patch:
+                    pred = resize(pred, output_shape=patch)
+                region = tuple(slice(s, min(s + p, size)) for s, p, size in zip(start, patch, shape))
+                valid = tuple(slice(0, r.stop - r.start) for r in region)
+                out[region] += (pred * weight)[valid]
+            clock = self.__record(timings, "postprocess", clock)
+
+        # Normalize One Axial Slab at a Time to Avoid a Full Size Weight Map
+        for k in range(shape[2]):
+            out[:, :, k] /= np.outer(norms_1d[0], norms_1d[1]) * norms_1d[2][k]
+
+        mask = (out >= self.threshold).view(np.uint8)
+        if self.axial_first:
+            mask = np.ascontiguousarray(np.moveaxis(mask, -1, 0))
+        self.__record(timings, "postprocess", clock)
+        return mask
+
+    def __extract_patch(self, src: np.ndarray, start: tuple) -> np.ndarray:
+        # Patches Crossing the Volume's Border are Padded with Air
+        region = tuple(slice(s, s + p) for s, p in zip(start, self.patch_size))
+        tile = src[region]
+        if tile.shape != self.patch_size:
+            padded = np.full(self.patch_size, -1024.0, dtype=np.float32)
+            padded[tuple(slice(0, n) for n in tile.shape)] = tile
+            tile = padded
+        if self.patch_size != tuple(self.model_input):
+            tile = resize(tile, output_shape=self.model_input, preserve_range=True)
+        return self.range_scale(tile.astype(np.float32))
+
+    @staticmethod
+    def __gaussian(size: int) -> np.ndarray:
+        sigma = size / 8
+        x = np.arange(size) - (size - 1) / 2
+        w = np.exp(-x ** 2 / (2 * sigma ** 2))
+        return np.maximum(w / w.max(), 1e-3).astype(np.float32)
 
     def __prepare_data(self, source: np.ndarray):
-        # Copying and Saving Input Data Shape
+        if isinstance(source, PreparedVolume):
+            return source
+
+        # Copying Input Data, the Shape is Returned to the Caller instead of Stored
+        # so Concurrent Predictions don't Overwrite each other's Shape
         src = np.copy(source)
 
         # Move the Axial Axis to be the last Dimension to resemble Training Data
         if self.axial_first:
             src = np.moveaxis(src, 0, -1)
-        self.data_shape = src.shape
+        data_shape = src.shape
 
         # Resizing Data to Fit Model.Input,
-        src = resize(src, output_shape=self.model_input, preserve_range=True)
+        if src.shape[2] < self.model_input[2]:
+            # A Thin Stack of Slices like the Sampled Views, Resized In-Plane then Interpolated Axially,
+            # Matches Resizing at once but Avoids resize's Slow Upsampling of the Whole Output
+            src = resize(src, output_shape=(*self.model_input[:2], src.shape[2]), preserve_range=True)
+            src = _interpolate(src, 2, _mirror_coords(self.model_input[2], src.shape[2]), False)
+        else:
+            src = resize(src, output_shape=self.model_input, preserve_range=True)
 
         # Convert input shape to TF Convention, This is a 3D model
         # Which needs about 5 Axis (Batches, L, W, D, Channels)
@@ -66,28 +353,24 @@ class Infer:
         src = np.expand_dims(src, -1)
 
         # Scaling the Image to the Trained Data Scale, Data Is Ready to be Served
-        src = self.range_scale(src)
-        return src
+        src = self.range_scale(src).astype(np.float32)
+        return src, data_shape
 
-    def __post_process(self, source):
-        src = np.copy(source)
-
-        # Fix Prediction Shape
-        src = np.squeeze(src, 0)
-        src = np.squeeze(src, -1)
-
-        # Upscale to the Input Shape
-        src = resize(src, output_shape=self.data_shape)
-
-        # Fix Return Shape for Slicer
-        if self.axial_first:
-            src = np.moveaxis(src, -1, 0)
+    def __post_process(self, source, data_shape: tuple):
+        # Fix Prediction Shape, Model Resolution Stays float32
+        src = np.asarray(source, dtype=np.float32)[0, ..., 0]
 
-        # Thresholding output Prediction
-        src[src < self.threshold] = 0.0
-        src[src >= self.threshold] = 1.0
+        # Upscale to the Input Shape & Threshold, Returned with the Axial Axis First for Slicer
+        return upsample_mask(src, data_shape, self.threshold, self.upsample, self.axial_first)
 
-        return src
+    def slab_preparer(self, volume_shape: tuple):
+        """
+            Prepare a Volume while it's Received Slab by Slab, see SlabPreparer
+        :param volume_shape: Shape of the Whole Volume, Axial Axis First
+        """
+        if not self.axial_first:
+            raise ValueError("Slab Preparation Requires the Axial Axis First")
+        return SlabPreparer(volume_shape, self.model_input, self.range_scale)
 
     @staticmethod
     def range_scale(img) -> np.ndarray:
@@ -105,6 +388,67 @@ class Infer:
         return src
 
 
+class SlabPreparer:
+    def __init__(self, volume_shape: tuple, model_input: tuple, scale):
+        """
+            Resizes each Slab of Axial Slices In-Plane on a Worker Thread as soon as it's Added, so the
+            Preparation Overlaps Receiving the Rest of the Volume. The Anti-Aliasing Filter and the Linear
+            Interpolation of resize are both Separable, so Resizing In-Plane then Axially Matches Resizing
+            the Whole Volume at once. Scaling Clips Values, so it's Applied after the Axial Resize
+            on the Model Resolution Volume
+
+        :param volume_shape: Shape of the Whole Volume, Axial Axis First
+        :param model_input: The Model's Input Shape, Axial Axis Last
+        :param scale: Intensity Scaling Applied to the Resized Volume
+        """
+        self.volume_shape = tuple(volume_shape)
+        self.model_input = tuple(model_input)
+        self.scale = scale
+
+        # In-Plane Resized Slices, Axial Axis Last like the Model's Input
+        self.in_plane = np.empty((*self.model_input[:2], self.volume_shape[0]), dtype=np.float32)
+        self.queue = queue.Queue()
+        self.error = None
+        self.worker = threading.Thread(target=self.__work, daemon=True)
+        self.worker.start()
+
+    def add(self, slab: np.ndarray, start: int):
+        """
+            Queue a Slab of Axial Slices, Slabs can Arrive in any Order
+        :param slab: Slices start to start + len(slab), Axial Axis First
+        :param start: Index of the Slab's First Slice
+        """
+        self.queue.put((slab, start))
+
+    def finish(self) -> PreparedVolume:
+        """
+            Wait for the Queued Slabs and Resize Along the Axial Axis
+        :return: The Prepared Volume, Accepted by Infer.predict
+        """
+        self.queue.put(None)
+        self.worker.join()
+        if self.error is not None:
+            raise self.error
+
+        src = resize(self.in_plane, output_shape=self.model_input, preserve_range=True)
+        src = self.scale(src[np.newaxis, ..., np.newaxis]).astype(np.float32)
+        return PreparedVolume(src, (self.volume_shape[1], self.volume_shape[2], self.volume_shape[0]))
+
+    def __work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            slab, start = item
+            try:
+                res = resize(slab, output_shape=(slab.shape[0], *self.model_input[:2]), preserve_range=True)
+                self.in_plane[:, :, start:start + slab.shape[0]] = np.moveaxis(res, 0, -1)
+            except Exception as e:
+                self.error = e
+
+
 if __name__ == '__main__':
     import nibabel as nib
 
@@ -0,0 +1,129 @@
+#
+# Registry.py
+# Process-wide cache of loaded inference models
+#
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from Models.Segmentation.Inference import Infer
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget: int = None, warm_up: bool = True, **model_options):
+        """
+        Loads every SavedModel once and shares it between callers, models that were not used recently
+        are evicted when the total size of the loaded weights goes over the memory budget
+
+        :param memory_budget: Maximum Bytes Held by Loaded Model Weights, None disables eviction
+        :param warm_up: Run a Dummy Forward Pass on every Newly Loaded Model
+        :param model_options: Default Infer Options Used for every Loaded Model
+        """
+        self.memory_budget = memory_budget
+        self.warm_up = warm_up
+        self.model_options = model_options
+
+        self.models = OrderedDict()
+        self.stats = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+        # Futures of the Models Being Loaded, by Key
+        self.loading = {}
+
+    @staticmethod
+    def key(model_path: str, model_input: tuple, options: dict = None) -> str:
+        key = f"{model_path}:{'x'.join(str(i) for i in model_input)}"
+        # Models Loaded With Other Infer Options Are Other Instances
+        if options:
+            key += ":" + ",".join(f"{name}={value}" for name, value in sorted(options.items()))
+        return key
+
+    def get(self, model_path: str, model_input: tuple, **kwargs) -> Infer:
+        """
+            Return the Shared Model for the Given Path, Input Shape and Options, Loading it on a Miss.
+            A Model is Loaded Outside the Registry's Lock, so Loaded Models are Served while Another Loads,
+            and Callers Asking for a Model that is Being Loaded Wait for that Load
+        :param model_path: Tensor Flow's SavedModel Format Directory path
+        :param model_input: The Saved Model's Input Shape
+        :param kwargs: Passed to Infer when the Model is Loaded, Part of the Model's Key
+        :return: Loaded Infer Instance
+        """
+        key = self.key(model_path, model_input, kwargs)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                self.stats[key]["hits"] += 1
+                return self.models[key]
+
+            stats = self.stats.setdefault(key, {"hits": 0, "misses": 0, "loads": 0,
+                                                "load_time": None, "warm_up_time": None, "size": None})
+            stats["misses"] += 1
+            loading = self.loading.get(key)
+            if loading is None:
+                loading = self.loading[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return loading.result()
+
+        try:
+            start = time.time()
+            model = Infer(model_path=model_path, model_input=model_input, **{**self.model_options, **kwargs})
+            load_time = time.time() - start
+
+            warm_up_time = None
+            if self.warm_up:
+                start = time.time()
+                model.warm_up()
+                warm_up_time = time.time() - start
+        except BaseException as e:
+            with self.lock:
+                del self.loading[key]
+            loading.set_exception(e)
+            raise
+
+        with self.lock:
+            stats.update(load_time=load_time, warm_up_time=warm_up_time, size=model.model_size)
+            stats["loads"] += 1
+            self.models[key] = model
+            del self.loading[key]
+            self.__evict()
+        logging.info(f"Loaded {key} in {load_time:.2f} seconds")
+        loading.set_result(model)
+        return model
+
+    def preload(self, models: list):
+        """
+            Load and Warm Up a List of (model_path, model_input) Pairs, Used at Server Startup
+        """
+        for model_path, model_input in models:
+            self.get(model_path, model_input)
+
+    def memory_usage(self) -> int:
+        return sum(self.stats[key]["size"] for key in self.models)
+
+    def report(self) -> dict:
+        """
+            Per-Model Load Times, Hit & Miss Counts and the Current Memory Usage
+        """
+        with self.lock:
+            return {
+                "models": {key: dict(stats, loaded=key in self.models) for key, stats in self.stats.items()},
+                "memory_usage": self.memory_usage(),
+                "memory_budget": self.memory_budget,
+                "evictions": self.evictions
+            }
+
+    def __evict(self):
+        # Drop the Least Recently Used Models, The Most Recent one is Always Kept
+        if self.memory_budget is None:
+            return
+        while len(self.models) > 1 and self.memory_usage() > self.memory_budget:
+            key, model = self.models.popitem(last=False)
+            model.close()
+            self.evictions += 1
+            logging.info(f"Evicted {key} from the Model Registry")
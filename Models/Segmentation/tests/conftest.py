@@ -0,0 +1,28 @@
+import time
+
+import numpy as np
+import pytest
+
+from Models.Segmentation import Backends
+
+
+class StubBackend:
+    """
+    Stands in for a Model: the Probabilities are the Scaled Input, so Every Prediction Depends on its own Volume
+    """
+
+    def __init__(self, model_path: str, model_input: tuple, **options):
+        self.model_input = tuple(model_input)
+        self.size = 0
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        assert batch.shape[1:] == (*self.model_input, 1)
+        # Gives Other Threads a Chance to Run in the Middle of a Prediction
+        time.sleep(0.001)
+        return batch.astype(np.float32)
+
+
+@pytest.fixture
+def stub_backend(monkeypatch):
+    monkeypatch.setitem(Backends.Backends, "tf", StubBackend)
+    return StubBackend
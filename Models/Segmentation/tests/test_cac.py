@@ -0,0 +1,189 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+from skimage.measure import label
+
+from Models.Segmentation.CAC import (AgatstonScore, AsMask, DensityIndex, DensityWeight, FullMask, LesionTable,
+                                     QuantifyCAC, RegionSlices, ScoringRegion, TableColumns, TableFromColumns,
+                                     ThresholdCAC)
+
+SPACING = (0.6, 0.7, 2.5)
+
+
+def calcified_scan(shape: tuple = (12, 48, 40), seed: int = 0) -> np.ndarray:
+    # Smooth Noise Scaled so its Peaks Make Lesions of Many Sizes, Several Peaks Each, From 130 HU up to ~900 HU
+    noise = gaussian_filter(np.random.default_rng(seed).normal(size=shape), (0.6, 1.5, 1.5))
+    return np.round(noise / noise.std() * 220 - 60).astype(np.int16)
+
+
+def heart_mask(shape: tuple) -> np.ndarray:
+    z, x, y = np.ogrid[:shape[0], :shape[1], :shape[2]]
+    return (((x - shape[1] / 2) / (shape[1] / 3)) ** 2 + ((y - shape[2] / 2) / (shape[2] / 3)) ** 2 +
+            ((z - shape[0] / 2) / (shape[0] / 2)) ** 2 <= 1).astype(np.uint8)
+
+
+def naive_weight(peak: float) -> int:
+    if peak >= 400:
+        return 4
+    if peak >= 300:
+        return 3
+    if peak >= 200:
+        return 2
+    return 1 if peak >= 130 else 0
+
+
+def naive_agatston(scan, mask, spacing, threshold=130, min_area=1.0, calibration=0.8) -> dict:
+    # Slice by Slice & Lesion by Lesion, as The Score is Defined
+    scores = {"agatston": 0.0, "volume": 0.0, "mass": 0.0, "lesions": 0}
+    voxel_volume = spacing[0] * spacing[1] * spacing[2]
+    for z in range(scan.shape[0]):
+        labels = label((mask[z] > 0) & (scan[z] >= threshold), connectivity=2)
+        for lesion in range(1, labels.max() + 1):
+            hu = scan[z][labels == lesion].astype(np.float64)
+            area = len(hu) * spacing[0] * spacing[1]
+            if area < min_area:
+                continue
+            scores["agatston"] += area * naive_weight(hu.max()) * spacing[2] / 3.0
+            scores["volume"] += len(hu) * voxel_volume
+            scores["mass"] += hu.sum() * voxel_volume * calibration / 1000
+            scores["lesions"] += 1
+    return scores
+
+
+def test_threshold_of_a_region_is_the_region_of_the_threshold():
+    scan = calcified_scan()
+    roi = [2, 9, 5, 30, 7, 33]
+    mask = ThresholdCAC(scan, 160)
+    assert mask.dtype == np.uint8
+    np.testing.assert_array_equal(mask, scan >= 160)
+    np.testing.assert_array_equal(ThresholdCAC(scan, 160, roi), mask[RegionSlices(roi)])
+
+
+def test_quantify_counts_the_heart_and_central_box():
+    scan = calcified_scan()
+    pred = heart_mask(scan.shape)
+    candidates = ThresholdCAC(scan, 130)
+    mask, volume = QuantifyCAC(candidates, pred, SPACING)
+
+    region = ScoringRegion(pred)
+    np.testing.assert_array_equal(mask, (candidates > 0) & region)
+    assert volume == pytest.approx(np.count_nonzero(mask) * np.prod(SPACING) / 3)
+
+
+def test_quantify_in_a_region_counts_the_heart_in_it():
+    scan = calcified_scan()
+    pred = heart_mask(scan.shape)
+    roi = [1, 10, 4, 40, 3, 36]
+    whole = ThresholdCAC(scan, 130)
+    expected = (whole > 0) & (pred > 0)
+    # The Candidates & The Heart Can Each Be The Whole Volume's or The Region's
+    for candidates in (whole, ThresholdCAC(scan, 130, roi)):
+        for heart in (pred, pred[RegionSlices(roi)]):
+            mask, volume = QuantifyCAC(candidates, heart, SPACING, roi)
+            assert mask.dtype == np.uint8
+            np.testing.assert_array_equal(mask, expected[RegionSlices(roi)])
+            assert volume == pytest.approx(np.count_nonzero(expected[RegionSlices(roi)]) * np.prod(SPACING) / 3)
+    np.testing.assert_array_equal(FullMask(mask, scan.shape, roi)[RegionSlices(roi)], mask)
+    assert np.count_nonzero(FullMask(mask, scan.shape, roi)) == np.count_nonzero(mask)
+
+
+def test_bone_inside_the_heart_box_is_not_scored():
+    scan = np.zeros((10, 20, 20), dtype=np.int16)
+    pred = np.zeros(scan.shape, dtype=np.uint8)
+    pred[2:8, 5:15, 5:15] = 1
+    pred[2:8, 5:8, 5:8] = 0
+    # A Calcification in The Heart & a Bright Rib Voxel in a Corner of The Heart's Box, Outside The Heart
+    scan[4, 10, 10] = scan[4, 6, 6] = 800
+    roi = [2, 7, 5, 14, 5, 14]
+
+    mask, volume = QuantifyCAC(ThresholdCAC(scan, 130, roi), pred, SPACING, roi)
+    full = FullMask(mask, scan.shape, roi)
+    assert full[4, 10, 10] == 1 and full[4, 6, 6] == 0
+    assert volume == pytest.approx(np.prod(SPACING) / 3)
+    assert AgatstonScore(scan[RegionSlices(roi)], mask, SPACING, min_area=0)["lesions"] == 1
+
+
+def test_as_mask_views_compact_masks():
+    boolean = np.zeros((2, 3, 4), dtype=bool)
+    assert np.shares_memory(AsMask(boolean), boolean) and AsMask(boolean).dtype == np.uint8
+    np.testing.assert_array_equal(AsMask(np.array([0.0, 2.5, -1.0])), [0, 1, 1])
+
+
+def test_density_weights():
+    np.testing.assert_array_equal(DensityWeight(np.array([129.9, 130, 199, 200, 299, 300, 399, 400, 1500])),
+                                  [0, 1, 1, 2, 2, 3, 3, 4, 4])
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("threshold", [130, 175, 260])
+def test_agatston_matches_a_naive_loop(seed, threshold):
+    scan = calcified_scan(seed=seed)
+    mask = heart_mask(scan.shape)
+    scores = AgatstonScore(scan, mask, SPACING, threshold)
+    reference = naive_agatston(scan, mask, SPACING, threshold)
+
+    assert reference["lesions"] > 5
+    assert scores["lesions"] == reference["lesions"]
+    for name in ("agatston", "volume", "mass"):
+        assert scores[name] == pytest.approx(reference[name])
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_density_index_matches_scoring_at_each_threshold(seed):
+    scan = calcified_scan(seed=seed)
+    region = heart_mask(scan.shape)
+    index = DensityIndex(scan, region, SPACING)
+
+    for threshold in [130, 131, 150, 199.5, 200, 240, 333, 400, 650, 5000]:
+        scores = index.score(threshold)
+        reference = AgatstonScore(scan, region, SPACING, threshold)
+        assert scores["lesions"] == reference["lesions"]
+        for name in ("agatston", "volume", "mass"):
+            assert scores[name] == pytest.approx(reference[name], abs=1e-9)
+        assert scores["voxels"] == np.count_nonzero((region > 0) & (scan >= threshold))
+
+    with pytest.raises(ValueError):
+        index.score(120)
+
+
+def test_density_index_of_a_region_view_and_of_nothing():
+    scan = calcified_scan()
+    roi = [2, 9, 5, 40, 5, 35]
+    index = DensityIndex(scan[RegionSlices(roi)], None, SPACING)
+    reference = AgatstonScore(scan[RegionSlices(roi)], np.ones(scan[RegionSlices(roi)].shape), SPACING, 220)
+    assert index.score(220)["agatston"] == pytest.approx(reference["agatston"])
+
+    empty = DensityIndex(np.zeros((4, 5, 6), dtype=np.int16), None, SPACING)
+    assert empty.score(130) == {"agatston": 0.0, "volume": 0.0, "mass": 0.0, "lesions": 0, "voxels": 0}
+
+
+def test_lesion_table_matches_a_naive_loop():
+    scan = calcified_scan()
+    mask = ThresholdCAC(scan, 130) & heart_mask(scan.shape)
+    origin = (3, 10, 20)
+    table = LesionTable(scan, mask, SPACING, origin)
+
+    labels = label(mask > 0, connectivity=3)
+    assert len(table) == labels.max() > 5
+    for row, lesion in zip(table, range(1, labels.max() + 1)):
+        voxels = np.argwhere(labels == lesion)
+        hu = scan[labels == lesion].astype(np.float64)
+        assert row["id"] == lesion
+        assert row["voxels"] == len(voxels)
+        assert row["volume"] == pytest.approx(len(voxels) * np.prod(SPACING))
+        np.testing.assert_array_equal(row["box"], np.stack([voxels.min(axis=0), voxels.max(axis=0)], axis=1).ravel() +
+                                      np.repeat(origin, 2))
+        np.testing.assert_allclose(row["centroid"], voxels.mean(axis=0) + origin)
+        assert row["max_hu"] == hu.max()
+        assert row["mean_hu"] == pytest.approx(hu.mean())
+        assert row["weight"] == naive_weight(hu.max())
+
+
+def test_lesion_table_columns_round_trip():
+    scan = calcified_scan()
+    table = LesionTable(scan, ThresholdCAC(scan, 200), SPACING)
+    np.testing.assert_array_equal(TableFromColumns(TableColumns(table)), table)
+
+    empty = LesionTable(scan, np.zeros(scan.shape, dtype=np.uint8), SPACING)
+    assert len(empty) == 0
+    assert len(TableFromColumns(TableColumns(empty))) == 0
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from Models.Segmentation import Backends
+from Models.Segmentation.Batching import BatchScheduler
+from Models.Segmentation.Inference import Infer, upsample_mask
+from Models.Segmentation.Registry import ModelRegistry
+
+
+def random_volumes(count: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    return [rng.normal(0, 400, tuple(int(i) for i in rng.integers(10, 40, 3))).astype(np.int16)
+            for _ in range(count)]
+
+
+@pytest.mark.parametrize("mode", ["resize", "sliding"])
+def test_concurrent_predictions_keep_their_own_shape(stub_backend, mode):
+    model = Infer(model_path="stub", model_input=(8, 8, 8), mode=mode)
+    volumes = random_volumes(24)
+    expected = [model.predict(volume) for volume in volumes]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        masks = list(pool.map(model.predict, volumes))
+
+    for volume, mask, reference in zip(volumes, masks, expected):
+        assert mask.shape == volume.shape
+        assert mask.dtype == np.uint8
+        np.testing.assert_array_equal(mask, reference)
+
+
+@pytest.mark.parametrize("mode", ["resize", "sliding"])
+def test_predict_batch_matches_predict(stub_backend, mode):
+    model = Infer(model_path="stub", model_input=(8, 8, 8), mode=mode)
+    volumes = random_volumes(3, seed=1)
+
+    for volume, mask in zip(volumes, model.predict_batch(volumes)):
+        np.testing.assert_array_equal(mask, model.predict(volume))
+
+
+def test_batch_scheduler_returns_each_request_its_own_mask(stub_backend):
+    model = Infer(model_path="stub", model_input=(8, 8, 8))
+    scheduler = BatchScheduler(lambda: model, max_batch_size=4, max_wait=0.01)
+    volumes = random_volumes(12, seed=2)
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        masks = list(pool.map(scheduler.predict, volumes))
+
+    for volume, mask in zip(volumes, masks):
+        assert mask.shape == volume.shape
+        np.testing.assert_array_equal(mask, model.predict(volume))
+
+
+@pytest.mark.parametrize("output_shape", [(40, 36, 30), (12, 40, 9), (10, 9, 7)])
+def test_upsample_mask_matches_resize(output_shape):
+    # Upsampled, Mixed & Downsampled Axes, the Last Ones Anti-Aliased as in skimage's resize
+    from scipy.ndimage import gaussian_filter
+    from skimage.transform import resize
+
+    prediction = gaussian_filter(np.random.default_rng(2).random((16, 16, 12)).astype(np.float32), 1.5)
+    prediction = (prediction - prediction.min()) / (prediction.max() - prediction.min())
+    reference = np.moveaxis(resize(prediction, output_shape) >= 0.6, -1, 0)
+
+    mask = upsample_mask(prediction, output_shape, 0.6)
+    assert mask.dtype == np.uint8
+    np.testing.assert_array_equal(mask, reference)
+
+
+def test_a_failing_request_does_not_fail_its_batch(stub_backend):
+    model = Infer(model_path="stub", model_input=(8, 8, 8))
+    scheduler = BatchScheduler(lambda: model, max_batch_size=4, max_wait=1.0)
+    volumes = random_volumes(3, seed=3)
+    # A Volume Missing an Axis Fails the Forward Pass of the Whole Batch it's in
+    futures = [scheduler.submit(volume) for volume in volumes[:2]] + [scheduler.submit(np.zeros((12, 12)))]
+    futures.append(scheduler.submit(volumes[2]))
+
+    with pytest.raises(IndexError):
+        futures[2].result(timeout=5)
+    for volume, future in zip(volumes, futures[:2] + futures[3:]):
+        np.testing.assert_array_equal(future.result(timeout=5), model.predict(volume))
+    assert scheduler.report()["batch_sizes"] == {4: 1}
+
+
+def test_evicted_models_shut_down_their_pool(stub_backend, monkeypatch):
+    class SizedBackend(stub_backend):
+        def __init__(self, model_path: str, model_input: tuple, **options):
+            super().__init__(model_path, model_input, **options)
+            self.size = 10
+
+    monkeypatch.setitem(Backends.Backends, "tf", SizedBackend)
+    registry = ModelRegistry(memory_budget=15, warm_up=False)
+    first = registry.get("first", (8, 8, 8))
+    pool = first.pool
+    second = registry.get("second", (8, 8, 8))
+
+    assert registry.report()["evictions"] == 1
+    assert first.pool is None and pool._shutdown
+    assert second.pool is not None
+    # A Caller Still Holding the Evicted Model Can Use it
+    volumes = random_volumes(2, seed=4)
+    for volume, mask in zip(volumes, first.predict_batch(volumes)):
+        np.testing.assert_array_equal(mask, second.predict(volume))
@@ -0,0 +1,351 @@
+# Import Required Packages
+import hashlib
+import json
+import struct
+import zlib
+from io import BytesIO
+
+import numpy as np
+
+# Raw Array Format, Used Instead of npz Files When Both Sides Support it:
+# b"CASW" | Header Length (uint32, little endian) | JSON Header | Array Bytes, Optionally Compressed
+Magic = b"CASW"
+ContentType = "application/x-cascore-array"
+# Streamed Arrays Share The Header, Followed by One Frame Per Slab of Slices Along The First Axis:
+# Frame Length (uint32) | Slab Checksum (uint32) | Slab Bytes, Optionally Compressed
+StreamContentType = "application/x-cascore-stream"
+# Several Named Arrays in One Body, Each in The Raw Array Format:
+# b"CASB" | Header Length (uint32) | JSON List of [Name, Encoded Length] | Encoded Arrays
+BundleMagic = b"CASB"
+BundleContentType = "application/x-cascore-bundle"
+# Binary Masks as The Bounding Box of Their Foreground & Its Voxels, Bit-Packed or Run-Length Encoded:
+# b"CASM" | Header Length (uint32) | JSON Header With The Box & Encoding | Payload, Optionally Compressed
+MaskMagic = b"CASM"
+MaskContentType = "application/x-cascore-mask"
+MaskEncodings = ("packbits", "rle")
+# Names The Mask Encoding a Client Asks For With The Mask Content Type
+MaskEncodingHeader = "X-Mask-Encoding"
+CompressionHeader = "X-Compression"
+AcceptCompressionHeader = "X-Accept-Compression"
+# Refers To a Volume Already Uploaded To The Server's Volume Store, Sent in Place of The Volume
+VolumeDigestHeader = "X-Volume-Digest"
+
+
+def _Checked(Decompress):
+    """
+    lz4 & zstd Raise Their Own Errors For Corrupt Data, Raised as ValueError Like Any Other Malformed Array
+    """
+    def Checked(Data):
+        try:
+            return Decompress(Data)
+        except Exception as e:
+            raise ValueError(f"Corrupt Compressed Array: {e}") from e
+    return Checked
+
+
+def _Codecs():
+    """
+    Available Compressions, lz4 & zstd Are Optional Packages
+    """
+    Codecs = {"none": (lambda Data: Data, lambda Data: Data)}
+    try:
+        import lz4.frame
+        Codecs["lz4"] = (lambda Data: lz4.frame.compress(Data, compression_level=0),
+                         _Checked(lz4.frame.decompress))
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        Codecs["zstd"] = (lambda Data: zstandard.ZstdCompressor(level=1, threads=-1).compress(Data),
+                          _Checked(lambda Data: zstandard.ZstdDecompressor().decompress(Data)))
+    except ImportError:
+        pass
+    return Codecs
+
+
+Codecs = _Codecs()
+
+
+def AvailableCompressions():
+    return list(Codecs)
+
+
+def ChooseCompression(Supported, Preferred=("lz4", "zstd", "none")):
+    """
+    Picks The First Preferred Compression Supported By Both Sides
+    :param Supported: Compressions Supported By The Other Side
+    :param Preferred: Compressions in Order of Preference
+    :return: Name of The Compression
+    """
+    for Compression in Preferred:
+        if Compression in Supported and Compression in Codecs:
+            return Compression
+    return "none"
+
+
+def _Bytes(Array):
+    """
+    The Array's Bytes in C Order, Without a Copy When it's Contiguous. Arrays Are Flattened First as memoryview
+    Can't Cast a Shape Holding a 0
+    """
+    return memoryview(np.ascontiguousarray(Array).reshape(-1)).cast("B")
+
+
+def ArrayHasher(Dtype, Shape):
+    """
+    Incremental Content Hash of an Array, Fed The Array's Bytes in C Order, Possibly Slab by Slab
+    :return: hashlib Object, Its hexdigest is The Array's Digest
+    """
+    Hasher = hashlib.blake2b(digest_size=16)
+    Hasher.update(json.dumps([np.dtype(Dtype).str, list(Shape)]).encode())
+    return Hasher
+
+
+def ArrayDigest(Array):
+    """
+    Content Hash of an Array, Equal For Equal Arrays Whatever Format They Were Sent in
+    """
+    Hasher = ArrayHasher(Array.dtype, Array.shape)
+    Hasher.update(_Bytes(Array))
+    return Hasher.hexdigest()
+
+
+def _Header(Array, Compression, Spacing, Signature=Magic, **Extra):
+    Header = {
+        "dtype": Array.dtype.str,
+        "shape": list(Array.shape),
+        "spacing": [float(i) for i in Spacing] if Spacing is not None else None,
+        "compression": Compression,
+        **Extra
+    }
+    HeaderBytes = json.dumps(Header).encode()
+    return Signature + struct.pack("<I", len(HeaderBytes)) + HeaderBytes
+
+
+def EncodeArray(Array, Compression="none", Spacing=None):
+    """
+    Encodes an Array in The Raw Array Format
+    :param Array: NumPy Array To Encode
+    :param Compression: "none", "lz4" or "zstd"
+    :param Spacing: Optional Voxel Spacing Sent Along The Array
+    :return: Encoded Bytes
+    """
+    if Compression not in Codecs:
+        raise ValueError(f"Compression {Compression} is Not Available")
+
+    Array = np.ascontiguousarray(Array)
+    Raw = _Bytes(Array)
+    Header = _Header(Array, Compression, Spacing, checksum=zlib.crc32(Raw))
+    return b"".join([Header, Codecs[Compression][0](Raw)])
+
+
+def EncodeStream(Array, Compression="none", Spacing=None, Slab=16):
+    """
+    Encodes an Array as a Stream of Slabs Along its First Axis, Used as a Chunked Request Body So
+    The Array is Never Held Compressed as a Whole & The Server Can Start Working on The First Slabs
+    :param Array: NumPy Array To Encode
+    :param Compression: "none", "lz4" or "zstd", Applied To Each Slab
+    :param Spacing: Optional Voxel Spacing Sent Along The Array
+    :param Slab: Number of Slices in Each Frame
+    :return: Generator of Encoded Chunks, The Header Followed by One Frame Per Slab
+    """
+    if Compression not in Codecs:
+        raise ValueError(f"Compression {Compression} is Not Available")
+
+    yield _Header(Array, Compression, Spacing, slab=Slab)
+    for Start in range(0, Array.shape[0], Slab):
+        Raw = _Bytes(Array[Start:Start + Slab])
+        Frame = Codecs[Compression][0](Raw)
+        yield struct.pack("<II", len(Frame), zlib.crc32(Raw)) + bytes(Frame)
+
+
+def _ReadExactly(Stream, Size):
+    Data = bytearray()
+    while len(Data) < Size:
+        Chunk = Stream.read(Size - len(Data))
+        if not Chunk:
+            raise ValueError("Stream Ended Before The Array Was Complete")
+        Data += Chunk
+    return Data
+
+
+def ReadStreamHeader(Stream):
+    """
+    Reads Only The Header of a Streamed Array, The Slabs Are Left in The Stream For DecodeStream
+    :return: Header Dictionary
+    """
+    Start = _ReadExactly(Stream, 8)
+    if bytes(Start[:4]) != Magic:
+        raise ValueError("Not a Raw Array")
+    return json.loads(bytes(_ReadExactly(Stream, struct.unpack("<I", Start[4:8])[0])))
+
+
+def DecodeStream(Stream, OnSlab=None, Header=None):
+    """
+    Decodes a Streamed Array While it's Read, Each Slab is Written Straight Into a Preallocated Array
+    :param Stream: File Like Object The Encoded Stream is Read From
+    :param OnSlab: Called With The Array & The Range of Slices Once Each Slab is Decoded
+    :param Header: The Stream's Header if it Was Already Read With ReadStreamHeader
+    :return: NumPy Array, Voxel Spacing or None
+    """
+    Header = Header or ReadStreamHeader(Stream)
+
+    Array = np.empty(Header["shape"], dtype=np.dtype(Header["dtype"]))
+    Decompress = Codecs[Header["compression"]][1]
+    for First in range(0, Array.shape[0], Header["slab"]):
+        Length, Checksum = struct.unpack("<II", _ReadExactly(Stream, 8))
+        Raw = Decompress(_ReadExactly(Stream, Length))
+        if zlib.crc32(Raw) != Checksum:
+            raise ValueError("Array Checksum Mismatch")
+        Last = min(First + Header["slab"], Array.shape[0])
+        Array[First:Last] = np.frombuffer(Raw, dtype=Array.dtype).reshape(Array[First:Last].shape)
+        if OnSlab:
+            OnSlab(Array, First, Last)
+    return Array, Header["spacing"]
+
+
+def DecodeHeader(Data, Signature=Magic):
+    """
+    Reads The Header of an Encoded Array Without Touching The Array Bytes
+    :param Data: Encoded Bytes, or at Least Their Beginning
+    :param Signature: Magic Bytes Expected at The Start, MaskMagic For Encoded Masks
+    :return: Header Dictionary, Offset of The Array Bytes
+    """
+    if bytes(Data[:4]) != Signature:
+        raise ValueError("Not a Raw Array" if Signature == Magic else "Not an Encoded Mask")
+    Length = struct.unpack("<I", bytes(Data[4:8]))[0]
+    return json.loads(bytes(Data[8:8 + Length])), 8 + Length
+
+
+def DecodeArray(Data):
+    """
+    Decodes an Array in The Raw Array Format, Uncompressed Arrays Share Memory With The Given Bytes
+    :param Data: Encoded Bytes
+    :return: NumPy Array, Voxel Spacing or None
+    """
+    Header, Offset = DecodeHeader(Data)
+    Raw = Codecs[Header["compression"]][1](memoryview(Data)[Offset:])
+    if zlib.crc32(Raw) != Header["checksum"]:
+        raise ValueError("Array Checksum Mismatch")
+    Array = np.frombuffer(Raw, dtype=np.dtype(Header["dtype"])).reshape(Header["shape"])
+    return Array, Header["spacing"]
+
+
+def EncodeBundle(Arrays, Compression="none"):
+    """
+    Encodes Several Named Arrays in One Body, e.g. The Sampled Slices of Each View
+    :param Arrays: Dictionary of Name -> NumPy Array, Shapes & Types Can Differ
+    :param Compression: "none", "lz4" or "zstd", Applied To Each Array
+    :return: Encoded Bytes
+    """
+    Parts = [EncodeArray(Array, Compression) for Array in Arrays.values()]
+    Header = json.dumps([[Name, len(Part)] for Name, Part in zip(Arrays, Parts)]).encode()
+    return b"".join([BundleMagic, struct.pack("<I", len(Header)), Header, *Parts])
+
+
+def DecodeBundle(Data):
+    """
+    Decodes Arrays Encoded With EncodeBundle
+    :return: Dictionary of Name -> NumPy Array
+    """
+    if bytes(Data[:4]) != BundleMagic:
+        raise ValueError("Not an Array Bundle")
+    Length = struct.unpack("<I", bytes(Data[4:8]))[0]
+    Offset = 8 + Length
+    Arrays = {}
+    for Name, Size in json.loads(bytes(Data[8:Offset])):
+        Arrays[Name] = DecodeArray(memoryview(Data)[Offset:Offset + Size])[0]
+        Offset += Size
+    return Arrays
+
+
+def MaskBoundingBox(Mask):
+    """
+    :return: [Start, Stop] of The Mask's Foreground Along Each Axis, None For an Empty Mask
+    """
+    # The Other Axes Are Only Scanned Within The Slices Containing Foreground
+    Slices = np.flatnonzero(Mask.reshape(Mask.shape[0], -1).any(axis=1))
+    if not len(Slices):
+        return None
+    Box = [[int(Slices[0]), int(Slices[-1]) + 1]]
+    Projection = Mask[Box[0][0]:Box[0][1]].any(axis=0)
+    for Axis in range(Projection.ndim):
+        Any = np.flatnonzero(Projection.any(axis=tuple(i for i in range(Projection.ndim) if i != Axis)))
+        Box.append([int(Any[0]), int(Any[-1]) + 1])
+    return Box
+
+
+def EncodeMask(Mask, Encoding="packbits", Compression="none", Spacing=None):
+    """
+    Encodes a Binary Mask as The Bounding Box of its Foreground & The Voxels Inside it, Nonzero Voxels Are Sent
+    as 1. The Heart Fills a Small Part of The Scan & Calcifications Far Less, So This is a Fraction of The Mask
+    :param Mask: NumPy Array of The Mask
+    :param Encoding: "packbits" Sends 1 Bit Per Voxel of The Box, "rle" The Lengths of Alternating Runs of 0
+                     & 1 Starting With 0, as uint32
+    :param Compression: "none", "lz4" or "zstd", Applied To The Payload
+    :param Spacing: Optional Voxel Spacing Sent Along The Mask
+    :return: Encoded Bytes
+    """
+    if Encoding not in MaskEncodings:
+        raise ValueError(f"Unknown Mask Encoding {Encoding}")
+    if Compression not in Codecs:
+        raise ValueError(f"Compression {Compression} is Not Available")
+
+    Box = MaskBoundingBox(Mask)
+    Voxels = Mask[tuple(slice(*Range) for Range in Box)].ravel() != 0 if Box else np.zeros(0, dtype=bool)
+    if Encoding == "packbits":
+        Payload = np.packbits(Voxels)
+    else:
+        Changes = np.flatnonzero(Voxels[1:] != Voxels[:-1]) + 1
+        Boundaries = np.concatenate([[0], Changes, [Voxels.size]])
+        Payload = np.diff(Boundaries).astype("<u4")
+        if Voxels.size and Voxels[0]:
+            Payload = np.concatenate([np.zeros(1, dtype="<u4"), Payload])
+
+    Raw = memoryview(Payload).cast("B")
+    # The Header Describes The Decoded uint8 Mask, Described Here by a View Without Copying The Mask
+    Header = _Header(np.broadcast_to(np.uint8(0), Mask.shape), Compression, Spacing, MaskMagic, box=Box,
+                     encoding=Encoding, checksum=zlib.crc32(Raw))
+    return b"".join([Header, Codecs[Compression][0](Raw)])
+
+
+def DecodeMask(Data):
+    """
+    Decodes a Mask Encoded With EncodeMask
+    :param Data: Encoded Bytes
+    :return: uint8 NumPy Array of 0 & 1 With The Mask's Full Shape, Voxel Spacing or None
+    """
+    Header, Offset = DecodeHeader(Data, MaskMagic)
+    Raw = Codecs[Header["compression"]][1](memoryview(Data)[Offset:])
+    if zlib.crc32(Raw) != Header["checksum"]:
+        raise ValueError("Mask Checksum Mismatch")
+
+    Mask = np.zeros(Header["shape"], dtype=np.uint8)
+    if Header["box"]:
+        Box = tuple(slice(*Range) for Range in Header["box"])
+        Shape = tuple(Range.stop - Range.start for Range in Box)
+        if Header["encoding"] == "packbits":
+            Voxels = np.unpackbits(np.frombuffer(Raw, dtype=np.uint8), count=int(np.prod(Shape)))
+        else:
+            Runs = np.frombuffer(Raw, dtype="<u4")
+            Voxels = np.repeat((np.arange(len(Runs)) & 1).astype(np.uint8), Runs)
+        Mask[Box] = Voxels.reshape(Shape)
+    return Mask, Header["spacing"]
+
+
+def ReadArrayResponse(Content, ResponseContentType, Key):
+    """
+    Reads an Array From a Server Response in The Raw Array Format, The Mask Format or an npz File
+    :param Content: Response Body
+    :param ResponseContentType: Content-Type Header of The Response
+    :param Key: Name of The Array in The npz File
+    :return: NumPy Array
+    """
+    if (ResponseContentType or "").startswith(ContentType):
+        return DecodeArray(Content)[0]
+    if (ResponseContentType or "").startswith(MaskContentType):
+        return DecodeMask(Content)[0]
+    Data = np.load(BytesIO(Content))
+    Array = np.copy(Data[Key])
+    Data.close()
+    return Array
@@ -1,6 +1,11 @@
 # Import Required Packages
+import logging
+
 import numpy as np
 
+# Names of The Sampled Slice Stacks, in The Order Returned by GetSampleSlices
+SliceNames = ("Ax", "Sag", "Cor")
+
 
 def find_roi_2D(s):
     """
@@ -52,18 +57,32 @@ def get_coords(Slices: list):
     return [min(x1), max(x2), min(y1), max(y2)]
 
 
+def GetSampleSlices(VolumeArray):
+    """
+    Extracts The 3 Middle Slices From Each View, Used in Partial Segmentation & Cropping
+    :param VolumeArray: Volume of Shape (Z, X, Y)
+    :return: List of 3 Arrays of Shape (3, ., .) Containing The Axial, Sagittal & Coronal Slices
+    """
+    Slices = []
+    for Axis, View in enumerate(["Axial", "Sagittal", "Coronal"]):
+        Mid = int(VolumeArray.shape[Axis] / 2)
+        logging.info(f"Preparing {View} Slices Number {Mid - 1}, {Mid}, {Mid + 1}")
+        Slices.append(np.stack([np.take(VolumeArray, Mid + j, axis=Axis) for j in range(-1, 2)]))
+    return Slices
+
+
 def GetCoords(Segmentation, Partial=True):
     """
     Get Cropping Directions In The 3 Planes For The Given Segmentation of Shape (Z, X, Y)
     """
     if Partial:
+        # Each View is a Stack of 3 Slices, Local Predictions Wrap it in a List
+        Views = [np.asarray(View[0] if isinstance(View, list) else View) for View in Segmentation]
+
         # Get Coordinates For Each View
-        AxCoor = [int(i) for i in
-                  get_coords([Segmentation[0][0][0, :, :], Segmentation[0][0][1, :, :], Segmentation[0][0][2, :, :]])]
-        SagCoor = [int(i) for i in
-                   get_coords([Segmentation[1][0][0, :, :], Segmentation[1][0][1, :, :], Segmentation[1][0][2, :, :]])]
-        CorCoor = [int(i) for i in
-                   get_coords([Segmentation[2][0][0, :, :], Segmentation[2][0][1, :, :], Segmentation[2][0][2, :, :]])]
+        AxCoor = [int(i) for i in get_coords([Views[0][0, :, :], Views[0][1, :, :], Views[0][2, :, :]])]
+        SagCoor = [int(i) for i in get_coords([Views[1][0, :, :], Views[1][1, :, :], Views[1][2, :, :]])]
+        CorCoor = [int(i) for i in get_coords([Views[2][0, :, :], Views[2][1, :, :], Views[2][2, :, :]])]
         CoordinatesList = [AxCoor, SagCoor, CorCoor]
 
         # Determine Correct Cropping Coordinates For Each Dimension
@@ -0,0 +1,159 @@
+import struct
+import zlib
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from Models import Wire
+
+
+def RandomVolume(Shape=(21, 17, 13), Dtype=np.int16, Seed=0):
+    return np.random.default_rng(Seed).normal(0, 400, Shape).astype(Dtype)
+
+
+def RandomMask(Shape=(21, 17, 13), Seed=0):
+    Mask = np.zeros(Shape, dtype=np.uint8)
+    Rng = np.random.default_rng(Seed)
+    Mask[4:15, 3:12, 2:10] = Rng.random((11, 9, 8)) > 0.6
+    return Mask
+
+
+@pytest.mark.parametrize("Compression", Wire.AvailableCompressions())
+@pytest.mark.parametrize("Dtype", [np.int16, np.float32, np.uint8])
+def test_array_round_trip(Compression, Dtype):
+    Array = RandomVolume(Dtype=Dtype)
+    Decoded, Spacing = Wire.DecodeArray(Wire.EncodeArray(Array, Compression, (0.7, 0.7, 3)))
+    assert Decoded.dtype == Array.dtype
+    np.testing.assert_array_equal(Decoded, Array)
+    assert Spacing == [0.7, 0.7, 3.0]
+
+
+def test_array_of_a_view_is_encoded_in_c_order():
+    Array = RandomVolume()[::2, :, ::-1]
+    np.testing.assert_array_equal(Wire.DecodeArray(Wire.EncodeArray(Array))[0], Array)
+
+
+@pytest.mark.parametrize("Compression", Wire.AvailableCompressions())
+def test_corrupted_array_is_refused(Compression):
+    Data = bytearray(Wire.EncodeArray(RandomVolume(), Compression))
+    Data[-1] ^= 0xFF
+    # Compressed Arrays May Fail To Decompress Before Their Checksum is Checked
+    with pytest.raises(ValueError):
+        Wire.DecodeArray(bytes(Data))
+    with pytest.raises(ValueError, match="Not a Raw Array"):
+        Wire.DecodeArray(b"NOPE" + bytes(Data[4:]))
+
+
+def test_unavailable_compression_is_refused():
+    with pytest.raises(ValueError):
+        Wire.EncodeArray(RandomVolume(), "brotli")
+
+
+@pytest.mark.parametrize("Compression", Wire.AvailableCompressions())
+@pytest.mark.parametrize("Slab", [1, 4, 16, 64])
+def test_stream_round_trip(Compression, Slab):
+    Array = RandomVolume()
+    Body = BytesIO(b"".join(Wire.EncodeStream(Array, Compression, (0.5, 0.5, 1), Slab)))
+    Ranges = []
+
+    Decoded, Spacing = Wire.DecodeStream(Body, lambda Volume, First, Last: Ranges.append((First, Last)))
+    np.testing.assert_array_equal(Decoded, Array)
+    assert Spacing == [0.5, 0.5, 1.0]
+    # Slabs Arrive in Order & Cover Every Slice Once
+    assert [First for First, _ in Ranges] == list(range(0, Array.shape[0], Slab))
+    assert Ranges[-1][1] == Array.shape[0]
+
+
+def test_stream_header_is_read_separately():
+    Array = RandomVolume()
+    Body = BytesIO(b"".join(Wire.EncodeStream(Array, Slab=8)))
+    Header = Wire.ReadStreamHeader(Body)
+    assert Header["shape"] == list(Array.shape) and Header["slab"] == 8
+    np.testing.assert_array_equal(Wire.DecodeStream(Body, Header=Header)[0], Array)
+
+
+def test_truncated_or_corrupted_stream_is_refused():
+    Chunks = list(Wire.EncodeStream(RandomVolume(), Slab=8))
+    with pytest.raises(ValueError, match="Stream Ended"):
+        Wire.DecodeStream(BytesIO(b"".join(Chunks)[:-10]))
+
+    Length, Checksum = struct.unpack("<II", Chunks[1][:8])
+    Chunks[1] = struct.pack("<II", Length, Checksum ^ 1) + Chunks[1][8:]
+    with pytest.raises(ValueError, match="Checksum"):
+        Wire.DecodeStream(BytesIO(b"".join(Chunks)))
+
+
+def test_digest_is_the_same_slab_by_slab():
+    Array = RandomVolume()
+    Hasher = Wire.ArrayHasher(Array.dtype, Array.shape)
+    for Start in range(0, Array.shape[0], 5):
+        Hasher.update(memoryview(Array[Start:Start + 5]).cast("B"))
+    assert Hasher.hexdigest() == Wire.ArrayDigest(Array)
+    # The Type & Shape Are Part of The Digest
+    assert Wire.ArrayDigest(Array) != Wire.ArrayDigest(Array.reshape(Array.shape[0], -1))
+    assert Wire.ArrayDigest(Array) != Wire.ArrayDigest(Array.view(np.uint16))
+
+
+def test_bundle_round_trip():
+    Arrays = {"axial": RandomVolume((3, 8, 8)), "sagittal": RandomVolume((2, 5, 9), np.float32, 1),
+              "empty": np.zeros((0, 4), dtype=np.uint8)}
+    Decoded = Wire.DecodeBundle(Wire.EncodeBundle(Arrays, Wire.AvailableCompressions()[-1]))
+    assert list(Decoded) == list(Arrays)
+    for Name, Array in Arrays.items():
+        assert Decoded[Name].dtype == Array.dtype
+        np.testing.assert_array_equal(Decoded[Name], Array)
+
+
+@pytest.mark.parametrize("Encoding", Wire.MaskEncodings)
+@pytest.mark.parametrize("Compression", Wire.AvailableCompressions())
+def test_mask_round_trip(Encoding, Compression):
+    Mask = RandomMask()
+    Decoded, Spacing = Wire.DecodeMask(Wire.EncodeMask(Mask, Encoding, Compression, (1, 1, 2)))
+    assert Decoded.dtype == np.uint8
+    np.testing.assert_array_equal(Decoded, Mask)
+    assert Spacing == [1.0, 1.0, 2.0]
+
+
+@pytest.mark.parametrize("Encoding", Wire.MaskEncodings)
+def test_mask_edge_cases_round_trip(Encoding):
+    # Empty, Full, Foreground Touching Every Edge & Nonzero Values Other Than 1
+    Corners = np.zeros((5, 6, 7), dtype=np.uint8)
+    Corners[0, 0, 0] = Corners[-1, -1, -1] = 1
+    Values = RandomMask().astype(np.int16) * 7
+    for Mask in [np.zeros((5, 6, 7), dtype=np.uint8), np.ones((5, 6, 7), dtype=bool), Corners, Values]:
+        Decoded = Wire.DecodeMask(Wire.EncodeMask(Mask, Encoding))[0]
+        np.testing.assert_array_equal(Decoded, Mask != 0)
+
+
+def test_mask_box_is_the_foreground_box():
+    Mask = RandomMask()
+    Box = Wire.MaskBoundingBox(Mask)
+    Nonzero = np.nonzero(Mask)
+    assert Box == [[int(Axis.min()), int(Axis.max()) + 1] for Axis in Nonzero]
+    assert Wire.MaskBoundingBox(np.zeros((3, 3, 3))) is None
+
+
+def test_corrupted_mask_is_refused():
+    Data = bytearray(Wire.EncodeMask(RandomMask()))
+    Data[-1] ^= 0xFF
+    with pytest.raises(ValueError, match="Checksum"):
+        Wire.DecodeMask(bytes(Data))
+    with pytest.raises(ValueError, match="Not an Encoded Mask"):
+        Wire.DecodeMask(Wire.EncodeArray(RandomMask()))
+
+
+def test_response_is_read_in_every_format():
+    Mask = RandomMask()
+    Npz = BytesIO()
+    np.savez_compressed(Npz, Segmentation=Mask)
+    for Content, Type in [(Wire.EncodeArray(Mask), Wire.ContentType),
+                          (Wire.EncodeMask(Mask), Wire.MaskContentType + "; charset=binary"),
+                          (Npz.getvalue(), "application/octet-stream")]:
+        np.testing.assert_array_equal(Wire.ReadArrayResponse(Content, Type, "Segmentation"), Mask)
+
+
+def test_checksum_covers_the_uncompressed_bytes():
+    Array = RandomVolume()
+    Header, _ = Wire.DecodeHeader(Wire.EncodeArray(Array, Wire.AvailableCompressions()[-1]))
+    assert Header["checksum"] == zlib.crc32(Array.tobytes())
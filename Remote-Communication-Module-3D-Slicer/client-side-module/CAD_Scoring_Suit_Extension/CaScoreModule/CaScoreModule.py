@@ -13,7 +13,6 @@ from requests.exceptions import ConnectionError
 import slicer
 import vtk
 import qt
-from PIL import Image
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin, pip_install
 from Processes import Process, ProcessesLogic
@@ -30,8 +29,11 @@ RepoRoot = os.path.dirname(
 
 sys.path.append(RepoRoot)
 
-from Models.crop_roi import get_coords, GetCoords
-from Models.Segmentation.CAC import ThresholdCAC, QuantifyCAC
+from Models.crop_roi import GetCoords, GetSampleSlices
+from Models.Segmentation.CAC import ThresholdCAC, QuantifyCAC, AgatstonScore, LesionTable, DensityIndex, \
+    ScoringRegion, CandidateVolume, AsMask, BoundingBox, RegionSlices, FullMask
+from Models.Wire import ChooseCompression, DecodeMask
+from Models.Client import PostVolume, RunJob, StoreVolume, SegmentSlices, CropCoordinates, ScoreVolume
 
 
 #
@@ -189,10 +191,14 @@ class CaScoreModuleWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.SegAndCrop.toggled.connect(self.updateParameterNodeFromGUI)
         self.ui.UseProcesses.toggled.connect(self.updateParameterNodeFromGUI)
         self.ui.DeepCal.toggled.connect(self.updateParameterNodeFromGUI)
+        self.ui.ThresholdSlider.connect("valueChanged(double)", self.updateParameterNodeFromGUI)
 
         # Buttons
         self.ui.applyButton.connect('clicked(bool)', self.onApplyButton)
 
+        # Sliders
+        self.ui.ThresholdSlider.connect("valueChanged(double)", self.onThresholdChanged)
+
         # Radio Boxes
         self.ui.OnlineProcessingRadio.toggled.connect(self.ProcessingLocationSelect)
         self.ui.LocalProcessingRadio.toggled.connect(self.ProcessingLocationSelect)
@@ -315,6 +321,7 @@ class CaScoreModuleWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self.ui.SegAndCrop.checked = strtobool(self._parameterNode.GetParameter("SegAndCrop"))
 
         self.ui.UseProcesses.checked = strtobool(self._parameterNode.GetParameter("UseProcesses"))
+        self.ui.ThresholdSlider.value = float(self._parameterNode.GetParameter("Threshold"))
 
         # Update buttons states and tooltips
         if self._parameterNode.GetNodeReference("InputVolume"):
@@ -356,6 +363,7 @@ class CaScoreModuleWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self._parameterNode.SetParameter("CalModelPath", self.ui.CalModelPath.currentPath)
         self._parameterNode.SetParameter("UseProcesses", "true" if self.ui.UseProcesses.checked else "false")
         self._parameterNode.SetParameter("DeepCal", "true" if self.ui.DeepCal.checked else "false")
+        self._parameterNode.SetParameter("Threshold", str(self.ui.ThresholdSlider.value))
 
         self._parameterNode.EndModify(wasModified)
 
@@ -490,6 +498,10 @@ class CaScoreModuleWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.Results.setEnabled(True)
         self.ui.Results.collapsed = False
 
+        # The Slider Sets The Next Run's Threshold & Rescores Thresholded Calcifications of This One
+        self.ui.ThresholdLabel.setEnabled(True)
+        self.ui.ThresholdSlider.setEnabled(True)
+
     def ProcessingStarted(self):
         """
         Updates UI Elements To A Suitable State Before The Start of The Modules Operations
@@ -533,6 +545,16 @@ class CaScoreModuleWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.TotalTimeLabel.setEnabled(False)
         self.ui.TotalTime.setEnabled(False)
         self.ui.TotalTime.text = ""
+        self.ui.ThresholdLabel.setEnabled(False)
+        self.ui.ThresholdSlider.setEnabled(False)
+
+    def onThresholdChanged(self, Threshold):
+        """
+        Rescores The Thresholded Calcifications of The Last Run at The Slider's Threshold, Before a Run The
+        Slider Only Sets The Threshold
+        """
+        if self.ui.ThresholdSlider.enabled and self.logic.ScoreIndex is not None:
+            self.ui.CalVol.text = self.logic.Rescore(Threshold)
 
     def onApplyButton(self):
         """
@@ -570,7 +592,9 @@ class Signals(qt.QObject):
 # Processes Classes
 class SegmentationProcess(Process):
 
-    def __init__(self, scriptPath, VolumeArray, Local, ServerURL, Routes, Partial, ModelPath, Shape=None):
+    def __init__(self, scriptPath, VolumeArray, Local, ServerURL, Routes, Partial, ModelPath, Shape=None,
+                 WireFormat="npz", Compression="none", UseJobs=False, UseStore=False, SliceFormat="png",
+                 MaskEncoding=None):
         Process.__init__(self, scriptPath)
         self.VolumeArray = VolumeArray  # Numpy array, to use as input for the model.
         self.ModelPath = ModelPath  # Path to the TF model you'd like to load, as TF Models are not picklable.
@@ -579,6 +603,12 @@ class SegmentationProcess(Process):
         self.Partial = Partial
         self.Routes = Routes
         self.Shape = Shape
+        self.WireFormat = WireFormat
+        self.Compression = Compression
+        self.UseJobs = UseJobs
+        self.UseStore = UseStore
+        self.SliceFormat = SliceFormat
+        self.MaskEncoding = MaskEncoding
         self.Name = f"Segmentation-{os.path.basename(ModelPath)}"
         self.Output = None
         self.Segmentation = None
@@ -592,7 +622,13 @@ class SegmentationProcess(Process):
             'ServerURL': self.ServerURL,
             'Partial': self.Partial,
             'Routes': self.Routes,
-            'Shape': self.Shape
+            'Shape': self.Shape,
+            'WireFormat': self.WireFormat,
+            'Compression': self.Compression,
+            'UseJobs': self.UseJobs,
+            'UseStore': self.UseStore,
+            'SliceFormat': self.SliceFormat,
+            'MaskEncoding': self.MaskEncoding
         }
         with open('data.pkl', 'wb') as f:
             pickle.dump(InputData, f)
@@ -600,6 +636,9 @@ class SegmentationProcess(Process):
     def useProcessOutput(self, processOutput):
         output = pickle.loads(processOutput)
         os.remove('data.pkl')
+        # Whole Volume Masks Are Bit-Packed by The Process Script
+        if isinstance(output.get("Segmentation"), bytes):
+            output["Segmentation"] = DecodeMask(output["Segmentation"])[0]
         self.Output = output
 
 
@@ -647,12 +686,14 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         self.VolumeArray = None
         self.InputVolumeNode = None
         self.DependenciesChecked = False
+        self.ScoringDependenciesChecked = False
         self.CroppingDone = None
         self.HeartSegmentationProcess = None
         self.SegAndCropTime = None
         self.CalSegNodeDone = None
         self.CalTime = None
         self.CalSegDone = None
+        self.CalScoringDone = None
         self.VolumeName = None
         self.Calcifications = None
         self.DeepCal = None
@@ -660,14 +701,26 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         self.CalcificationsMasked = None
         self.HeartSegRoutes = {
             'Partial': "/segment/slices",
-            'Volume': "/segment/volume"
+            'Volume': "/segment/volume",
+            'Task': "heart"
         }
         self.CalSegRoutes = {
             'Partial': "",
-            'Volume': "/calcifications/volume"
+            'Volume': "/calcifications/volume",
+            'Task': "calcifications"
         }
         self.CalVolume = None
+        self.Scores = None
+        self.LesionTable = None
+        self.ScoreIndex = None
         self.VoxelSpacing = None
+        self.WireFormat = "npz"
+        self.WireCompression = "none"
+        self.UseJobs = False
+        self.UseStore = False
+        self.SliceFormat = "png"
+        self.MaskEncoding = None
+        self.UsePipeline = False
 
     def setDefaultParameters(self, parameterNode):
         """
@@ -689,6 +742,8 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
             parameterNode.SetParameter("UseProcesses", "true")
         if not parameterNode.GetParameter("DeepCal"):
             parameterNode.SetParameter("DeepCal", "true")
+        if not parameterNode.GetParameter("Threshold"):
+            parameterNode.SetParameter("Threshold", "160")
 
     def processOld(self, inputVolume, outputVolume, imageThreshold, invert=False, showResult=True):
         """
@@ -757,13 +812,23 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         self.CalSegNodeDone = None
         self.CalTime = None
         self.CalSegDone = None
+        self.CalScoringDone = None
         self.VolumeName = None
         self.Calcifications = None
         self.UseProcesses = True
         self.DeepCal = None
         self.CalcificationsMasked = None
         self.CalVolume = None
+        self.Scores = None
+        self.LesionTable = None
         self.VoxelSpacing = None
+        self.WireFormat = "npz"
+        self.WireCompression = "none"
+        self.UseJobs = False
+        self.UseStore = False
+        self.SliceFormat = "png"
+        self.MaskEncoding = None
+        self.UsePipeline = False
 
     def SetParametersFromNode(self, InputVolumeNode, parameterNode):
         """
@@ -793,6 +858,7 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         self.CoordinatesCalculated = False
         self.CroppingDone = False
         self.CalSegDone = False
+        self.CalScoringDone = False
         self.CalSegNodeDone = False
         self.Local = bool(strtobool(parameterNode.GetParameter("Local")))
         self.Partial = bool(strtobool(parameterNode.GetParameter("Partial")))
@@ -804,6 +870,8 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         self.SegAndCrop = bool(strtobool(parameterNode.GetParameter("SegAndCrop")))
         self.UseProcesses = bool(strtobool(parameterNode.GetParameter("UseProcesses")))
         self.DeepCal = bool(strtobool(parameterNode.GetParameter("DeepCal")))
+        self.Threshold = float(parameterNode.GetParameter("Threshold"))
+        self.ScoreIndex = None
         self.HeartModelPath = parameterNode.GetParameter("HeartModelPath")
         self.CalModelPath = parameterNode.GetParameter("CalModelPath")
         self.ServerURL = parameterNode.GetParameter("URL")
@@ -854,8 +922,108 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
                 print('Couldn\'t Connect To The Server')
                 slicer.util.errorDisplay("Couldn't Connect To The Server")
                 raise ValueError("Couldn't Connect To The Server")
+            self.NegotiateWireFormat()
+            self.UseJobs = self.ServerSupports("/jobs")
+            self.UseStore = self.ServerSupports("/volumes")
+            self.UsePipeline = self.ServerSupports("/cascore")
+
+        # The Server Runs The Whole Chain When The Score is Wanted From The Fully Segmented Heart
+        if not self.Local and self.UsePipeline and self.CalSegNode and not (self.Partial or self.SegAndCrop):
+            self.ScoreOnServer()
+        else:
+            self.RunOperations()
 
-        self.RunOperations()
+    def ScoreOnServer(self):
+        """
+        Runs The Selected Operations in One Request To The Server's /cascore Route, The Volume is Sent Once & The
+        Server Returns The Calcifications Volume, The Cropping Coordinates & The Masks To Display
+        """
+        try:
+            self.UpdateCallback(1, "Sending Volume To The Server")
+            Start = time.time()
+            # Thresholded Calcifications Are Indexed For Rescoring Inside The Heart, Which is Needed Then
+            Masks = ["calcifications"] + (["heart"] if self.HeartSegNode or not self.DeepCal else [])
+            Digest = StoreVolume(self.ServerURL, self.VolumeArray, self.WireFormat,
+                                 self.WireCompression) if self.UseStore else None
+            Result = ScoreVolume(self.ServerURL, self.VolumeArray, self.VoxelSpacing, self.WireFormat,
+                                 self.WireCompression, "deep" if self.DeepCal else "threshold", self.CroppingEnabled,
+                                 Masks, self.MaskEncoding or "rle", self.Threshold, Digest, Table=True)
+            self.SegmentationTime = time.time() - Start
+            self.UpdateCallback(1, "Completed in {0:.2f} Seconds".format(self.SegmentationTime))
+            self.UpdateCallback(3, "Completed in {0:.2f} Seconds".format(self.SegmentationTime))
+
+            # The Masks Are Returned in The Cropped Volume's Frame
+            if Result["coordinates"]:
+                self.Coordinates = Result["coordinates"]
+                self.NewVolume = self.CropVolume(Volume=self.VolumeArray, Coordinates=self.Coordinates)
+                slicer.util.updateVolumeFromArray(self.InputVolumeNode, self.NewVolume)
+                self.UpdateCallback(2, f"Cropped Volume Z->{self.Coordinates[0]}:{self.Coordinates[1]}, "
+                                       f"X->{self.Coordinates[2]}:{self.Coordinates[3]}, "
+                                       f"Y->{self.Coordinates[4]}:{self.Coordinates[5]}")
+
+            VizStart = time.time()
+            if self.HeartSegNode:
+                self.Segmentation = Result["masks"]["heart"]
+                self.CreateSegmentationNode(self.Segmentation, f'{self.VolumeName}-Heart', self.VolumeIJKToRAS,
+                                            self.HeartSeg3D)
+            self.CalcificationsMasked = Result["masks"]["calcifications"]
+            self.CalVolume = Result["score"]
+            self.Scores = Result.get("scores")
+            self.LesionTable = Result.get("table")
+            self.CreateSegmentationNode(self.CalcificationsMasked, f'{self.VolumeName}-CalcificationsMasked',
+                                        self.VolumeIJKToRAS, self.CalSeg3D)
+            if self.LesionTable is not None:
+                self.CreateLesionTableNode(self.LesionTable, f'{self.VolumeName}-Lesions')
+            if not self.DeepCal:
+                # The Server Counts The Heart's Candidates in The Cropped Volume, Which is The Heart's Box
+                Heart = Result["masks"]["heart"]
+                Region = Heart if Result["coordinates"] else ScoringRegion(Heart)
+                self.ScoreIndex = DensityIndex(self.NewVolume if Result["coordinates"] else self.VolumeArray,
+                                               Region, self.VoxelSpacing)
+            self.UpdateCallback(4, "Visualization Completed in {0:.2f} Seconds".format(time.time() - VizStart))
+            self.UpdateCallback(5, self.ScoresText())
+
+        except Exception as e:
+            slicer.util.errorDisplay("Failed to compute results: " + str(e))
+            import traceback
+            traceback.print_exc()
+
+        self.FinishedCallback()
+        self.SetDefaultClassVariables()
+
+    def NegotiateWireFormat(self):
+        """
+        Asks The Server Which Transfer Formats it Supports, Volumes Are Then Streamed or Sent as Raw Arrays With
+        The Fastest Common Compression, Servers Without These Formats Keep Receiving npz Files
+        """
+        self.WireFormat = "npz"
+        self.WireCompression = "none"
+        try:
+            Formats = requests.get(self.ServerURL + "/wire").json()
+        except (ConnectionError, ValueError):
+            return
+        # Streamed Volumes Are Preprocessed by The Server While They're Uploaded
+        Supported = [Format for Format in ("stream", "raw") if Format in Formats.get("formats", [])]
+        if Supported:
+            self.WireFormat = Supported[0]
+            self.WireCompression = ChooseCompression(Formats.get("compressions", []))
+        # Sampled Slices Are Sent as One Bundle of int16 Arrays Instead of 9 PNG Files
+        self.SliceFormat = "bundle" if "bundle" in Formats.get("formats", []) else "png"
+        # Masks Are Received as Their Bounding Box & Run Lengths, a Fraction of The Dense Mask
+        self.MaskEncoding = "rle" if "rle" in Formats.get("mask_encodings", []) else None
+        logging.info(f"Sending Volumes as {self.WireFormat}, Slices as {self.SliceFormat}, "
+                     f"Compression: {self.WireCompression}, Mask Encoding: {self.MaskEncoding}")
+
+    def ServerSupports(self, Route):
+        """
+        Checks Whether The Server Has The Given Route, "/jobs" Runs Volumes as Background Jobs That Are Polled
+        Instead of Holding a Connection Open, "/volumes" Stores Volumes So Known Ones Aren't Uploaded Again,
+        "/cascore" Runs The Whole Scoring Chain on The Server
+        """
+        try:
+            return requests.get(self.ServerURL + Route).ok
+        except ConnectionError:
+            return False
 
     def RunOperations(self):
         """
@@ -871,7 +1039,10 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
             # CLI Tests End
 
             self.UpdateCallback(1, "Checking Segmentation Dependencies")
-            # Check For Dependencies & Install Missing Ones
+            # Check For Dependencies & Install Missing Ones, Calcifications Are Scored Here Whatever The Mode
+            if not self.ScoringDependenciesChecked:
+                self.CheckScoringDependencies()
+                self.ScoringDependenciesChecked = True
             if self.Local and not self.DependenciesChecked:
                 self.CheckDependencies()
                 self.DependenciesChecked = True
@@ -884,16 +1055,17 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
                     self.UpdateCallback(1, "Sending Slices To The Server")
                     if self.UseProcesses:
                         self.SegmentationProcessWrapper("SegAndCrop.slicer.py", self.SegAndCropCompleted,
-                                                        self.VolumeArray,
-                                                        self.Local, self.ServerURL, self.Partial, self.HeartModelPath)
+                                                        self.VolumeArray, Local=self.Local, ServerURL=self.ServerURL,
+                                                        Partial=self.Partial, HeartModelPath=self.HeartModelPath)
                     else:
                         Start = time.time()
                         self.Coordinates = self.SegmentAndCrop(self.VolumeArray, self.Local, self.ServerURL,
-                                                               self.HeartModelPath)
+                                                               self.HeartModelPath, self.SliceFormat,
+                                                               self.WireCompression)
                         self.SegAndCropTime = time.time() - Start
                         self.SegAndCropDone = True
                 elif (self.HeartSegNode or self.CroppingEnabled) and not self.HeartSegDone and \
-                        (self.DependenciesChecked == self.Local):
+                        (self.DependenciesChecked or not self.Local):
                     # Get The Segmentation
                     if self.Local:
                         self.UpdateCallback(1, "Segmenting Locally")
@@ -908,7 +1080,10 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
                         self.Segmentation, self.SegmentationTime = self.Segment(self.VolumeArray, self.Local,
                                                                                 self.ServerURL, self.HeartSegRoutes,
                                                                                 self.Partial, True, self.HeartModelPath,
-                                                                                (112, 112, 112))
+                                                                                (112, 112, 112), self.WireFormat,
+                                                                                self.WireCompression, self.UseJobs,
+                                                                                self.UseStore, self.SliceFormat,
+                                                                                self.MaskEncoding)
                         self.HeartSegDone = True
 
             if self.HeartSegDone:
@@ -976,24 +1151,41 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
                         self.Calcifications, self.CalTime = self.Segment(Vol, self.Local,
                                                                          self.ServerURL, self.CalSegRoutes,
                                                                          self.Partial, True, self.CalModelPath,
-                                                                         (128, 128, 80))
+                                                                         (128, 128, 80), self.WireFormat,
+                                                                         self.WireCompression, self.UseJobs,
+                                                                         self.UseStore, self.SliceFormat,
+                                                                         self.MaskEncoding)
                         self.CalSegDone = True
                         self.UpdateCallback(3, "Completed in {0:.2f} Seconds".format(self.CalTime))
                 else:
-                    # Find Calcifications Using Image Thresholding
+                    # Find Calcifications Using Image Thresholding, Only Inside The Heart's Box
                     start = time.time()
-                    if self.CroppingEnabled:
-                        self.Calcifications = ThresholdCAC(self.NewVolume, 160)
-                    else:
-                        self.Calcifications = ThresholdCAC(self.VolumeArray, 160)
+                    Scan = self.NewVolume if self.CroppingEnabled else self.VolumeArray
+                    self.Calcifications = ThresholdCAC(Scan, self.Threshold, self.HeartBox(self.ScanSegmentation()))
                     self.CalTime = time.time() - start
                     self.UpdateCallback(3, "Completed in {0:.2f} Seconds".format(self.CalTime))
                     self.CalSegDone = True
 
-            # Calculate Calcifications Volume And Call The Update Callback To Display It
-            if self.CalSegDone:
-                self.CalcificationsMasked, self.CalVolume = QuantifyCAC(self.Calcifications, self.Segmentation,
-                                                                        self.VoxelSpacing)
+            # Calculate Calcifications Volume And Call The Update Callback To Display It, Once per Run as This
+            # Runs After Every Step, The Slider Rescores From The Index Afterwards
+            if self.CalSegDone and not self.CalScoringDone:
+                # Calcifications Are Counted & Scored in The Heart's Box, Through Views of The Volume
+                Scan = self.NewVolume if self.CroppingEnabled else self.VolumeArray
+                Heart = self.ScanSegmentation()
+                ROI = self.HeartBox(Heart)
+                Calcifications, self.CalVolume = QuantifyCAC(self.Calcifications, Heart, self.VoxelSpacing, ROI)
+                ScanROI = Scan if ROI is None else Scan[RegionSlices(ROI)]
+                Origin = (0, 0, 0) if ROI is None else ROI[::2]
+                self.Scores = AgatstonScore(ScanROI, Calcifications, self.VoxelSpacing)
+                self.LesionTable = LesionTable(ScanROI, Calcifications, self.VoxelSpacing, Origin)
+                if not self.DeepCal:
+                    Region = ScoringRegion(Heart) if ROI is None else Heart[RegionSlices(ROI)]
+                    self.ScoreIndex = DensityIndex(ScanROI, Region, self.VoxelSpacing)
+                # The Segmentation Node Needs The Calcifications in The Whole Volume's Frame
+                self.CalcificationsMasked = Calcifications
+                if ROI is not None:
+                    self.CalcificationsMasked = FullMask(Calcifications, Scan.shape, ROI)
+                self.CalScoringDone = True
 
             # Create Segmentation Node of The Calcifications
             if self.CalSegNode and self.CalSegDone and not self.CalSegNodeDone:
@@ -1002,6 +1194,7 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
                 #                             self.VolumeIJKToRAS, self.CalSeg3D)
                 self.CreateSegmentationNode(self.CalcificationsMasked, f'{self.VolumeName}-CalcificationsMasked',
                                             self.VolumeIJKToRAS, self.CalSeg3D)
+                self.CreateLesionTableNode(self.LesionTable, f'{self.VolumeName}-Lesions')
                 self.CalSegNodeDone = True
                 self.UpdateCallback(4, "Calcifications Visualized")
 
@@ -1009,7 +1202,7 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
             if self.CalSegNodeDone and self.HeartSegNodeDone:
                 VizEnd = time.time()
                 self.UpdateCallback(4, "Visualization Completed in {0:.2f} Seconds".format(VizEnd - VizStart))
-                self.UpdateCallback(5, "{0:.2f} mm³".format(self.CalVolume))
+                self.UpdateCallback(5, self.ScoresText())
 
         except Exception as e:
             slicer.util.errorDisplay("Failed to compute results: " + str(e))
@@ -1021,6 +1214,48 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
             self.FinishedCallback()
             self.SetDefaultClassVariables()
 
+    def ScanSegmentation(self):
+        """
+        The Heart Segmentation in The Frame of The Scan Being Scored. The Displayed Segmentation is Cropped With
+        The Volume, Otherwise it Still Covers The Whole Volume & a View of The Cropped Region is Returned
+        :return: Segmentation, an Empty One When Only Partial Views Were Segmented, so Calcifications Are Counted
+                 in The Legacy Central Box
+        """
+        Scan = self.NewVolume if self.CroppingEnabled else self.VolumeArray
+        if self.Partial or not isinstance(self.Segmentation, np.ndarray):
+            return np.zeros(Scan.shape, dtype=np.uint8)
+        if self.CroppingEnabled and self.Segmentation.shape != Scan.shape:
+            return self.Segmentation[RegionSlices(self.Coordinates)]
+        return self.Segmentation
+
+    def HeartBox(self, Segmentation):
+        """
+        Bounding Box of The Heart Calcifications Are Found & Counted in
+        :param Segmentation: Heart Segmentation in The Frame of The Volume Being Scored
+        :return: [z1, z2, x1, x2, y1, y2], None Without a Heart, Counting Them in The Legacy Central Box
+        """
+        if not np.any(Segmentation):
+            return None
+        return [Bound for Axis in BoundingBox(Segmentation) for Bound in (int(Axis.start), int(Axis.stop) - 1)]
+
+    def Rescore(self, Threshold):
+        """
+        Scores The Thresholded Calcifications of The Last Run at Another Threshold From Their Density Index
+        :return: The Results Text
+        """
+        self.Scores = self.ScoreIndex.score(Threshold)
+        self.CalVolume = CandidateVolume(self.Scores["voxels"], self.ScoreIndex.voxel_spacing)
+        return self.ScoresText()
+
+    def ScoresText(self):
+        """
+        The Calcifications Volume, Followed by The Agatston & Mass Scores When Known, Older Servers Don't Return Them
+        """
+        Text = "{0:.2f} mm³".format(self.CalVolume)
+        if self.Scores:
+            Text += ", Agatston {0:.0f}, Mass {1:.1f} mg".format(self.Scores["agatston"], self.Scores["mass"])
+        return Text
+
     def CLITest(self, inputVolume, LocalProcessing=True, ProcessingURL="http://localhost:5000", Partial=True,
                 ModelPath=None, outputVolume=None):
         """
@@ -1053,13 +1288,15 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         logging.info('Processing completed in {0:.2f} seconds'.format(stopTime - startTime))
 
     def SegmentAndCrop(self, inputVolume, Local=True, ProcessingURL="http://localhost:5000",
-                       ModelPath=None):
+                       ModelPath=None, SliceFormat="png", Compression="none"):
         """
        Gets The Coordinates of The Bounding Box of The Result of Segmenting THe Given Volume
        :param inputVolume: NumPy Array of The Volume
        :param Local: It True, Process Data Locally
        :param ProcessingURL: If Local is Set To False, Send The Volume To This URL For Processing
        :param ModelPath: Path of The TensorFlow Model Used in Segmentation
+       :param SliceFormat: "bundle" Sends The Slices as One Body of int16 Arrays, "png" as 9 PNG Files
+       :param Compression: Compression Used With The Bundle Format, "none", "lz4" or "zstd"
        :returns Coordinates: Array Containing The Coordinates of The Bounding Box
         """
         # TODO: Receive Routes From Caller
@@ -1073,26 +1310,17 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         VolumeArray = np.copy(inputVolume)
 
         # Prepare Slices
-        RawSliceArrays, files, ShiftValues = self.GetSampleSlicesFromVolume(VolumeArray=VolumeArray,
-                                                                            Local=Local)
+        RawSliceArrays = GetSampleSlices(VolumeArray)
 
         # Send to Server For Processing
         if not Local:
-            SliceSendReq = requests.post(ProcessingURL + "/crop", files=files, data=ShiftValues)
-            Coordinates = SliceSendReq.json()["Coor"]
+            Coordinates = CropCoordinates(ProcessingURL + "/crop", RawSliceArrays, SliceFormat, Compression)
             logging.info(f"Received Cropping Coordinates From Online Server")
         else:
             from Models.Segmentation.Inference import Infer
             model = Infer(model_path=ModelPath, model_input=(112, 112, 112))
-            AxSeg = model.predict(np.array(RawSliceArrays[0]))
-            SagSeg = model.predict(np.array(RawSliceArrays[1]))
-            CorSeg = model.predict(np.array(RawSliceArrays[2]))
-
-            AxCoor = [int(i) for i in get_coords(AxSeg)]
-            SagCoor = [int(i) for i in get_coords(SagSeg)]
-            CorCoor = [int(i) for i in get_coords(CorSeg)]
-
-            Coordinates = [AxCoor, SagCoor, CorCoor]
+            # Same Bounding Box The Server Returns [z1, z2, x1, x2, y1, y2]
+            Coordinates = GetCoords(model.predict_batch(RawSliceArrays), Partial=True)
 
             logging.info(f"Cropping Coordinates Calculated Locally")
 
@@ -1104,7 +1332,8 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         return Coordinates
 
     def Segment(self, inputVolume, LocalProcessing=True, ServerURL="http://localhost:5000", Routes=None, Partial=True,
-                ReturnTime=True, ModelPath=None, Shape=None):
+                ReturnTime=True, ModelPath=None, Shape=None, WireFormat="npz", Compression="none",
+                UseJobs=False, UseStore=False, SliceFormat="png", MaskEncoding=None):
         """
        Applies A TensorFlow Segmentation Model To The Given Volume
        :param inputVolume: NumPy Array of The Volume
@@ -1115,6 +1344,13 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
        :param ReturnTime: Returns The Time Taken by The Function
        :param Shape: Shape of The Model Input
        :param ModelPath: Path of The TensorFlow Model Used in Segmentation
+       :param WireFormat: "raw" Sends The Volume as a Raw Array, "stream" as Axial Slabs, "npz" as a Compressed
+                          npz File
+       :param Compression: Compression Used With The Raw Format, "none", "lz4" or "zstd"
+       :param UseJobs: Submit The Volume as a Server Job & Poll it Instead of Waiting on The Request
+       :param UseStore: Upload The Volume To The Server's Volume Store Only if it's Not There, Then Refer To it
+       :param SliceFormat: "bundle" Sends The Sampled Slices as One Body of int16 Arrays, "png" as 9 PNG Files
+       :param MaskEncoding: "packbits" or "rle" Receives The Mask as Its Bounding Box & Encoded Voxels
        :returns SegmentedSlices: Array Containing The Segmented Volume
        :returns SegmentTime: Time Taken By The Function
         """
@@ -1134,43 +1370,35 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
 
         # Segment 3 Slicers From Each View
         if Partial:
-            SegmentedSlices = [[], [], []]
-            RawSliceArrays, files, ShiftValues = self.GetSampleSlicesFromVolume(VolumeArray=VolumeArray,
-                                                                                Local=LocalProcessing)
+            RawSliceArrays = GetSampleSlices(VolumeArray)
             if not LocalProcessing:
-                # Send Data To Server For Processing"/segment/slices"
-                SliceSendReq = requests.post(ServerURL + Routes["Partial"], files=files, data=ShiftValues)
-                Response = BytesIO(SliceSendReq.content)
-                Response.seek(0)
-                Data = np.load(Response)
-                SegmentedSlices[0] = np.copy(Data["Ax"])
-                SegmentedSlices[1] = np.copy(Data["Cor"])
-                SegmentedSlices[2] = np.copy(Data["Sag"])
-                Data.close()
+                # Send Data To Server For Processing
+                SegmentedSlices = SegmentSlices(ServerURL + Routes["Partial"], RawSliceArrays, SliceFormat,
+                                                Compression)
                 logging.info(f"Segmented Slices Received From Server")
 
             else:
                 # Load Model
                 from Models.Segmentation.Inference import Infer
                 model = Infer(model_path=ModelPath, model_input=Shape)
-                # Loop over 3 slices in each View and apply heart segmentation
-                for i in range(3):
-                    SegSlice = model.predict(np.array(RawSliceArrays[i]))
-                    SegmentedSlices[i].append(SegSlice)
+                # Segment The 3 Slices of Each View Together in a Single Forward Pass
+                SegmentedSlices = model.predict_batch(RawSliceArrays)
 
                 logging.info(f"Segmentation Computed Locally")
 
         else:
             if not LocalProcessing:
-                CompressedVolume = BytesIO()
-                np.savez_compressed(CompressedVolume, Volume=VolumeArray)
-                CompressedVolume.seek(0)
-                SliceSendReq = requests.post(ServerURL + Routes["Volume"], files={"Volume": CompressedVolume})
-                Response = BytesIO(SliceSendReq.content)
-                Response.seek(0)
-                Data = np.load(Response)
-                SegmentedSlices = np.copy(Data['Segmentation'])
-                Data.close()
+                # Volumes The Server Already Holds Are Referred To by Their Digest Instead of Uploaded
+                Digest = StoreVolume(ServerURL, VolumeArray, WireFormat, Compression) if UseStore else None
+                if UseJobs and Routes.get("Task"):
+                    # Submit a Job & Poll it, The Server May Take Longer Than a Request's Timeout
+                    SegmentedSlices = RunJob(ServerURL, Routes["Task"], VolumeArray, WireFormat, Compression,
+                                             ProgressCallback=lambda Progress, Stage: logging.info(
+                                                 f"Job {Stage}: {Progress * 100:.0f}%"), Digest=Digest,
+                                             MaskEncoding=MaskEncoding)
+                else:
+                    SegmentedSlices = PostVolume(ServerURL + Routes["Volume"], VolumeArray, WireFormat, Compression,
+                                                 Digest=Digest, MaskEncoding=MaskEncoding)
                 logging.info(f"Segmented Slices Received From Server")
 
             else:
@@ -1214,7 +1442,9 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         scriptPath = os.path.join(scriptFolder, ScriptName)
         self.HeartSegmentationProcess = SegmentationProcess(scriptPath, VolumeArray, Local,
                                                             ServerURL, Routes, Partial,
-                                                            HeartModelPath, Shape)
+                                                            HeartModelPath, Shape,
+                                                            self.WireFormat, self.WireCompression, self.UseJobs,
+                                                            self.UseStore, self.SliceFormat, self.MaskEncoding)
         logic = ProcessesLogic(completedCallback=lambda: CompletedCallback())
         logic.addProcess(self.HeartSegmentationProcess)
         logic.run()
@@ -1252,21 +1482,25 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         logging.info('Segmentation & Coordinates Calculation Completed in {0:.2f} Seconds'.format(self.SegAndCropTime))
         self.RunOperations()
 
+    def CheckScoringDependencies(self):
+        """
+        Installs The Missing Pip Packages Calcifications Are Scored With, Needed in The Local & Remote Modes
+        """
+        for Module, Package in (("scipy", "scipy"), ("skimage", "scikit-image")):
+            if importlib.util.find_spec(Module) is None:
+                logging.info(f'Installing {Package}')
+                pip_install(Package)
+                logging.info(f'{Package} Installed')
+            else:
+                logging.info(f'{Package} Found')
+
     def CheckDependencies(self):
         """
-        Installs Missing Pip Packages
+        Installs The Missing Pip Packages of Local Segmentation, The Scoring Ones Are Checked First
         """
         # Install Dependencies if Not Detected
-        Scikit = importlib.util.find_spec("skimage")
         TensorFlow = importlib.util.find_spec("tensorflow")
 
-        if Scikit is None:
-            logging.info('Installing Scikit')
-            pip_install("scikit-image")
-            logging.info('Scikit Installed')
-        else:
-            logging.info('Scikit Found')
-
         if TensorFlow is None:
             logging.info('Installing TensorFlow')
             pip_install("tensorflow")
@@ -1289,8 +1523,8 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         if VolumeIJKToRAS:
             LabelMapVolumeNode.SetIJKToRASMatrix(VolumeIJKToRAS)
 
-        # Copy Segmentation
-        SegmentationNp = np.copy(Segmentation)
+        # uint8 Labelmap, The Array is Copied Into The Volume So bool & uint8 Masks Are Passed Without a Copy
+        SegmentationNp = AsMask(Segmentation)
 
         # Update the LabelMapVolume from the given Segmentation array
         slicer.util.updateVolumeFromArray(LabelMapVolumeNode, SegmentationNp)
@@ -1308,6 +1542,29 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         # Delete The LabelMapVolume
         # slicer.mrmlScene.RemoveNode(LabelMapVolumeNode)
 
+    def CreateLesionTableNode(self, Table, Name=None):
+        """
+        Creates A Table Node Listing The Lesions, Filled From The Table's Columns at Once
+        :param Table: Lesion Table, Structured Array From LesionTable
+        :param Name: Name To Give To The Table Node
+        """
+        Columns = [Table["id"], Table["voxels"], Table["volume"]]
+        ColumnNames = ["Lesion", "Voxels", "Volume (mm³)"]
+        # The Box & Centroid Are in The Cropped Volume's Frame When Cropping, Like The Masks
+        for Axis, Bound in enumerate(["Z1", "Z2", "X1", "X2", "Y1", "Y2"]):
+            Columns.append(Table["box"][:, Axis])
+            ColumnNames.append(Bound)
+        for Axis, Coordinate in enumerate(["Centroid Z", "Centroid X", "Centroid Y"]):
+            Columns.append(Table["centroid"][:, Axis])
+            ColumnNames.append(Coordinate)
+        Columns += [Table["max_hu"], Table["mean_hu"], Table["weight"]]
+        ColumnNames += ["Max HU", "Mean HU", "Agatston Weight"]
+
+        TableNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTableNode", Name)
+        slicer.util.updateTableFromArray(TableNode, [np.ascontiguousarray(Column) for Column in Columns],
+                                         ColumnNames)
+        return TableNode
+
     def GetCoordinates(self, Segmentation, Partial, Margin):
         """
         Gets The Cropping Parameters of The Given Segmentation
@@ -1369,60 +1626,6 @@ class CaScoreModuleLogic(ScriptedLoadableModuleLogic):
         CroppedVolume = self.CropVolume(Volume, Coordinates)
         return CroppedVolume
 
-    def GetSampleSlicesFromVolume(self, VolumeArray=None, Local=True):
-        """
-        Extracts The 3 Middle Slices From Each View (Axial, Sagittal & Coronal)
-        :param VolumeArray: Volume To Extract Slices From
-        :param Local: If True, Compresses The Slices Into a PNG For Online Processing
-        :return RawSliceArrays: List of 3 NumPy NDArrays Containing Slices From Axial, Sagittal & Coronal Views
-        :return SliceImages: List of Images Contacting PNG Data of The Slices in The Three Views
-        :return ShiftValues: Values Needed To Reconstruct The Original Slice Array After
-        Decompressing Them From Images To NumPy Arrays
-        """
-        # Axial, Sagittal, Coronal
-        Names = ["Ax1", "Ax2", "Ax3", "Sag1", "Sag2", "Sag3", "Cor1", "Cor2", "Cor3"]
-        SliceImages = {}
-        ShiftValues = {}
-        RawSliceArrays = [[], [], []]
-        VolumeShape = VolumeArray.shape
-
-        # Prepare Slices
-        for i in range(3):
-            Mid = int(VolumeShape[i] / 2)
-            if i == 0:
-                logging.info(f"Preparing Axial Slices Number {Mid - 1}, {Mid}, {Mid + 1}")
-            elif i == 1:
-                logging.info(f"Preparing Sagittal Slices Number {Mid - 1}, {Mid}, {Mid + 1}")
-            elif i == 2:
-                logging.info(f"Preparing Coronal Slices Number {Mid - 1}, {Mid}, {Mid + 1}")
-            for j in range(-1, 2):
-                if i == 0:
-                    # Prepare Axial Slices
-                    Arr = VolumeArray[Mid + j, :, :]
-                elif i == 1:
-                    # Prepare Sagittal Slices
-                    Arr = VolumeArray[:, Mid + j, :]
-                elif i == 2:
-                    # Prepare Coronal Slices
-                    Arr = VolumeArray[:, :, Mid + j]
-                RawSliceArrays[i].append(Arr)
-                if not Local:
-                    ArrS = Arr.min()
-                    # Shift Array Values if There Exists -Ve Values, since -ve values are lost during PNG
-                    # conversion, and store the shift value to be sent
-                    if ArrS < 0:
-                        Arr -= ArrS
-                        ShiftValues[Names[0]] = ArrS
-                    else:
-                        ShiftValues[Names[0]] = 0
-                    SliceImg = Image.fromarray(Arr)
-                    SliceBytes = BytesIO()
-                    SliceImg.save(SliceBytes, format="PNG")
-                    SliceBytes.seek(0, 0)
-                    SliceImages[Names.pop(0)] = SliceBytes
-
-        return RawSliceArrays, SliceImages, ShiftValues
-
 
 #
 # CaScoreModuleTest
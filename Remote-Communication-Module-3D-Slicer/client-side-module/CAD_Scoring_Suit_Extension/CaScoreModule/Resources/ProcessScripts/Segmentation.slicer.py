@@ -1,9 +1,7 @@
 import numpy as np
 import time
 import requests
-from io import BytesIO
 import logging
-from PIL import Image
 import os
 import sys
 import pickle
@@ -29,51 +27,9 @@ RepoRoot = os.path.dirname(
 
 sys.path.append(RepoRoot)
 
-
-def GetSampleSlicesFromVolume(VolumeArray=None, Local=True):
-    # Axial, Sagittal, Coronal
-    Names = ["Ax1", "Ax2", "Ax3", "Sag1", "Sag2", "Sag3", "Cor1", "Cor2", "Cor3"]
-    files = {}
-    ShiftValues = {}
-    RawSliceArrays = [[], [], []]
-    VolumeShape = VolumeArray.shape
-
-    # Prepare Slices
-    for i in range(3):
-        Mid = int(VolumeShape[i] / 2)
-        if i == 0:
-            logging.info(f"Preparing Axial Slices Number {Mid - 1}, {Mid}, {Mid + 1}")
-        elif i == 1:
-            logging.info(f"Preparing Sagittal Slices Number {Mid - 1}, {Mid}, {Mid + 1}")
-        elif i == 2:
-            logging.info(f"Preparing Coronal Slices Number {Mid - 1}, {Mid}, {Mid + 1}")
-        for j in range(-1, 2):
-            if i == 0:
-                # Prepare Axial Slices
-                Arr = VolumeArray[Mid + j, :, :]
-            elif i == 1:
-                # Prepare Sagittal Slices
-                Arr = VolumeArray[:, Mid + j, :]
-            elif i == 2:
-                # Prepare Coronal Slices
-                Arr = VolumeArray[:, :, Mid + j]
-            RawSliceArrays[i].append(Arr)
-            if not Local:
-                ArrS = Arr.min()
-                # Shift Array Values if There Exists -Ve Values, since -ve values are lost during PNG
-                # conversion, and store the shift value to be sent
-                if ArrS < 0:
-                    Arr -= ArrS
-                    ShiftValues[Names[0]] = ArrS
-                else:
-                    ShiftValues[Names[0]] = 0
-                SliceImg = Image.fromarray(Arr)
-                SliceBytes = BytesIO()
-                SliceImg.save(SliceBytes, format="PNG")
-                SliceBytes.seek(0, 0)
-                files[Names.pop(0)] = SliceBytes
-
-    return RawSliceArrays, files, ShiftValues
+from Models.Client import PostVolume, RunJob, StoreVolume, SegmentSlices
+from Models.Wire import EncodeMask
+from Models.crop_roi import GetSampleSlices
 
 
 try:
@@ -87,6 +43,12 @@ try:
     Partial = Input["Partial"]
     Routes = Input["Routes"]
     Shape = Input["Shape"]
+    WireFormat = Input.get("WireFormat", "npz")
+    Compression = Input.get("Compression", "none")
+    UseJobs = Input.get("UseJobs", False)
+    UseStore = Input.get("UseStore", False)
+    SliceFormat = Input.get("SliceFormat", "png")
+    MaskEncoding = Input.get("MaskEncoding")
 
     # Get Segmentation Start Time
     SegmentStart = time.time()
@@ -97,20 +59,11 @@ try:
 
     # Segment 3 Slicers From Each View
     if Partial:
-        SegmentedSlices = [[], [], []]
-        RawSliceArrays, files, ShiftValues = GetSampleSlicesFromVolume(VolumeArray=VolumeArray,
-                                                                       Local=Local)
+        RawSliceArrays = GetSampleSlices(VolumeArray)
 
         if not Local:
             # Send Data To Server For Processing
-            SliceSendReq = requests.post(ServerURL + Routes["Partial"], files=files, data=ShiftValues)
-            Response = BytesIO(SliceSendReq.content)
-            Response.seek(0)
-            Data = np.load(Response)
-            SegmentedSlices[0] = np.copy(Data["Ax"])
-            SegmentedSlices[1] = np.copy(Data["Cor"])
-            SegmentedSlices[2] = np.copy(Data["Sag"])
-            Data.close()
+            SegmentedSlices = SegmentSlices(ServerURL + Routes["Partial"], RawSliceArrays, SliceFormat, Compression)
             logging.info(f"Segmented Slices Received From Server")
 
         else:
@@ -118,24 +71,25 @@ try:
             from Models.Segmentation.Inference import Infer
 
             model = Infer(model_path=ModelPath, model_input=Shape)
-            # Loop over 3 slices in each View and apply heart segmentation
-            for i in range(3):
-                SegSlice = model.predict(np.array(RawSliceArrays[i]))
-                SegmentedSlices[i].append(SegSlice)
+            # Segment The 3 Slices of Each View Together in a Single Forward Pass
+            SegmentedSlices = model.predict_batch(RawSliceArrays)
 
             logging.info(f"Segmentation Computed Locally")
 
     else:
         if not Local:
-            CompressedVolume = BytesIO()
-            np.savez_compressed(CompressedVolume, Volume=VolumeArray)
-            CompressedVolume.seek(0)
-            SliceSendReq = requests.post(ServerURL + Routes["Volume"], files={"Volume": CompressedVolume})
-            Response = BytesIO(SliceSendReq.content)
-            Response.seek(0)
-            Data = np.load(Response)
-            SegmentedSlices = np.copy(Data['Segmentation'])
-            Data.close()
+            # Volumes The Server Already Holds Are Referred To by Their Digest Instead of Uploaded
+            Digest = StoreVolume(ServerURL, VolumeArray, WireFormat, Compression) if UseStore else None
+            if UseJobs and Routes.get("Task"):
+                # Submit a Job & Poll it, The Server May Take Longer Than a Request's Timeout
+                SegmentedSlices = RunJob(ServerURL, Routes["Task"], VolumeArray, WireFormat, Compression,
+                                         ProgressCallback=lambda Progress, Stage: logging.info(
+                                             f"Job {Stage}: {Progress * 100:.0f}%"), Digest=Digest,
+                                         MaskEncoding=MaskEncoding)
+            else:
+                # Compact Masks Are Decoded Straight Into a uint8 Labelmap
+                SegmentedSlices = PostVolume(ServerURL + Routes["Volume"], VolumeArray, WireFormat, Compression,
+                                             Digest=Digest, MaskEncoding=MaskEncoding)
             logging.info(f"Segmented Slices Received From Server")
 
         else:
@@ -157,7 +111,9 @@ try:
     SegmentEnd = time.time()
     SegmentTime = SegmentEnd - SegmentStart
 
-    output = {'Segmentation': SegmentedSlices, 'SegmentationTime': SegmentTime}
+    # The Whole Volume's Mask is Bit-Packed, Sending 1 Bit Per Voxel of its Bounding Box Back To Slicer
+    output = {'Segmentation': SegmentedSlices if Partial else EncodeMask(SegmentedSlices, "packbits"),
+              'SegmentationTime': SegmentTime}
 
     sys.stdout.buffer.write(pickle.dumps(output))
 
@@ -0,0 +1,136 @@
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Peak Bytes Per Voxel Held Around Inference on Top of The Decoded Volume, Measured With tracemalloc: Resizing The
+# Whole Volume In-Plane Works in float64 & Keeps an Anti-Aliased Copy, The Sliding Window Blends in float32 & Streamed
+# Volumes Are Resized Slab by Slab. All Include The uint8 Mask & its Encoded Copy
+WorkingBytes = {"resize": 19, "sliding": 10, "prepared": 4}
+
+
+def EstimatePeak(Shape, Dtype, BodySize=0, Path="resize"):
+    """
+    Estimates The Peak Memory of Segmenting a Volume Before it is Decoded
+    :param Shape: Declared Shape of The Volume
+    :param Dtype: Declared Type of The Volume
+    :param BodySize: Bytes of The Encoded Volume Held While it's Decoded
+    :param Path: "resize", "sliding" or "prepared" For Volumes Resized While They Are Streamed
+    :return: Bytes
+    """
+    Voxels = int(np.prod(Shape))
+    return BodySize + Voxels * (np.dtype(Dtype).itemsize + WorkingBytes[Path])
+
+
+class TooBusy(Exception):
+    def __init__(self, Message, RetryAfter):
+        super().__init__(Message)
+        self.RetryAfter = RetryAfter
+
+
+class TooLarge(Exception):
+    pass
+
+
+class AdmissionController:
+    """
+    Admits Requests Against a Memory Budget From Their Estimated Peak Memory, Requests That Don't Fit Wait in a
+    Bounded First In First Out Queue & Are Refused When The Queue is Full or They Waited Too Long
+    """
+
+    def __init__(self, MemoryBudget, MaxQueue=8, QueueTimeout=30):
+        """
+        :param MemoryBudget: Bytes Shared by The Admitted Requests, None Admits Every Request
+        :param MaxQueue: Requests Allowed To Wait, More Are Refused at Once
+        :param QueueTimeout: Seconds a Request Waits Before it is Refused
+        """
+        self.MemoryBudget = MemoryBudget
+        self.MaxQueue = MaxQueue
+        self.QueueTimeout = QueueTimeout
+        self.InUse = 0
+        self.Active = 0
+        self.Queue = deque()
+        self.Condition = threading.Condition()
+        self.Stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "too_large": 0,
+                      "wait_time": 0.0, "max_wait": 0.0, "hold_time": 0.0, "released": 0, "peak_in_use": 0}
+
+    def Acquire(self, Bytes, Block=False):
+        """
+        Reserves Memory For a Request, Waiting For Earlier Requests When The Budget is Used
+        :param Bytes: Estimated Peak Memory of The Request
+        :param Block: Wait Without a Bound, Used by Background Jobs Whose Queue is Already Bounded
+        :return: Reservation To Pass To Release
+        """
+        self.Check(Bytes)
+        Start = time.time()
+        with self.Condition:
+            if not self.Queue and self.__Fits(Bytes):
+                return self.__Admit(Bytes, Start)
+            if not Block and len(self.Queue) >= self.MaxQueue:
+                self.Stats["rejected_queue_full"] += 1
+                raise TooBusy(f"{len(self.Queue)} Requests Are Already Waiting For Memory", self.RetryAfter())
+
+            Ticket = object()
+            self.Queue.append(Ticket)
+            self.Stats["queued"] += 1
+            Deadline = None if Block else Start + self.QueueTimeout
+            try:
+                # Only The Oldest Waiting Request May Take The Memory, So Large Requests Aren't Starved
+                while self.Queue[0] is not Ticket or not self.__Fits(Bytes):
+                    Remaining = None if Deadline is None else Deadline - time.time()
+                    if Remaining is not None and Remaining <= 0:
+                        self.Stats["rejected_timeout"] += 1
+                        raise TooBusy(f"No Memory Was Freed in {self.QueueTimeout:.0f} Seconds", self.RetryAfter())
+                    self.Condition.wait(Remaining)
+            finally:
+                self.Queue.remove(Ticket)
+                self.Condition.notify_all()
+            return self.__Admit(Bytes, Start)
+
+    def Check(self, Bytes):
+        """
+        Raises TooLarge When The Request Couldn't Fit Even With The Whole Budget
+        """
+        if self.MemoryBudget is not None and Bytes > self.MemoryBudget:
+            with self.Condition:
+                self.Stats["too_large"] += 1
+            raise TooLarge(f"The Request Needs About {Bytes / 1024 ** 2:.0f} MB, "
+                           f"Over The Server's {self.MemoryBudget / 1024 ** 2:.0f} MB Budget")
+
+    def Release(self, Reservation):
+        Bytes, Admitted = Reservation
+        with self.Condition:
+            self.InUse -= Bytes
+            self.Active -= 1
+            self.Stats["released"] += 1
+            self.Stats["hold_time"] += time.time() - Admitted
+            self.Condition.notify_all()
+
+    def RetryAfter(self):
+        """
+        Seconds a Refused Client Should Wait, The Mean Time Requests Hold Their Memory
+        """
+        Released = self.Stats["released"]
+        return max(1, math.ceil(self.Stats["hold_time"] / Released)) if Released else 5
+
+    def Report(self):
+        with self.Condition:
+            Admitted = self.Stats["admitted"]
+            return {**self.Stats, "memory_budget": self.MemoryBudget, "in_use": self.InUse, "active": self.Active,
+                    "waiting": len(self.Queue), "max_queue": self.MaxQueue, "queue_timeout": self.QueueTimeout,
+                    "mean_wait": self.Stats["wait_time"] / Admitted if Admitted else 0.0}
+
+    def __Fits(self, Bytes):
+        return self.MemoryBudget is None or self.InUse + Bytes <= self.MemoryBudget
+
+    def __Admit(self, Bytes, Start):
+        Waited = time.time() - Start
+        self.InUse += Bytes
+        self.Active += 1
+        self.Stats["admitted"] += 1
+        self.Stats["wait_time"] += Waited
+        self.Stats["max_wait"] = max(self.Stats["max_wait"], Waited)
+        self.Stats["peak_in_use"] = max(self.Stats["peak_in_use"], self.InUse)
+        return Bytes, time.time()
@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from Models import Wire
+
+
+class ResultCache:
+    """
+    Keeps Segmentation Results Keyed by The Content of Their Input, in Memory & on Disk, Both Bounded in Bytes
+    With The Least Recently Used Results Evicted First
+    """
+
+    def __init__(self, MemoryBudget=512 * 1024 ** 2, DiskBudget=0, Directory=None):
+        """
+        :param MemoryBudget: Maximum Bytes of Results Kept in Memory, 0 Disables The Memory Cache
+        :param DiskBudget: Maximum Bytes of Encoded Results Kept on Disk, 0 Disables The Disk Cache
+        :param Directory: Where Results Are Stored on Disk, Results Already There Are Reused
+        """
+        self.MemoryBudget = MemoryBudget
+        self.DiskBudget = DiskBudget if Directory else 0
+        self.Directory = Directory
+
+        self.Memory = OrderedDict()
+        self.Disk = OrderedDict()
+        self.Stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "bytes_saved": 0,
+                      "memory_evictions": 0, "disk_evictions": 0}
+        self.Lock = threading.Lock()
+
+        if self.DiskBudget:
+            os.makedirs(Directory, exist_ok=True)
+            # Oldest First, So Eviction Resumes Where The Previous Server Left Off
+            Files = sorted((Entry for Entry in os.scandir(Directory) if Entry.name.endswith(".casw")),
+                           key=lambda Entry: Entry.stat().st_mtime)
+            for Entry in Files:
+                self.Disk[Entry.name[:-len(".casw")]] = Entry.stat().st_size
+            self.__Evict()
+
+    @staticmethod
+    def Key(*Parts):
+        return hashlib.blake2b("\n".join(str(Part) for Part in Parts).encode(), digest_size=16).hexdigest()
+
+    def Get(self, Key):
+        """
+        :return: The Cached Result, None on a Miss
+        """
+        with self.Lock:
+            if Key in self.Memory:
+                self.Memory.move_to_end(Key)
+                Result = self.Memory[Key]
+                self.__Hit("memory_hits", Result)
+                return Result
+            OnDisk = Key in self.Disk
+
+        if OnDisk:
+            try:
+                with open(self.__Path(Key), "rb") as File:
+                    Result = self.__Decode(File.read())
+                # The Modification Time Keeps The Disk's LRU Order Across Restarts
+                os.utime(self.__Path(Key))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Dropping Unreadable Cached Result {Key}: {e}")
+                with self.Lock:
+                    self.__Remove(Key)
+            else:
+                with self.Lock:
+                    if Key in self.Disk:
+                        self.Disk.move_to_end(Key)
+                    self.__Hit("disk_hits", Result)
+                    self.__Store(Key, Result)
+                    self.__Evict()
+                return Result
+
+        with self.Lock:
+            self.Stats["misses"] += 1
+        return None
+
+    def Put(self, Key, Result):
+        """
+        Caches a Result, The Array Must Not be Modified Afterwards
+        """
+        if Result.nbytes > self.MemoryBudget and Result.nbytes > self.DiskBudget:
+            return
+
+        if self.DiskBudget:
+            # Written Under a Temporary Name & Renamed, So Readers Never See a Partial File
+            Data = self.__Encode(Result)
+            if len(Data) <= self.DiskBudget:
+                Temporary = self.__Path(Key) + f".{threading.get_ident()}.tmp"
+                with open(Temporary, "wb") as File:
+                    File.write(Data)
+                os.replace(Temporary, self.__Path(Key))
+                with self.Lock:
+                    self.Disk[Key] = len(Data)
+                    self.Disk.move_to_end(Key)
+
+        with self.Lock:
+            self.__Store(Key, Result)
+            self.__Evict()
+
+    def Report(self):
+        with self.Lock:
+            Lookups = self.Stats["hits"] + self.Stats["misses"]
+            return {**self.Stats, "hit_rate": self.Stats["hits"] / Lookups if Lookups else None,
+                    "memory_entries": len(self.Memory), "memory_bytes": self.__MemoryUsage(),
+                    "memory_budget": self.MemoryBudget, "disk_entries": len(self.Disk),
+                    "disk_bytes": sum(self.Disk.values()), "disk_budget": self.DiskBudget}
+
+    def __Hit(self, Kind, Result):
+        # Called With The Lock Held
+        self.Stats["hits"] += 1
+        self.Stats[Kind] += 1
+        self.Stats["bytes_saved"] += Result.nbytes
+
+    def __Store(self, Key, Result):
+        # Called With The Lock Held
+        if Result.nbytes <= self.MemoryBudget:
+            Result.flags.writeable = False
+            self.Memory[Key] = Result
+            self.Memory.move_to_end(Key)
+
+    def __MemoryUsage(self):
+        return sum(Result.nbytes for Result in self.Memory.values())
+
+    def __Evict(self):
+        # Drop The Least Recently Used Results Till Both Caches Fit Their Budgets, Called With The Lock Held
+        while self.Memory and self.__MemoryUsage() > self.MemoryBudget:
+            self.Memory.popitem(last=False)
+            self.Stats["memory_evictions"] += 1
+        while self.Disk and sum(self.Disk.values()) > self.DiskBudget:
+            self.__Remove(next(iter(self.Disk)))
+            self.Stats["disk_evictions"] += 1
+
+    def __Remove(self, Key):
+        self.Disk.pop(Key, None)
+        try:
+            os.remove(self.__Path(Key))
+        except OSError:
+            pass
+
+    def __Path(self, Key):
+        return os.path.join(self.Directory, Key + ".casw")
+
+    @staticmethod
+    def __Encode(Result):
+        """
+        Encodes a Result For The Disk, Masks Are Bit-Packed, Other Arrays Are Kept as Raw Arrays
+        """
+        Compression = Wire.ChooseCompression(Wire.AvailableCompressions(), ("zstd", "lz4"))
+        if Result.dtype == np.uint8 and Result.max(initial=0) <= 1:
+            return Wire.EncodeMask(Result, "packbits", Compression)
+        return Wire.EncodeArray(Result, Compression)
+
+    @staticmethod
+    def __Decode(Data):
+        if bytes(Data[:4]) == Wire.MaskMagic:
+            return Wire.DecodeMask(Data)[0]
+        return Wire.DecodeArray(Data)[0]
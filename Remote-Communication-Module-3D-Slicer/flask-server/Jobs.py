@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+class JobManager:
+    """
+    Runs Long Operations on a Bounded Pool of Worker Threads, So Requests Only Submit Work And Return an Id
+    That The Client Polls For Status, Progress & The Result
+    """
+
+    def __init__(self, Workers=2, MaxPending=32, ResultTTL=600):
+        """
+        :param Workers: Number of Jobs Running Concurrently
+        :param MaxPending: Maximum Number of Queued & Running Jobs, More Submissions Are Refused
+        :param ResultTTL: Seconds a Finished Job's Result is Kept
+        """
+        self.Workers = Workers
+        self.MaxPending = MaxPending
+        self.ResultTTL = ResultTTL
+        self.Pool = ThreadPoolExecutor(max_workers=Workers, thread_name_prefix="Job")
+        self.Jobs = {}
+        self.Lock = threading.Lock()
+
+    def Submit(self, Function, *Args):
+        """
+        Queues a Job, The Function is Called With a Progress Callback Followed by The Given Arguments
+        :return: The Job's Id
+        """
+        with self.Lock:
+            self.__Purge()
+            if self.Pending() >= self.MaxPending:
+                raise TooManyJobs(f"{self.MaxPending} Jobs Are Already Pending")
+
+            JobId = uuid.uuid4().hex
+            self.Jobs[JobId] = {"id": JobId, "status": "queued", "progress": 0.0, "stage": "Queued",
+                                "error": None, "result": None,
+                                "created": time.time(), "started": None, "finished": None}
+        self.Pool.submit(self.__Run, JobId, Function, Args)
+        return JobId
+
+    def Status(self, JobId):
+        """
+        :return: The Job's Status Without Its Result, None For Unknown Jobs
+        """
+        with self.Lock:
+            Job = self.Jobs.get(JobId)
+            return {Key: Value for Key, Value in Job.items() if Key != "result"} if Job else None
+
+    def Result(self, JobId):
+        with self.Lock:
+            return self.Jobs[JobId]["result"]
+
+    def Pending(self):
+        return sum(Job["status"] in ("queued", "running") for Job in self.Jobs.values())
+
+    def Report(self):
+        with self.Lock:
+            Statuses = [Job["status"] for Job in self.Jobs.values()]
+            return {"workers": self.Workers, "max_pending": self.MaxPending,
+                    **{Status: Statuses.count(Status) for Status in ("queued", "running", "done", "failed")}}
+
+    def __Update(self, JobId, **Values):
+        with self.Lock:
+            self.Jobs[JobId].update(Values)
+
+    def __Run(self, JobId, Function, Args):
+        self.__Update(JobId, status="running", started=time.time(), stage="Started")
+
+        def Progress(Fraction, Stage):
+            self.__Update(JobId, progress=Fraction, stage=Stage)
+
+        try:
+            Result = Function(Progress, *Args)
+        except Exception as e:
+            logging.exception(f"Job {JobId} Failed")
+            self.__Update(JobId, status="failed", error=str(e), finished=time.time())
+            return
+        self.__Update(JobId, status="done", progress=1.0, stage="Done", result=Result, finished=time.time())
+
+    def __Purge(self):
+        # Drop Finished Jobs Older Than The TTL, Called With The Lock Held
+        Now = time.time()
+        for JobId in [JobId for JobId, Job in self.Jobs.items()
+                      if Job["finished"] is not None and Now - Job["finished"] > self.ResultTTL]:
+            del self.Jobs[JobId]
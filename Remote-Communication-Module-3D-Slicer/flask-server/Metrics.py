@@ -0,0 +1,185 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus Text Exposition Format
+ContentType = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, From Decoding a Slice Bundle up To Segmenting a Large Volume on a CPU
+DefaultBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _Escape(Value):
+    return str(Value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _Format(Value):
+    if isinstance(Value, int):
+        return str(Value)
+    if math.isinf(Value):
+        return "+Inf" if Value > 0 else "-Inf"
+    return repr(float(Value))
+
+
+class Metric:
+    """
+    A Named Metric With One Value Per Combination of Label Values, Rendered in The Prometheus Text Format
+    """
+    Type = "untyped"
+
+    def __init__(self, Name, Help, Labels=(), Function=None):
+        """
+        :param Name: Metric Name
+        :param Help: Description Shown by The Scraper
+        :param Labels: Names of The Labels Each Value is Keyed by
+        :param Function: Called at Each Scrape Instead of Keeping Values, Returns The Value, or a Dictionary of
+                         Label Value Tuples -> Value When The Metric Has Labels
+        """
+        self.Name = Name
+        self.Help = Help
+        self.Labels = tuple(Labels)
+        self.Function = Function
+        self.Values = {}
+        self.Lock = threading.Lock()
+
+    def Key(self, Labels):
+        if set(Labels) != set(self.Labels):
+            raise ValueError(f"{self.Name} Takes The Labels {self.Labels}, Got {tuple(Labels)}")
+        return tuple(str(Labels[Label]) for Label in self.Labels)
+
+    def Get(self, **Labels):
+        with self.Lock:
+            return self.Values.get(self.Key(Labels), 0)
+
+    def Samples(self):
+        """
+        :return: List of (Suffix, Label Dictionary, Value)
+        """
+        if self.Function is not None:
+            Values = self.Function()
+            Values = Values if isinstance(Values, dict) else {(): Values}
+        else:
+            with self.Lock:
+                Values = dict(self.Values)
+        return [("", dict(zip(self.Labels, Key)), Value) for Key, Value in Values.items() if Value is not None]
+
+    def Render(self):
+        Lines = [f"# HELP {self.Name} {self.Help}", f"# TYPE {self.Name} {self.Type}"]
+        for Suffix, Labels, Value in self.Samples():
+            LabelText = ",".join(f'{Name}="{_Escape(Label)}"' for Name, Label in Labels.items())
+            Lines.append(f"{self.Name}{Suffix}{{{LabelText}}} {_Format(Value)}" if LabelText else
+                         f"{self.Name}{Suffix} {_Format(Value)}")
+        return "\n".join(Lines)
+
+
+class Counter(Metric):
+    Type = "counter"
+
+    def Inc(self, Amount=1, **Labels):
+        Key = self.Key(Labels)
+        with self.Lock:
+            self.Values[Key] = self.Values.get(Key, 0) + Amount
+
+
+class Gauge(Metric):
+    Type = "gauge"
+
+    def Set(self, Value, **Labels):
+        Key = self.Key(Labels)
+        with self.Lock:
+            self.Values[Key] = Value
+
+    def Inc(self, Amount=1, **Labels):
+        Key = self.Key(Labels)
+        with self.Lock:
+            self.Values[Key] = self.Values.get(Key, 0) + Amount
+
+    def Dec(self, Amount=1, **Labels):
+        self.Inc(-Amount, **Labels)
+
+
+class Histogram(Metric):
+    Type = "histogram"
+
+    def __init__(self, Name, Help, Labels=(), Buckets=DefaultBuckets):
+        """
+        :param Buckets: Upper Bounds of The Buckets, +Inf is Added
+        """
+        super().__init__(Name, Help, Labels)
+        self.Buckets = tuple(sorted(Buckets)) + (math.inf,)
+
+    def Observe(self, Value, **Labels):
+        Key = self.Key(Labels)
+        with self.Lock:
+            Counts, Sum = self.Values.get(Key, ([0] * len(self.Buckets), 0.0))
+            for i, Bound in enumerate(self.Buckets):
+                if Value <= Bound:
+                    Counts[i] += 1
+            self.Values[Key] = (Counts, Sum + Value)
+
+    @contextmanager
+    def Time(self, **Labels):
+        """
+        Observes The Seconds Spent in The With Block
+        """
+        Start = time.time()
+        try:
+            yield
+        finally:
+            self.Observe(time.time() - Start, **Labels)
+
+    def Samples(self):
+        with self.Lock:
+            Values = {Key: (list(Counts), Sum) for Key, (Counts, Sum) in self.Values.items()}
+        Samples = []
+        for Key, (Counts, Sum) in Values.items():
+            Labels = dict(zip(self.Labels, Key))
+            for Bound, Count in zip(self.Buckets, Counts):
+                Samples.append(("_bucket", {**Labels, "le": _Format(Bound)}, Count))
+            Samples.append(("_sum", Labels, Sum))
+            Samples.append(("_count", Labels, Counts[-1]))
+        return Samples
+
+
+class MetricsRegistry:
+    """
+    Holds The Server's Metrics & Renders Them For a Prometheus Scraper, Without Depending on a Client Library
+    """
+
+    def __init__(self):
+        self.Metrics = []
+
+    def Register(self, Metric):
+        self.Metrics.append(Metric)
+        return Metric
+
+    def Counter(self, Name, Help, Labels=(), Function=None):
+        return self.Register(Counter(Name, Help, Labels, Function))
+
+    def Gauge(self, Name, Help, Labels=(), Function=None):
+        return self.Register(Gauge(Name, Help, Labels, Function))
+
+    def Histogram(self, Name, Help, Labels=(), Buckets=DefaultBuckets):
+        return self.Register(Histogram(Name, Help, Labels, Buckets))
+
+    def Render(self):
+        return "\n".join(Metric.Render() for Metric in self.Metrics) + "\n"
+
+
+class CountedStream:
+    """
+    Wraps a File Like Object & Reports The Bytes Read From it, Used For Chunked Bodies Without a Content-Length
+    """
+
+    def __init__(self, Stream, Count):
+        """
+        :param Stream: Stream To Read From
+        :param Count: Called With The Number of Bytes of Each Read
+        """
+        self.Stream = Stream
+        self.Count = Count
+
+    def read(self, Size=-1):
+        Data = self.Stream.read(Size)
+        self.Count(len(Data))
+        return Data
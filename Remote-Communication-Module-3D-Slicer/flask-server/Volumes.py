@@ -0,0 +1,139 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from Models import Wire
+
+
+class VolumeStore:
+    """
+    Keeps Uploaded Volumes on Disk Keyed by Their Content Digest, So Clients Can Refer To a Volume The Server
+    Already Holds Instead of Sending it Again. Volumes Expire After Not Being Used For The TTL, & The Least
+    Recently Used Are Removed When The Store Goes Over its Quota
+    """
+
+    def __init__(self, Directory, DiskBudget=4096 * 1024 ** 2, TTL=3600):
+        """
+        :param Directory: Where Volumes Are Stored, Volumes Already There Are Reused
+        :param DiskBudget: Maximum Bytes of Encoded Volumes on Disk
+        :param TTL: Seconds a Volume is Kept After it Was Last Used
+        """
+        self.Directory = Directory
+        self.DiskBudget = DiskBudget
+        self.TTL = TTL
+
+        # Digest -> Header & Size of The Stored Volume, Least Recently Used First
+        self.Index = OrderedDict()
+        self.Stats = {"uploads": 0, "hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        self.Lock = threading.Lock()
+
+        os.makedirs(Directory, exist_ok=True)
+        Files = sorted((Entry for Entry in os.scandir(Directory) if Entry.name.endswith(".casw")),
+                       key=lambda Entry: Entry.stat().st_mtime)
+        for Entry in Files:
+            try:
+                with open(Entry.path, "rb") as File:
+                    Header, _ = Wire.DecodeHeader(File.read(64 * 1024))
+            except (OSError, ValueError):
+                continue
+            self.Index[Entry.name[:-len(".casw")]] = {"header": Header, "size": Entry.stat().st_size,
+                                                      "used": Entry.stat().st_mtime}
+        with self.Lock:
+            self.__Purge()
+
+    @staticmethod
+    def ValidDigest(Digest):
+        return re.fullmatch("[0-9a-f]{32}", Digest or "") is not None
+
+    def Info(self, Digest):
+        """
+        :return: The Stored Volume's Shape, Type, Spacing & Size Without Loading it, None if it's Not Stored
+        """
+        with self.Lock:
+            self.__Purge()
+            Entry = self.Index.get(Digest)
+            if Entry is None:
+                return None
+            return {"digest": Digest, "shape": Entry["header"]["shape"], "dtype": Entry["header"]["dtype"],
+                    "spacing": Entry["header"]["spacing"], "size": Entry["size"],
+                    "expires": Entry["used"] + self.TTL}
+
+    def Get(self, Digest):
+        """
+        :return: Volume Array & Voxel Spacing, None if The Volume isn't Stored
+        """
+        with self.Lock:
+            self.__Purge()
+            if Digest not in self.Index:
+                self.Stats["misses"] += 1
+                return None
+            self.Stats["hits"] += 1
+            self.__Touch(Digest)
+
+        try:
+            with open(self.__Path(Digest), "rb") as File:
+                return Wire.DecodeArray(File.read())
+        except (OSError, ValueError) as e:
+            logging.warning(f"Dropping Unreadable Stored Volume {Digest}: {e}")
+            with self.Lock:
+                self.__Remove(Digest)
+            return None
+
+    def Put(self, Digest, VolumeArray, Spacing=None):
+        """
+        Stores a Volume Under its Digest, Computed by The Server From The Volume Itself
+        """
+        Data = Wire.EncodeArray(VolumeArray, Wire.ChooseCompression(Wire.AvailableCompressions(), ("lz4",)),
+                                Spacing)
+        if len(Data) > self.DiskBudget:
+            return
+
+        # Written Under a Temporary Name & Renamed, So Readers Never See a Partial File
+        Temporary = self.__Path(Digest) + f".{threading.get_ident()}.tmp"
+        with open(Temporary, "wb") as File:
+            File.write(Data)
+        os.replace(Temporary, self.__Path(Digest))
+
+        with self.Lock:
+            self.Stats["uploads"] += 1
+            self.Index[Digest] = {"header": Wire.DecodeHeader(Data)[0], "size": len(Data), "used": time.time()}
+            self.Index.move_to_end(Digest)
+            self.__Purge()
+
+    def Report(self):
+        with self.Lock:
+            return {**self.Stats, "volumes": len(self.Index),
+                    "disk_bytes": sum(Entry["size"] for Entry in self.Index.values()),
+                    "disk_budget": self.DiskBudget, "ttl": self.TTL}
+
+    def __Touch(self, Digest):
+        # Called With The Lock Held, Using a Volume Restarts its TTL
+        self.Index[Digest]["used"] = time.time()
+        self.Index.move_to_end(Digest)
+        try:
+            os.utime(self.__Path(Digest))
+        except OSError:
+            pass
+
+    def __Purge(self):
+        # Drop Expired Volumes, Then The Least Recently Used Till The Store Fits its Quota, Called With The Lock Held
+        Now = time.time()
+        for Digest in [Digest for Digest, Entry in self.Index.items() if Now - Entry["used"] > self.TTL]:
+            self.__Remove(Digest)
+            self.Stats["expired"] += 1
+        while self.Index and sum(Entry["size"] for Entry in self.Index.values()) > self.DiskBudget:
+            self.__Remove(next(iter(self.Index)))
+            self.Stats["evictions"] += 1
+
+    def __Remove(self, Digest):
+        self.Index.pop(Digest, None)
+        try:
+            os.remove(self.__Path(Digest))
+        except OSError:
+            pass
+
+    def __Path(self, Digest):
+        return os.path.join(self.Directory, Digest + ".casw")
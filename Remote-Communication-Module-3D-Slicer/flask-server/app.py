@@ -1,26 +1,187 @@
+import base64
 import logging
 import os
 import sys
+import tempfile
+import threading
 import time
+import zipfile
 from io import BytesIO
-import matplotlib.pyplot as plt
 
 import numpy as np
 from PIL import Image
-from flask import Flask, request, after_this_request, jsonify, send_file
+from flask import Flask, Response, request, after_this_request, jsonify, send_file, abort, g
 
 CurrentDir = os.path.dirname(os.path.realpath(__file__))
 ParentDir = os.path.dirname(CurrentDir)
 RepoRoot = os.path.dirname(ParentDir)
 sys.path.append(RepoRoot)
+sys.path.append(CurrentDir)
+
+from Models.crop_roi import GetCoords, SliceNames
+from Models import Wire
+from Models.Pipeline import CaScore
+from Models.Segmentation.CAC import TableColumns
+from Models.Segmentation.Registry import ModelRegistry
+from Models.Segmentation.Batching import BatchScheduler
+from Models.Segmentation.Backends import configure_cpu
+from Jobs import JobManager, TooManyJobs
+from Cache import ResultCache
+from Volumes import VolumeStore
+from Admission import AdmissionController, EstimatePeak, TooBusy, TooLarge
+from Metrics import MetricsRegistry, CountedStream, ContentType as MetricsContentType
+
+# SavedModel Directories, or .onnx/.tflite Files Exported With Models/Segmentation/Export.py
+ModelsDir = RepoRoot + "/Models/Segmentation/Models_Saved"
+HeartModelPath = os.environ.get("CASCORE_HEART_MODEL", ModelsDir + "/Heart_Localization")
+CalsModelPath = os.environ.get("CASCORE_CAL_MODEL", ModelsDir + "/CAC")
+HeartModelShape = (112, 112, 112)
+CalsModelShape = (128, 128, 80)
+
+# CPU Thread Pools & Core Pinning, Set Before Any Model is Loaded So Several Servers Can Share a Machine
+configure_cpu(intra_op_threads=int(os.environ.get("CASCORE_INTRA_OP_THREADS", "0")) or None,
+              inter_op_threads=int(os.environ.get("CASCORE_INTER_OP_THREADS", "0")) or None,
+              onednn={"1": True, "0": False}.get(os.environ.get("CASCORE_ONEDNN")),
+              cpu_affinity=os.environ.get("CASCORE_CPU_AFFINITY"))
+
+# Loaded Models Are Shared Between Requests, The Budget is in MB of Model Weights (0 Disables Eviction)
+ModelMemoryBudget = int(os.environ.get("CASCORE_MODEL_MEMORY_MB", "0")) * 1024 ** 2 or None
+# "resize" Resizes The Whole Volume To The Model's Input, "sliding" Predicts Patches at The Native Resolution
+InferenceMode = os.environ.get("CASCORE_INFERENCE_MODE", "resize")
+Registry = ModelRegistry(memory_budget=ModelMemoryBudget, mode=InferenceMode,
+                         xla=os.environ.get("CASCORE_XLA", "0") == "1",
+                         upsample=os.environ.get("CASCORE_UPSAMPLE", "linear"))
+
+# Concurrent Volume Requests For The Same Model Are Stacked Into One Forward Pass
+MaxBatchSize = int(os.environ.get("CASCORE_MAX_BATCH", "4"))
+BatchWindow = float(os.environ.get("CASCORE_BATCH_WINDOW_MS", "20")) / 1000
+Schedulers = {}
+SchedulersLock = threading.Lock()
+
+# Volumes Submitted To /jobs Are Processed in The Background, CASCORE_JOB_WORKERS Jobs at a Time, Jobs Live in
+# One Process's Memory So serve.py Disables Them When Requests Are Spread Over Several Workers
+JobsEnabled = os.environ.get("CASCORE_JOBS", "1") == "1"
+Jobs = JobManager(Workers=int(os.environ.get("CASCORE_JOB_WORKERS", "2")),
+                  MaxPending=int(os.environ.get("CASCORE_MAX_JOBS", "32")),
+                  ResultTTL=float(os.environ.get("CASCORE_JOB_TTL", "600")))
+JobTasks = {
+    "heart": (HeartModelPath, HeartModelShape),
+    "calcifications": (CalsModelPath, CalsModelShape)
+}
+
+# Results Are Cached by The Volume's Content & The Model, So Re-Running a Series Skips The Inference
+Cache = ResultCache(MemoryBudget=int(os.environ.get("CASCORE_CACHE_MEMORY_MB", "512")) * 1024 ** 2,
+                    DiskBudget=int(os.environ.get("CASCORE_CACHE_DISK_MB", "2048")) * 1024 ** 2,
+                    Directory=os.environ.get("CASCORE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cascore-cache")))
+
+# Uploaded Volumes Are Kept by Content Digest, So Clients Send The Digest Instead of a Volume The Server Holds
+Volumes = VolumeStore(Directory=os.environ.get("CASCORE_VOLUME_DIR",
+                                               os.path.join(tempfile.gettempdir(), "cascore-volumes")),
+                      DiskBudget=int(os.environ.get("CASCORE_VOLUME_DISK_MB", "4096")) * 1024 ** 2,
+                      TTL=float(os.environ.get("CASCORE_VOLUME_TTL", "3600")))
+
+
+def PhysicalMemory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+# Requests Are Admitted Against a Memory Budget From The Declared Shape of Their Volume Before it is Decoded, The Ones
+# That Don't Fit Wait in a Bounded Queue & Get 429 When it's Full, The Default Budget is Half The Machine's Memory
+AdmissionBudget = int(os.environ.get("CASCORE_ADMISSION_MEMORY_MB", "0")) * 1024 ** 2 or \
+    (PhysicalMemory() // 2 if PhysicalMemory() else None)
+Admission = AdmissionController(MemoryBudget=AdmissionBudget,
+                                MaxQueue=int(os.environ.get("CASCORE_ADMISSION_QUEUE", "8")),
+                                QueueTimeout=float(os.environ.get("CASCORE_ADMISSION_TIMEOUT", "30")))
+
+# Prometheus Metrics Served From /metrics, Stage Durations Are Observed Per Request
+Metrics = MetricsRegistry()
+StageSeconds = Metrics.Histogram("cascore_stage_seconds", "Seconds Spent in Each Stage of a Request: decode, queue, "
+                                 "preprocess, forward, postprocess & encode", ["stage"])
+RequestSeconds = Metrics.Histogram("cascore_request_seconds", "Request Latency", ["route"])
+Requests = Metrics.Counter("cascore_requests_total", "Requests Served", ["route", "status"])
+BytesReceived = Metrics.Counter("cascore_received_bytes_total", "Request Body Bytes Received", ["route"])
+BytesSent = Metrics.Counter("cascore_sent_bytes_total", "Response Body Bytes Sent", ["route"])
+InFlight = Metrics.Gauge("cascore_in_flight_requests", "Requests Being Processed")
+Metrics.Gauge("cascore_loaded_models", "Models Held in Memory", Function=lambda: len(Registry.models))
+Metrics.Gauge("cascore_model_memory_bytes", "Memory Held by The Loaded Models' Weights",
+              Function=lambda: Registry.memory_usage())
+Metrics.Gauge("cascore_model_load_seconds", "Seconds Taken by The Last Load of Each Model", ["model"],
+              Function=lambda: {(Key,): Stats["load_time"] for Key, Stats in Registry.report()["models"].items()})
+Metrics.Gauge("cascore_model_warm_up_seconds", "Seconds Taken by The Warm Up Pass of Each Model", ["model"],
+              Function=lambda: {(Key,): Stats["warm_up_time"] for Key, Stats in Registry.report()["models"].items()})
+Metrics.Counter("cascore_cache_lookups_total", "Result Cache Lookups", ["result"],
+                Function=lambda: {("hit",): Cache.Report()["hits"], ("miss",): Cache.Report()["misses"]})
+Metrics.Gauge("cascore_admission_in_use_bytes", "Estimated Peak Memory Reserved by The Admitted Requests",
+              Function=lambda: Admission.Report()["in_use"])
+Metrics.Gauge("cascore_admission_waiting", "Requests Waiting For Memory",
+              Function=lambda: Admission.Report()["waiting"])
+Metrics.Counter("cascore_admission_rejected_total", "Requests Refused by Admission Control", ["reason"],
+                Function=lambda: {(Reason,): Admission.Report()[Key] for Reason, Key in
+                                  [("queue_full", "rejected_queue_full"), ("timeout", "rejected_timeout"),
+                                   ("too_large", "too_large")]})
 
-from Models.crop_roi import get_coords, GetCoords
-from Models.Segmentation.Inference import Infer
+app = Flask(__name__)
 
-HeartModelPath = RepoRoot + "/Models/Segmentation/Models_Saved/Heart_Localization"
-CalsModelPath = RepoRoot + "/Models/Segmentation/Models_Saved/CAC"
 
-app = Flask(__name__)
+def RouteName():
+    # The Route's Rule Keeps The Label Values Bounded, e.g. /jobs/<JobId> For Every Job
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+@app.before_request
+def StartRequest():
+    g.Start = time.time()
+    InFlight.Inc()
+
+
+@app.after_request
+def RecordRequest(response):
+    Route = RouteName()
+    RequestSeconds.Observe(time.time() - g.Start, route=Route)
+    Requests.Inc(route=Route, status=response.status_code)
+    # Chunked Bodies Have no Length & Are Counted While Read Instead, See ReadVolumeStream
+    if request.content_length:
+        BytesReceived.Inc(request.content_length, route=Route)
+    if response.content_length:
+        BytesSent.Inc(response.content_length, route=Route)
+    return response
+
+
+@app.teardown_request
+def EndRequest(Error=None):
+    InFlight.Dec()
+    Reservation = g.pop("Admission", None)
+    if Reservation:
+        Admission.Release(Reservation)
+
+
+@app.errorhandler(TooBusy)
+def Busy(Error):
+    return jsonify({"error": str(Error)}), 429, {"Retry-After": str(Error.RetryAfter)}
+
+
+@app.errorhandler(TooLarge)
+def Large(Error):
+    return jsonify({"error": str(Error)}), 413
+
+
+def ObserveStages(Timings):
+    for Stage, Seconds in Timings.items():
+        StageSeconds.Observe(Seconds, stage=Stage)
+
+
+def LoadModels():
+    """
+    Loads & Warms Up The Available Models Once at Startup, So The First Requests Don't Pay For It
+    """
+    Models = [(Path, Shape) for Path, Shape in [(HeartModelPath, HeartModelShape), (CalsModelPath, CalsModelShape)]
+              if os.path.exists(Path)]
+    Registry.preload(Models)
+    for Key, Stats in Registry.report()["models"].items():
+        logging.info(f"{Key} Loaded in {Stats['load_time']:.2f} Seconds")
 
 
 def allow_CORS():
@@ -37,6 +198,49 @@ def hello_world():
     return 'Hello World!!!'
 
 
+@app.route('/models')
+def ModelStats():
+    allow_CORS()
+    return jsonify(Registry.report())
+
+
+@app.route('/batching')
+def BatchingStats():
+    allow_CORS()
+    return jsonify({Registry.key(Path, Shape): Scheduler.report() for (Path, Shape), Scheduler in Schedulers.items()})
+
+
+@app.route('/healthz')
+def Health():
+    """
+    Liveness Check of The Process Answering, Reports The Worker Index Given by serve.py
+    """
+    return jsonify({"status": "ok", "pid": os.getpid(), "worker": os.environ.get("CASCORE_WORKER"),
+                    "loaded_models": len(Registry.models), "in_flight": InFlight.Get()})
+
+
+@app.route('/admission')
+def AdmissionStats():
+    """
+    Memory Reserved by The Admitted Requests, Queue Length, Waits & Refusals
+    """
+    return jsonify(Admission.Report())
+
+
+@app.route('/metrics')
+def MetricsPage():
+    """
+    Server Metrics in The Prometheus Text Format
+    """
+    return Response(Metrics.Render(), content_type=MetricsContentType)
+
+
+@app.route('/cache')
+def CacheStats():
+    allow_CORS()
+    return jsonify(Cache.Report())
+
+
 @app.route('/process')
 def calculate_caScore():
     allow_CORS()
@@ -49,12 +253,11 @@ def calculate_caScore():
 @app.route('/crop', methods=['POST'])
 def GetCropCoordinates():
     if request.method == 'POST':
-        # Get Slices Data & Shift Values from the request
-        slices = request.files
-        shift = request.form
+        # Get The Slices, Sent as One Bundle of int16 Arrays or as PNG Files With Their Shift Values
+        Slices = ReadSlices()
 
         # Get Slices Segmentation
-        SegmentedSlices = GetSlicesSegmentation(slices, shift)
+        SegmentedSlices = GetSlicesSegmentation(Slices)
 
         # Coordinates = GetCoords(SegmentedSlices, True)
         Coordinates = GetCoords(SegmentedSlices)
@@ -67,18 +270,29 @@ def GetCropCoordinates():
 @app.route('/segment/slices', methods=['POST'])
 def SegmentSlices():
     if request.method == 'POST':
-        # Get Slices Data & Shift Values from the request
-        slices = request.files
-        shift = request.form
+        # Get The Slices, Sent as One Bundle of int16 Arrays or as PNG Files With Their Shift Values
+        Slices = ReadSlices()
 
-        if slices:
+        if Slices:
             # Get Slices Segmentation
-            SegmentedSlices = GetSlicesSegmentation(slices, shift)
+            SegmentedSlices = GetSlicesSegmentation(Slices)
+
+            # Send The Masks in One Bundle if The Client Accepts it
+            if Wire.BundleContentType in request.headers.get("Accept", ""):
+                Compression = request.headers.get(Wire.AcceptCompressionHeader, "none")
+                if Compression not in Wire.AvailableCompressions():
+                    Compression = "none"
+                Masks = dict(zip(SliceNames, SegmentedSlices))
+                with StageSeconds.Time(stage="encode"):
+                    Body = Wire.EncodeBundle(Masks, Compression)
+                return Response(Body, mimetype=Wire.BundleContentType)
 
             # Compress For Sending
-            CompressedArray = BytesIO()
-            np.savez_compressed(CompressedArray, Ax=SegmentedSlices[0], Cor=SegmentedSlices[1], Sag=SegmentedSlices[2])
-            CompressedArray.seek(0)
+            with StageSeconds.Time(stage="encode"):
+                CompressedArray = BytesIO()
+                np.savez_compressed(CompressedArray, Ax=SegmentedSlices[0], Cor=SegmentedSlices[1],
+                                    Sag=SegmentedSlices[2])
+                CompressedArray.seek(0)
 
             # Send Segmented Slices
             return send_file(CompressedArray, attachment_filename="SegmentedSlices")
@@ -88,26 +302,14 @@ def SegmentSlices():
 @app.route('/segment/volume', methods=['POST'])
 def SegmentVolume():
     if request.method == 'POST':
-        # Get Compressed Volume
-        VolumeCompressed = request.files["Volume"]
-
-        # Decompress & Get Volume Array
-        Data = np.load(VolumeCompressed)
-        VolumeArray = Data['Volume']
+        # Get The Volume, Sent as a Raw Array or a Compressed npz File
+        VolumeArray, Spacing, Digest = ReadVolume(HeartModelPath, HeartModelShape)
 
         # Get Segmentation
-        Segmentation = GetVolumeSegmentation(Volume=VolumeArray, ModelPath=HeartModelPath)
-
-        # Compress Segmentation Array
-        CompressedArray = BytesIO()
-        np.savez_compressed(CompressedArray, Segmentation=Segmentation)
-        CompressedArray.seek(0)
-
-        # Close The Loaded npz File To Prevent Memory Leaks
-        Data.close()
+        Segmentation = GetVolumeSegmentation(Volume=VolumeArray, ModelPath=HeartModelPath, Digest=Digest)
 
-        # Return The Segmented Volume
-        return send_file(CompressedArray, attachment_filename="SegmentedVolume.npz")
+        # Return The Segmented Volume in The Format Requested by The Client
+        return SendArray(Segmentation, "Segmentation", "SegmentedVolume.npz")
 
     return "Good"
 
@@ -115,92 +317,433 @@ def SegmentVolume():
 @app.route('/calcifications/volume', methods=['POST'])
 def VolumeCalcifications():
     if request.method == 'POST':
-        # Get Compressed Volume
-        VolumeCompressed = request.files["Volume"]
-
-        # Decompress & Get Volume Array
-        Data = np.load(VolumeCompressed)
-        VolumeArray = Data['Volume']
+        # Get The Volume, Sent as a Raw Array or a Compressed npz File
+        VolumeArray, Spacing, Digest = ReadVolume(CalsModelPath, CalsModelShape)
 
         # Get Segmentation
-        Segmentation = GetVolumeSegmentation(Volume=VolumeArray, ModelPath=CalsModelPath, Shape=(128, 128, 80))
+        Segmentation = GetVolumeSegmentation(Volume=VolumeArray, ModelPath=CalsModelPath, Shape=CalsModelShape,
+                                             Digest=Digest)
 
-        # Compress Segmentation Array
-        CompressedArray = BytesIO()
-        np.savez_compressed(CompressedArray, Segmentation=Segmentation)
-        CompressedArray.seek(0)
+        # Return The Segmented Volume in The Format Requested by The Client
+        return SendArray(Segmentation, "Segmentation", "SegmentedVolume.npz")
 
-        # Close The Loaded npz File To Prevent Memory Leaks
-        Data.close()
+    return "Good"
 
-        # Return The Segmented Volume
-        return send_file(CompressedArray, attachment_filename="SegmentedVolume.npz")
 
-    return "Good"
+@app.route('/cascore', methods=['GET', 'POST'])
+def CaScoreVolume():
+    """
+    Scores The Posted Volume in One Request: Segments The Heart, Crops To it, Finds The Calcifications & Quantifies
+    Them, Returning The Calcifications Volume, Crop Coordinates & The Masks Named in "masks" Encoded as in
+    X-Mask-Encoding, So a Study Crosses The Network Once. Getting The Route Lists its Options
+    """
+    allow_CORS()
+    if request.method == 'GET':
+        return jsonify({"methods": ["deep", "threshold"], "masks": ["heart", "calcifications"],
+                        "mask_encodings": list(Wire.MaskEncodings), "table": True})
+
+    Method = request.args.get("method", "deep")
+    if Method not in ("deep", "threshold"):
+        return jsonify({"error": f"Unknown Method {Method}"}), 400
+    Masks = [Name for Name in request.args.get("masks", "").split(",") if Name]
+    if any(Name not in ("heart", "calcifications") for Name in Masks):
+        return jsonify({"error": f"Unknown Masks {Masks}"}), 400
+
+    # The Spacing Argument Overrides The One Sent With Raw Arrays, it's Checked Before The Volume is Read
+    Spacing = None
+    if "spacing" in request.args:
+        try:
+            Spacing = [float(i) for i in request.args["spacing"].split(",")]
+        except ValueError:
+            Spacing = []
+        if len(Spacing) != 3 or not all(np.isfinite(i) and i > 0 for i in Spacing):
+            return jsonify({"error": "The Spacing Must Be 3 Positive Numbers"}), 400
+
+    VolumeArray, VolumeSpacing, Digest = ReadVolume()
+    Spacing = Spacing or VolumeSpacing
+    if Spacing is None:
+        return jsonify({"error": "The Voxel Spacing is Required"}), 400
+
+    # Both Segmentations Go Through The Result Cache, The Cropped Volume is Keyed by its Own Content
+    Result = CaScore(VolumeArray, Spacing,
+                     lambda Volume: GetVolumeSegmentation(Volume, HeartModelPath, HeartModelShape, Digest),
+                     (lambda Volume: GetVolumeSegmentation(Volume, CalsModelPath, CalsModelShape,
+                                                           Wire.ArrayDigest(Volume))) if Method == "deep" else None,
+                     Crop=request.args.get("crop", "1") == "1", Margin=int(request.args.get("margin", "0")),
+                     Threshold=float(request.args.get("threshold", "160")))
+
+    Encoding = request.headers.get(Wire.MaskEncodingHeader, "rle")
+    Compression = request.headers.get(Wire.AcceptCompressionHeader, "none")
+    if Encoding not in Wire.MaskEncodings:
+        Encoding = "rle"
+    if Compression not in Wire.AvailableCompressions():
+        Compression = "none"
+    with StageSeconds.Time(stage="encode"):
+        EncodedMasks = {Name: base64.b64encode(Wire.EncodeMask(Result[Name], Encoding, Compression)).decode()
+                        for Name in Masks}
+    Table = TableColumns(Result["table"]) if request.args.get("table", "0") == "1" else None
+    return jsonify({"score": Result["score"], "voxels": Result["voxels"], "scores": Result["scores"],
+                    "coordinates": Result["coordinates"], "spacing": list(Spacing), "method": Method,
+                    "timings": Result["timings"], "masks": EncodedMasks, "table": Table})
+
+
+@app.route('/wire', methods=['GET', 'POST'])
+def WireFormats():
+    """
+    Lists The Supported Transfer Formats, Posting a Volume Decodes it Without Processing, Used in Benchmarks
+    """
+    allow_CORS()
+    if request.method == 'POST':
+        VolumeArray, Spacing, Digest = ReadVolume()
+        return jsonify({"shape": list(VolumeArray.shape), "dtype": VolumeArray.dtype.str, "spacing": Spacing,
+                        "digest": Digest})
+    return jsonify({"formats": ["npz", "raw", "stream", "bundle"], "compressions": Wire.AvailableCompressions(),
+                    "mask_encodings": list(Wire.MaskEncodings)})
+
+
+@app.route('/volumes', methods=['GET', 'POST'])
+def UploadVolume():
+    """
+    Stores The Posted Volume, Sent in Any Transfer Format, & Returns its Digest, Getting The Route Returns The
+    Store's Statistics
+    """
+    allow_CORS()
+    if request.method == 'GET':
+        return jsonify(Volumes.Report())
 
+    VolumeArray, Spacing, Digest = ReadVolume()
+    Volumes.Put(Digest, VolumeArray, Spacing)
+    return jsonify(Volumes.Info(Digest) or {"digest": Digest}), 201
 
-def GetSlicesSegmentation(Slices, Shift):
-    Names = ["Ax1", "Ax2", "Ax3", "Sag1", "Sag2", "Sag3", "Cor1", "Cor2", "Cor3"]
-    AxSlices = []
-    SagSlices = []
-    CorSlices = []
-    SegmentedSlices = [[], [], []]
-    model = Infer(model_path=HeartModelPath, model_input=(112, 112, 112))
-    for SliceName in Names:
-        Slice = Image.open(Slices[SliceName])
-        SliceArray = np.array(Slice, dtype="int16")
-        SliceArray += int(Shift[SliceName])
-        # plt.imshow(SliceArray, cmap='gray')
-        # plt.show()
-        # plt.imshow(res, cmap='gray')
-        # plt.show()
-        if "Ax" in SliceName:
-            AxSlices.append(SliceArray)
-        elif "Sag" in SliceName:
-            SagSlices.append(SliceArray)
-        elif "Cor" in SliceName:
-            CorSlices.append(SliceArray)
-    SegmentedSlices[0] = model.predict(np.array(AxSlices))
-    SegmentedSlices[1] = model.predict(np.array(SagSlices))
-    SegmentedSlices[2] = model.predict(np.array(CorSlices))
+
+@app.route('/volumes/<Digest>', methods=['GET', 'HEAD'])
+def VolumeInfo(Digest):
+    """
+    Existence Check, Returns The Stored Volume's Shape, Type & Expiry Time, or 404 if The Server Doesn't Hold it
+    """
+    allow_CORS()
+    Info = Volumes.Info(Digest) if Volumes.ValidDigest(Digest) else None
+    if Info is None:
+        return jsonify({"error": "Unknown Volume"}), 404
+    return jsonify(Info)
+
+
+@app.route('/jobs', methods=['GET', 'POST'])
+def SubmitJob():
+    """
+    Queues The Posted Volume For Segmentation & Returns The Job's Status Including its Id, The "task" Argument
+    Selects The Model ("heart" or "calcifications"), Getting The Route Lists The Pool's Jobs
+    """
+    allow_CORS()
+    if not JobsEnabled:
+        abort(404, description="Jobs Are Disabled")
+    if request.method == 'GET':
+        return jsonify(Jobs.Report())
+
+    Task = request.args.get("task", "heart")
+    if Task not in JobTasks:
+        return jsonify({"error": f"Unknown Task {Task}"}), 400
+
+    # Decoding is Left To The Worker, The Request Only Keeps The Body, Streams Are Decoded as They Arrive
+    Reservation = None
+    if request.mimetype == Wire.StreamContentType or Wire.VolumeDigestHeader in request.headers:
+        Volume = ReadVolume(*JobTasks[Task])
+        Decode = lambda: Volume
+        # The Decoded Volume Outlives The Request, its Reservation is Handed To The Job Instead of Released
+        Reservation = g.pop("Admission")
+        Cost = Reservation[0]
+    else:
+        # The Estimate Holds The Body, so a Body Over The Budget is Refused Before it is Read
+        Admission.Check(request.content_length or 0)
+        if request.mimetype == Wire.ContentType:
+            Body = request.get_data()
+            Header, _ = Wire.DecodeHeader(Body)
+            Cost = EstimatePeak(Header["shape"], Header["dtype"], len(Body), InferenceMode)
+            Decode = lambda: DecodeVolume(Body, True)
+        else:
+            Body = BytesIO(request.files["Volume"].read())
+            Cost = EstimatePeak(*NpzArrayHeader(Body, "Volume"), Path=InferenceMode)
+            Decode = lambda: DecodeVolume(Body, False)
+        Admission.Check(Cost)
+
+    try:
+        JobId = Jobs.Submit(SegmentationJob, Decode, Cost, *JobTasks[Task], Reservation)
+    except TooManyJobs as e:
+        if Reservation:
+            Admission.Release(Reservation)
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
+    return jsonify(Jobs.Status(JobId)), 202, {"Location": f"/jobs/{JobId}"}
+
+
+@app.route('/jobs/<JobId>')
+def JobStatus(JobId):
+    allow_CORS()
+    Status = Jobs.Status(JobId)
+    if Status is None:
+        return jsonify({"error": "Unknown Job"}), 404
+    return jsonify(Status)
+
+
+@app.route('/jobs/<JobId>/result')
+def JobResult(JobId):
+    allow_CORS()
+    Status = Jobs.Status(JobId)
+    if Status is None:
+        return jsonify({"error": "Unknown Job"}), 404
+    if Status["status"] == "failed":
+        return jsonify(Status), 500
+    if Status["status"] != "done":
+        return jsonify(Status), 409
+
+    # Return The Segmented Volume in The Format Requested by The Client
+    return SendArray(Jobs.Result(JobId), "Segmentation", "SegmentedVolume.npz")
+
+
+def SegmentationJob(Progress, Decode, Cost, ModelPath, Shape, Reservation=None):
+    """
+    Runs on The Job Pool, Decodes The Submitted Volume & Segments it, Jobs Wait For Their Memory Instead of Being
+    Refused as Their Queue is Already Bounded
+    :param Reservation: Held Since The Request Decoded The Volume, Released When The Job Ends
+    """
+    if Reservation is None:
+        Progress(0.02, "Waiting For Memory")
+        Reservation = Admission.Acquire(Cost, Block=True)
+    try:
+        Progress(0.05, "Decoding")
+        VolumeArray, Spacing, Digest = Decode()
+
+        Progress(0.2, "Segmenting")
+        return GetVolumeSegmentation(Volume=VolumeArray, ModelPath=ModelPath, Shape=Shape, Digest=Digest)
+    finally:
+        Admission.Release(Reservation)
+
+
+def ReadVolume(ModelPath=None, Shape=None):
+    """
+    Reads The Volume From The Request, Either a Raw Array Body, a Streamed Array or an npz File in The "Volume" Field,
+    or The Digest of a Stored Volume in The X-Volume-Digest Header, Unknown Digests Are Answered With 404
+    :param ModelPath: Model The Volume is For, Streamed Volumes Are Prepared For it While They Arrive
+    :param Shape: The Model's Input Shape
+    :return: Volume Array or Prepared Volume, Voxel Spacing (None For npz Files), Content Digest
+    """
+    # The Decode Stage of Streamed Volumes Includes Their Overlapped Preprocessing
+    with StageSeconds.Time(stage="decode"):
+        return ReadRequestVolume(ModelPath, Shape)
+
+
+def ReadRequestVolume(ModelPath, Shape):
+    # Each Volume is Admitted From its Declared Shape & Type Before it is Decoded
+    Digest = request.headers.get(Wire.VolumeDigestHeader)
+    if Digest:
+        Info = Volumes.Info(Digest) if Volumes.ValidDigest(Digest) else None
+        if Info is not None:
+            AdmitVolume(Info["shape"], Info["dtype"], Info["size"])
+        Stored = Volumes.Get(Digest) if Info is not None else None
+        if Stored is None:
+            abort(404, description="Unknown Volume")
+        return Stored[0], Stored[1], Digest
+    if request.mimetype == Wire.StreamContentType:
+        return ReadVolumeStream(ModelPath, Shape)
+    if request.mimetype == Wire.ContentType:
+        Body = request.get_data()
+        Header, _ = Wire.DecodeHeader(Body)
+        AdmitVolume(Header["shape"], Header["dtype"], len(Body))
+        return DecodeVolume(Body, True)
+    File = request.files["Volume"]
+    AdmitVolume(*NpzArrayHeader(File.stream, "Volume"))
+    return DecodeVolume(File, False)
+
+
+def AdmitVolume(Shape, Dtype, BodySize=0, Path=InferenceMode):
+    """
+    Reserves The Request's Estimated Peak Memory Until it Ends, Raises TooBusy or TooLarge When it Doesn't Fit
+    :return: The Estimate in Bytes
+    """
+    Cost = EstimatePeak(Shape, Dtype, BodySize, Path)
+    g.Admission = Admission.Acquire(Cost)
+    return Cost
+
+
+def NpzArrayHeader(File, Key):
+    """
+    Reads The Shape & Type of an Array in an npz File From its Header, Without Decompressing The Array
+    :return: Shape, Type
+    """
+    with zipfile.ZipFile(File) as Archive, Archive.open(f"{Key}.npy") as Member:
+        Version = np.lib.format.read_magic(Member)
+        ReadHeader = np.lib.format.read_array_header_1_0 if Version == (1, 0) else \
+            np.lib.format.read_array_header_2_0
+        Shape, _, Dtype = ReadHeader(Member)
+    File.seek(0)
+    return Shape, Dtype
+
+
+def ReadVolumeStream(ModelPath=None, Shape=None):
+    """
+    Decodes a Streamed Volume Straight From The Request Into a Preallocated Array, Each Slab is Resized For
+    The Model While The Next Ones Are Received, So The Transfer & The Preprocessing Overlap
+    :return: Prepared Volume, or The Volume Array When No Model is Given or it Needs The Native Resolution
+    """
+    Model = Registry.get(ModelPath, Shape) if ModelPath else None
+    Prepare = Model is not None and Model.mode == "resize"
+    Preparer = None
+    Hasher = None
+
+    def OnSlab(Array, First, Last):
+        nonlocal Preparer, Hasher
+        # The Digest is Computed Slab by Slab Too, Slabs Arrive in Order
+        Hasher = Hasher or Wire.ArrayHasher(Array.dtype, Array.shape)
+        Hasher.update(memoryview(Array[First:Last]).cast("B"))
+        if Prepare:
+            Preparer = Preparer or Model.slab_preparer(Array.shape)
+            Preparer.add(Array[First:Last], First)
+
+    Route = RouteName()
+    Body = request.stream if request.content_length is not None else \
+        CountedStream(request.stream, lambda Size: BytesReceived.Inc(Size, route=Route))
+    # Slabs Are Decoded as They Arrive, The Body is Never Held Whole
+    Header = Wire.ReadStreamHeader(Body)
+    AdmitVolume(Header["shape"], Header["dtype"], Path="prepared" if Prepare else InferenceMode)
+    VolumeArray, Spacing = Wire.DecodeStream(Body, OnSlab, Header)
+    Digest = Hasher.hexdigest() if Hasher else Wire.ArrayDigest(VolumeArray)
+    return (Preparer.finish() if Preparer else VolumeArray), Spacing, Digest
+
+
+def DecodeVolume(Body, Raw):
+    """
+    :param Body: Raw Array Bytes, or a File Object of an npz File
+    :param Raw: True if The Body is a Raw Array
+    :return: Volume Array, Voxel Spacing (None For npz Files), Content Digest
+    """
+    if Raw:
+        VolumeArray, Spacing = Wire.DecodeArray(Body)
+        return VolumeArray, Spacing, Wire.ArrayDigest(VolumeArray)
+
+    # Decompress & Get Volume Array
+    Data = np.load(Body)
+    VolumeArray = Data['Volume']
+
+    # Close The Loaded npz File To Prevent Memory Leaks
+    Data.close()
+    return VolumeArray, None, Wire.ArrayDigest(VolumeArray)
+
+
+def SendArray(Array, Key, FileName):
+    """
+    Sends The Mask as Its Bounding Box & Encoded Voxels if The Client Accepts it, Otherwise as a Raw Array if The
+    Client Accepts it, Otherwise as a Compressed npz File
+    :param Array: Array To Send
+    :param Key: Name of The Array Inside The npz File
+    :param FileName: Name of The npz File
+    """
+    with StageSeconds.Time(stage="encode"):
+        return EncodeResponse(Array, Key, FileName)
+
+
+def EncodeResponse(Array, Key, FileName):
+    Accept = request.headers.get("Accept", "")
+    Compression = request.headers.get(Wire.AcceptCompressionHeader, "none")
+    if Compression not in Wire.AvailableCompressions():
+        Compression = "none"
+    Encoding = request.headers.get(Wire.MaskEncodingHeader)
+    if Wire.MaskContentType in Accept and Encoding in Wire.MaskEncodings:
+        return Response(Wire.EncodeMask(Array, Encoding, Compression), mimetype=Wire.MaskContentType)
+    if Wire.ContentType in Accept:
+        return Response(Wire.EncodeArray(Array, Compression), mimetype=Wire.ContentType)
+
+    # Compress Array
+    CompressedArray = BytesIO()
+    np.savez_compressed(CompressedArray, **{Key: Array})
+    CompressedArray.seek(0)
+    return send_file(CompressedArray, attachment_filename=FileName)
+
+
+def ReadSlices():
+    """
+    Reads The 3 Sampled Slices of Each View From The Request, Either a Bundle of int16 Arrays or 9 PNG Files
+    With The Values They Were Shifted by in The Form
+    :return: Axial, Sagittal & Coronal Stacks of 3 Slices, an Empty List if The Request Has No Slices
+    """
+    with StageSeconds.Time(stage="decode"):
+        return ReadRequestSlices()
+
+
+def ReadRequestSlices():
+    if request.mimetype == Wire.BundleContentType:
+        Arrays = Wire.DecodeBundle(request.get_data())
+        return [Arrays[Name] for Name in SliceNames]
+
+    if not request.files:
+        return []
+    Slices = []
+    for Name in SliceNames:
+        View = []
+        for i in range(1, 4):
+            SliceArray = np.array(Image.open(request.files[f"{Name}{i}"]), dtype="int16")
+            SliceArray += int(request.form[f"{Name}{i}"])
+            View.append(SliceArray)
+        Slices.append(np.array(View))
+    return Slices
+
+
+def GetSlicesSegmentation(Slices):
+    # The 3 Views Are Prepared in Parallel & Segmented in a Single Forward Pass
+    model = Registry.get(HeartModelPath, HeartModelShape)
+    Timings = {}
+    SegmentedSlices = model.predict_batch(Slices, Timings)
+    ObserveStages(Timings)
     return SegmentedSlices
 
 
-def GetVolumeSegmentation(Volume, ModelPath, Shape=(112, 112, 112)):
-    Times = []
-    # Load Model
-    model = Infer(model_path=ModelPath, model_input=Shape)
+def GetScheduler(ModelPath, Shape):
+    """
+    Returns The Batch Scheduler of The Given Model, Creating it on First Use
+    """
+    Key = (ModelPath, tuple(Shape))
+    with SchedulersLock:
+        if Key not in Schedulers:
+            Schedulers[Key] = BatchScheduler(lambda: Registry.get(ModelPath, Shape),
+                                             max_batch_size=MaxBatchSize, max_wait=BatchWindow)
+        return Schedulers[Key]
+
+
+def ResultKey(Digest, ModelPath, Shape):
+    """
+    Cache Key of a Volume's Result, Covers The Model's Files & Inference Options So Changing Either Misses
+    """
+    Version = os.path.getmtime(ModelPath) if os.path.exists(ModelPath) else None
+    return Cache.Key(Digest, Registry.key(ModelPath, Shape), Version, sorted(Registry.model_options.items()))
 
-    Start = time.time()
 
-    # Calculate Slice Time
-    SliceStart = time.time()
+def GetVolumeSegmentation(Volume, ModelPath, Shape=HeartModelShape, Digest=None):
+    # Volumes Segmented Before Are Served From The Cache
+    Key = ResultKey(Digest, ModelPath, Shape) if Digest else None
+    Segmentation = Cache.Get(Key) if Key else None
+    if Segmentation is not None:
+        logging.info(f"Segmentation Served From The Cache")
+        return Segmentation
 
-    Segmentation = model.predict(Volume)
+    # Queue The Volume, It Shares a Forward Pass With Other Requests For The Same Model
+    model = GetScheduler(ModelPath, Shape)
 
-    SliceEnd = time.time()
-    SliceTime = (SliceEnd - SliceStart)
-    print("Segmented The Volume in {:.2f}".format(SliceTime))
+    Start = time.time()
+
+    # The Queue Wait & The Batch's Stages Feed The Stage Histograms
+    Timings = {}
+    Segmentation = model.predict(Volume, Timings)
+    ObserveStages(Timings)
+    logging.info("Segmented The Volume in {:.2f}, ".format(time.time() - Start) +
+                 ", ".join(f"{Stage} {Seconds:.2f}" for Stage, Seconds in Timings.items()))
 
     logging.info(f"Segmentation Computed Locally")
-    # # Loop Over Axial Slices
-    # for i in range(Volume.shape[0]):
-    #     # Calculate Slice Time
-    #     SliceStart = time.time()
-    #
-    #     # Segment Heart in Slice
-    #     res = model.predict(Volume[i, :, :])
-    #     Segmentation.append(res)
-    #     SliceEnd = time.time()
-    #     SliceTime = (SliceEnd - SliceStart)
-    #     print("Segmented Slice Number {} in {:.2f}".format(i, SliceTime))
-    #     Times.append(SliceTime)
-
-    End = time.time()
-    print('Segmentation completed in {0:.2f} seconds'.format(End - Start))
 
+    if Key:
+        Cache.Put(Key, Segmentation)
     return Segmentation
 
 
+if os.environ.get("CASCORE_PRELOAD", "1") == "1":
+    LoadModels()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,256 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from multiprocessing import RawArray
+
+CurrentDir = os.path.dirname(os.path.realpath(__file__))
+RepoRoot = os.path.dirname(os.path.dirname(CurrentDir))
+sys.path.append(RepoRoot)
+sys.path.append(CurrentDir)
+
+from werkzeug.serving import make_server
+from Models.Segmentation.Backends import configure_cpu, parse_cpu_list
+
+# Exit Code of a Worker Whose Preloaded Models Don't Run After fork
+ForkUnsafe = 3
+
+
+def ParseArguments():
+    Parser = argparse.ArgumentParser(description="Pre-Fork Launcher, Loads The Models Once & Forks Workers Sharing "
+                                                 "Them Copy-On-Write on One Listening Socket")
+    Parser.add_argument("--host", default=os.environ.get("CASCORE_HOST", "127.0.0.1"))
+    Parser.add_argument("--port", type=int, default=int(os.environ.get("CASCORE_PORT", "5000")))
+    Parser.add_argument("--workers", type=int, default=int(os.environ.get("CASCORE_WORKERS", "2")))
+    Parser.add_argument("--backlog", type=int, default=128, help="Connections Queued on The Listening Socket")
+    Parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=True,
+                        help="Load The Models in The Launcher Before Forking, Otherwise Each Worker Loads Its Own")
+    Parser.add_argument("--pin", action=argparse.BooleanOptionalAction, default=True,
+                        help="Pin Each Worker To Its Own Slice of The Launcher's Cores")
+    Parser.add_argument("--timeout", type=float, default=30,
+                        help="Seconds Without a Heartbeat From a Serving Worker Before it is Killed & Replaced")
+    Parser.add_argument("--graceful-timeout", type=float, default=120,
+                        help="Seconds a Stopping Worker Gets To Finish Its In-Flight Requests")
+    Parser.add_argument("--fork-check-timeout", type=float, default=60,
+                        help="Seconds a Worker Gets To Run The Preloaded Models Once After fork")
+    return Parser.parse_args()
+
+
+def WorkerCores(Index, Workers, Cores):
+    """
+    Splits The Cores Into Equal Disjoint Slices, One Per Worker, Workers Share Slices When They Outnumber The Cores
+    """
+    Size = max(1, len(Cores) // Workers)
+    Start = (Index * Size) % len(Cores)
+    return Cores[Start:Start + Size]
+
+
+class Launcher:
+    """
+    Owns The Listening Socket & Keeps The Workers Running: Replaces The Ones That Exit or Stop Beating, Restarts
+    Them One by One on SIGHUP & Stops Them on SIGTERM, Stopping Workers Finish Their In-Flight Requests First
+    """
+
+    def __init__(self, Args, App, Cores):
+        self.Args = Args
+        self.App = App
+        self.Cores = Cores
+
+        # Workers Accept From The Same Socket, it is Non Blocking So a Worker Losing an Accept Race Doesn't Hang
+        self.Socket = socket.create_server((Args.host, Args.port), backlog=Args.backlog)
+        self.Socket.setblocking(False)
+        self.Socket.set_inheritable(True)
+
+        # Each Worker Writes The Time of Its Last Accept Loop Iteration in Its Slot
+        self.Beats = RawArray("d", Args.workers)
+        self.Workers = {}
+        self.Draining = {}
+        self.Restart = False
+        self.Stopping = False
+        self.Failed = False
+
+    def Run(self):
+        """
+        :return: Exit Code, ForkUnsafe When The Preloaded Models Didn't Run in a Worker
+        """
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "Restart", True))
+        signal.signal(signal.SIGTERM, self.__Stop)
+        signal.signal(signal.SIGINT, self.__Stop)
+
+        logging.info(f"Listening on {self.Args.host}:{self.Args.port} With {self.Args.workers} Workers")
+        for Index in range(self.Args.workers):
+            self.Spawn(Index)
+
+        while self.Workers or self.Draining:
+            if self.Stopping and self.Workers:
+                for Pid in list(self.Workers):
+                    self.Drain(Pid)
+            if self.Restart:
+                self.Restart = False
+                logging.info("Restarting The Workers")
+                for Pid, (Index, _) in list(self.Workers.items()):
+                    self.Spawn(Index)
+                    self.Drain(Pid)
+            self.Reap()
+            self.Check()
+            time.sleep(0.1)
+
+        self.Socket.close()
+        return ForkUnsafe if self.Failed else 0
+
+    def Spawn(self, Index):
+        self.Beats[Index] = 0.0
+        Pid = os.fork()
+        if Pid == 0:
+            Code = 1
+            try:
+                Code = self.Serve(Index)
+            except BaseException:
+                logging.exception(f"Worker {Index} Failed")
+            finally:
+                # Never Return Into The Launcher's Loop
+                os._exit(Code)
+        self.Workers[Pid] = (Index, time.time())
+        logging.info(f"Started Worker {Index} ({Pid})")
+
+    def Drain(self, Pid):
+        """
+        Asks a Worker To Stop Accepting & Exit Once Its In-Flight Requests Are Done
+        """
+        self.Workers.pop(Pid, None)
+        self.Draining[Pid] = time.time() + self.Args.graceful_timeout
+        self.__Kill(Pid, signal.SIGTERM)
+
+    def Reap(self):
+        while True:
+            try:
+                Pid, Status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if Pid == 0:
+                return
+            Code = os.waitstatus_to_exitcode(Status)
+            self.Draining.pop(Pid, None)
+            if Pid not in self.Workers:
+                continue
+
+            Index, Started = self.Workers.pop(Pid)
+            if Code == ForkUnsafe:
+                logging.error("The Preloaded Models Don't Run After fork, Restarting Without Preloading")
+                self.Failed = True
+                self.Stopping = True
+            if self.Stopping:
+                continue
+            logging.warning(f"Worker {Index} ({Pid}) Exited With {Code}, Replacing it")
+            # Don't Fork in a Tight Loop When Workers Fail at Startup
+            if time.time() - Started < 5:
+                time.sleep(1)
+            self.Spawn(Index)
+
+    def Check(self):
+        Now = time.time()
+        for Pid, (Index, _) in list(self.Workers.items()):
+            # Beats Start Once The Worker Serves, Loading Models Isn't Timed
+            if self.Beats[Index] and Now - self.Beats[Index] > self.Args.timeout:
+                logging.warning(f"Worker {Index} ({Pid}) Stopped Beating, Killing it")
+                self.__Kill(Pid, signal.SIGKILL)
+        for Pid, Deadline in list(self.Draining.items()):
+            if Now > Deadline:
+                logging.warning(f"Worker {Pid} Didn't Finish in Time, Killing it")
+                self.__Kill(Pid, signal.SIGKILL)
+                self.Draining[Pid] = float("inf")
+
+    def Serve(self, Index):
+        """
+        Runs in The Forked Worker
+        :return: Exit Code
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Ctrl-C Reaches The Whole Process Group, The Launcher Drains The Workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        os.environ["CASCORE_WORKER"] = str(Index)
+
+        if self.Args.pin:
+            configure_cpu(cpu_affinity=WorkerCores(Index, self.Args.workers, self.Cores))
+        if self.Args.preload:
+            if not self.CheckModels():
+                return ForkUnsafe
+        else:
+            self.App.LoadModels()
+
+        Server = make_server(self.Args.host, self.Args.port, self.App.app, threaded=True, fd=self.Socket.fileno())
+        Server.socket.setblocking(False)
+        # Request Threads Are Joined When The Server Closes, So In-Flight Requests Finish Before Exiting
+        Server.daemon_threads = False
+        Server.service_actions = lambda: self.Beats.__setitem__(Index, time.time())
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=Server.shutdown).start())
+
+        logging.info(f"Worker {Index} Serving")
+        Server.serve_forever(poll_interval=0.5)
+        logging.info(f"Worker {Index} Stopped")
+        return 0
+
+    def CheckModels(self):
+        """
+        Runs Each Preloaded Model Once, Runtimes Whose Thread Pools Were Started Before fork Can Hang Here Instead
+        of on The First Request
+        """
+        Models = list(self.App.Registry.models.values())
+        Check = threading.Thread(target=lambda: [Model.warm_up() for Model in Models], daemon=True)
+        Check.start()
+        Check.join(self.Args.fork_check_timeout)
+        return not Check.is_alive()
+
+    def __Stop(self, *_):
+        # A Second Signal Doesn't Wait For The In-Flight Requests
+        if self.Stopping:
+            for Pid in list(self.Draining):
+                self.__Kill(Pid, signal.SIGKILL)
+        self.Stopping = True
+
+    @staticmethod
+    def __Kill(Pid, Signal):
+        try:
+            os.kill(Pid, Signal)
+        except ProcessLookupError:
+            pass
+
+
+def Main():
+    Args = ParseArguments()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(message)s")
+
+    # The Workers Split The Cores The Server Would Have Been Pinned To
+    if os.environ.get("CASCORE_CPU_AFFINITY"):
+        Cores = sorted(parse_cpu_list(os.environ["CASCORE_CPU_AFFINITY"]))
+    elif hasattr(os, "sched_getaffinity"):
+        Cores = sorted(os.sched_getaffinity(0))
+    else:
+        Cores = list(range(os.cpu_count()))
+    # Thread Pools Are Sized When a Model is Loaded, Which Happens in The Launcher When Preloading
+    os.environ.setdefault("CASCORE_INTRA_OP_THREADS", str(len(WorkerCores(0, Args.workers, Cores))))
+    os.environ["CASCORE_PRELOAD"] = "1" if Args.preload else "0"
+    # Each Worker Admits Requests Against its Share of The Default Budget, Half The Machine's Memory
+    if hasattr(os, "sysconf") and "CASCORE_ADMISSION_MEMORY_MB" not in os.environ:
+        Memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        os.environ["CASCORE_ADMISSION_MEMORY_MB"] = str(max(1, Memory // 2 // Args.workers // 1024 ** 2))
+    # Jobs Are Kept in One Worker's Memory, The Status Polls Could Reach Another Worker
+    if Args.workers > 1:
+        os.environ.setdefault("CASCORE_JOBS", "0")
+
+    Start = time.time()
+    import app as App
+    logging.info(f"Server Loaded in {time.time() - Start:.2f} Seconds, {len(App.Registry.models)} Models Loaded")
+
+    if Launcher(Args, App, Cores).Run() == ForkUnsafe:
+        # The Launcher's Runtime is Already Started, Only a Fresh Process Can Give Workers Their Own
+        os.execv(sys.executable, [sys.executable, os.path.realpath(__file__)] + sys.argv[1:] + ["--no-preload"])
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from Admission import AdmissionController, EstimatePeak, TooBusy, TooLarge, WorkingBytes
+
+
+def Waiting(Controller, Count, Timeout=5):
+    # Until Count Requests Wait For Memory
+    Deadline = time.time() + Timeout
+    while Controller.Report()["waiting"] != Count:
+        assert time.time() < Deadline, "The Requests Never Waited"
+        time.sleep(0.005)
+
+
+def test_estimate_counts_the_body_the_volume_and_the_working_memory():
+    Shape = (100, 512, 512)
+    Voxels = 100 * 512 * 512
+    assert EstimatePeak(Shape, np.int16) == Voxels * (2 + WorkingBytes["resize"])
+    assert EstimatePeak(Shape, "<f4", 1234, "prepared") == 1234 + Voxels * (4 + WorkingBytes["prepared"])
+    assert EstimatePeak(Shape, np.int16, Path="sliding") < EstimatePeak(Shape, np.int16)
+
+
+def test_reservations_are_accounted_until_released():
+    Controller = AdmissionController(MemoryBudget=100)
+    First = Controller.Acquire(60)
+    Second = Controller.Acquire(40)
+    Report = Controller.Report()
+    assert Report["in_use"] == 100 and Report["active"] == 2 and Report["peak_in_use"] == 100
+
+    Controller.Release(First)
+    Controller.Release(Second)
+    Report = Controller.Report()
+    assert Report["in_use"] == 0 and Report["active"] == 0
+    assert Report["admitted"] == Report["released"] == 2
+
+
+def test_requests_over_the_budget_are_too_large():
+    Controller = AdmissionController(MemoryBudget=100)
+    with pytest.raises(TooLarge):
+        Controller.Acquire(101)
+    assert Controller.Report()["too_large"] == 1
+    # Without a Budget Every Request is Admitted
+    Unbounded = AdmissionController(MemoryBudget=None)
+    Unbounded.Release(Unbounded.Acquire(10 ** 15))
+
+
+def test_waiting_requests_are_admitted_once_memory_is_freed():
+    Controller = AdmissionController(MemoryBudget=100)
+    Held = Controller.Acquire(80)
+    Admitted = []
+    Thread = threading.Thread(target=lambda: Admitted.append(Controller.Acquire(50)))
+    Thread.start()
+    Waiting(Controller, 1)
+    assert not Admitted
+
+    Controller.Release(Held)
+    Thread.join(5)
+    assert Admitted and Controller.Report()["in_use"] == 50
+    assert Controller.Report()["queued"] == 1
+
+
+def test_waiting_requests_are_admitted_first_in_first_out():
+    # A Small Request That Would Fit Waits Behind an Earlier Large One, so Large Requests Aren't Starved
+    Controller = AdmissionController(MemoryBudget=100)
+    Held = Controller.Acquire(60)
+    Order = []
+
+    def Request(Name, Bytes):
+        Reservation = Controller.Acquire(Bytes)
+        Order.append(Name)
+        return Reservation
+
+    Large = []
+    LargeThread = threading.Thread(target=lambda: Large.append(Request("large", 80)))
+    LargeThread.start()
+    Waiting(Controller, 1)
+    SmallThread = threading.Thread(target=lambda: Request("small", 30))
+    SmallThread.start()
+    Waiting(Controller, 2)
+    assert not Order
+
+    Controller.Release(Held)
+    LargeThread.join(5)
+    Waiting(Controller, 1)
+    assert Order == ["large"]
+    Controller.Release(Large[0])
+    SmallThread.join(5)
+    assert Order == ["large", "small"]
+
+
+def test_requests_are_refused_when_the_queue_is_full():
+    Controller = AdmissionController(MemoryBudget=100, MaxQueue=0)
+    Held = Controller.Acquire(90)
+    with pytest.raises(TooBusy) as Error:
+        Controller.Acquire(20)
+    assert Error.value.RetryAfter >= 1
+    assert Controller.Report()["rejected_queue_full"] == 1
+    # Background Jobs Wait Even When The Queue is Full
+    Admitted = []
+    Thread = threading.Thread(target=lambda: Admitted.append(Controller.Acquire(20, Block=True)))
+    Thread.start()
+    Waiting(Controller, 1)
+    Controller.Release(Held)
+    Thread.join(5)
+    assert Admitted
+
+
+def test_requests_are_refused_after_waiting_too_long():
+    Controller = AdmissionController(MemoryBudget=100, QueueTimeout=0.05)
+    Controller.Acquire(90)
+    Start = time.time()
+    with pytest.raises(TooBusy):
+        Controller.Acquire(20)
+    assert time.time() - Start >= 0.05
+    Report = Controller.Report()
+    assert Report["rejected_timeout"] == 1 and Report["waiting"] == 0
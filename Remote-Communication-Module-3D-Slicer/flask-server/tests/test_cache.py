@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+
+from Cache import ResultCache
+
+
+def Result(Value, Size=1000, Dtype=np.uint8):
+    return np.full(Size, Value, dtype=Dtype)
+
+
+def test_memory_evicts_the_least_recently_used():
+    Cache = ResultCache(MemoryBudget=3000)
+    for Key in "abc":
+        Cache.Put(Key, Result(1))
+    # Reading "a" Makes "b" The Least Recently Used
+    assert Cache.Get("a") is not None
+    Cache.Put("d", Result(1))
+
+    assert Cache.Get("b") is None
+    assert all(Cache.Get(Key) is not None for Key in "acd")
+    Report = Cache.Report()
+    assert Report["memory_entries"] == 3 and Report["memory_bytes"] == 3000
+    assert Report["memory_evictions"] == 1
+    assert Report["hits"] == Report["memory_hits"] == 4 and Report["misses"] == 1
+    assert Report["hit_rate"] == pytest.approx(0.8)
+
+
+def test_cached_results_are_read_only():
+    Cache = ResultCache()
+    Cache.Put("a", Result(1))
+    with pytest.raises(ValueError):
+        Cache.Get("a")[0] = 0
+
+
+def test_results_over_both_budgets_are_not_cached(tmp_path):
+    Cache = ResultCache(MemoryBudget=100, DiskBudget=10, Directory=str(tmp_path))
+    Cache.Put("a", np.arange(1000, dtype=np.int64))
+    assert Cache.Get("a") is None
+    assert not os.listdir(tmp_path)
+
+
+def test_disk_results_outlive_the_cache(tmp_path):
+    Mask = (np.random.default_rng(0).random((9, 10, 11)) > 0.7).astype(np.uint8)
+    Scores = np.linspace(0, 1, 50, dtype=np.float32)
+    Cache = ResultCache(MemoryBudget=0, DiskBudget=10 ** 6, Directory=str(tmp_path))
+    Cache.Put("mask", Mask)
+    Cache.Put("scores", Scores)
+    assert sorted(os.listdir(tmp_path)) == ["mask.casw", "scores.casw"]
+
+    Restarted = ResultCache(MemoryBudget=10 ** 6, DiskBudget=10 ** 6, Directory=str(tmp_path))
+    for Key, Expected in [("mask", Mask), ("scores", Scores)]:
+        Cached = Restarted.Get(Key)
+        assert Cached.dtype == Expected.dtype
+        np.testing.assert_array_equal(Cached, Expected)
+    # Disk Hits Are Kept in Memory Too
+    assert Restarted.Get("mask") is not None
+    Report = Restarted.Report()
+    assert Report["disk_hits"] == 2 and Report["memory_hits"] == 1
+
+
+def test_disk_evicts_the_least_recently_used(tmp_path):
+    Rng = np.random.default_rng(1)
+    Results = {Key: Rng.integers(0, 1000, 500).astype(np.int16) for Key in "abc"}
+    Cache = ResultCache(MemoryBudget=0, DiskBudget=2500, Directory=str(tmp_path))
+    for Key, Value in Results.items():
+        Cache.Put(Key, Value)
+
+    assert sorted(os.listdir(tmp_path)) == ["b.casw", "c.casw"]
+    assert Cache.Report()["disk_evictions"] == 1
+    np.testing.assert_array_equal(Cache.Get("c"), Results["c"])
+
+
+def test_unreadable_disk_results_are_dropped(tmp_path):
+    Cache = ResultCache(MemoryBudget=0, DiskBudget=10 ** 6, Directory=str(tmp_path))
+    Cache.Put("a", Result(1))
+    with open(tmp_path / "a.casw", "r+b") as File:
+        File.seek(-1, os.SEEK_END)
+        File.write(b"\xff")
+
+    assert Cache.Get("a") is None
+    assert not os.listdir(tmp_path)
+    assert Cache.Report()["disk_entries"] == 0
+
+
+def test_keys_depend_on_every_part():
+    assert ResultCache.Key("digest", "heart") == ResultCache.Key("digest", "heart")
+    assert ResultCache.Key("digest", "heart") != ResultCache.Key("digest", "calcifications")
+    assert ResultCache.Key("a", "bc") != ResultCache.Key("ab", "c")
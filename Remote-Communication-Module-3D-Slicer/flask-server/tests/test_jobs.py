@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from Jobs import JobManager, TooManyJobs
+
+
+def Finished(Jobs, JobId, Timeout=5):
+    Deadline = time.time() + Timeout
+    while Jobs.Status(JobId)["status"] not in ("done", "failed"):
+        assert time.time() < Deadline, "The Job Never Finished"
+        time.sleep(0.005)
+    return Jobs.Status(JobId)
+
+
+def test_jobs_run_with_their_arguments_and_keep_their_result():
+    Jobs = JobManager(Workers=2)
+    JobId = Jobs.Submit(lambda Progress, A, B: A * B, 6, 7)
+    Status = Finished(Jobs, JobId)
+
+    assert Status["status"] == "done" and Status["progress"] == 1.0 and Status["error"] is None
+    assert "result" not in Status
+    assert Jobs.Result(JobId) == 42
+    assert Status["created"] <= Status["started"] <= Status["finished"]
+    assert Jobs.Status("unknown") is None
+
+
+def test_jobs_report_their_progress():
+    Jobs = JobManager(Workers=1)
+    Reached, Resume = threading.Event(), threading.Event()
+
+    def Job(Progress):
+        Progress(0.5, "Segmenting")
+        Reached.set()
+        Resume.wait(5)
+
+    JobId = Jobs.Submit(Job)
+    assert Reached.wait(5)
+    Status = Jobs.Status(JobId)
+    assert Status["status"] == "running" and Status["progress"] == 0.5 and Status["stage"] == "Segmenting"
+    Resume.set()
+    assert Finished(Jobs, JobId)["status"] == "done"
+
+
+def test_failed_jobs_keep_their_error():
+    def Job(Progress):
+        raise ValueError("Not a Raw Array")
+
+    Jobs = JobManager(Workers=1)
+    Status = Finished(Jobs, Jobs.Submit(Job))
+    assert Status["status"] == "failed" and Status["error"] == "Not a Raw Array"
+    assert Jobs.Report()["failed"] == 1
+
+
+def test_submissions_over_the_pending_limit_are_refused():
+    Jobs = JobManager(Workers=1, MaxPending=2)
+    Resume = threading.Event()
+    Blocked = [Jobs.Submit(lambda Progress: Resume.wait(5)) for _ in range(2)]
+    with pytest.raises(TooManyJobs):
+        Jobs.Submit(lambda Progress: None)
+
+    Report = Jobs.Report()
+    assert Report["running"] + Report["queued"] == 2
+    Resume.set()
+    for JobId in Blocked:
+        Finished(Jobs, JobId)
+    # Finished Jobs Don't Count Against The Limit
+    Finished(Jobs, Jobs.Submit(lambda Progress: None))
+
+
+def test_finished_jobs_are_dropped_after_the_ttl():
+    Jobs = JobManager(Workers=1, ResultTTL=0.05)
+    Old = Jobs.Submit(lambda Progress: "old")
+    Finished(Jobs, Old)
+    time.sleep(0.1)
+    New = Jobs.Submit(lambda Progress: "new")
+
+    assert Jobs.Status(Old) is None
+    assert Finished(Jobs, New)["status"] == "done"
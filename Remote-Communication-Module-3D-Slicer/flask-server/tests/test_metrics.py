@@ -0,0 +1,87 @@
+import math
+from io import BytesIO
+
+import pytest
+
+from Metrics import CountedStream, MetricsRegistry
+
+
+def Lines(Registry):
+    return [Line for Line in Registry.Render().splitlines() if not Line.startswith("#")]
+
+
+def test_counters_are_kept_per_label():
+    Registry = MetricsRegistry()
+    Requests = Registry.Counter("requests_total", "Requests", ["route", "status"])
+    Requests.Inc(route="/segment", status=200)
+    Requests.Inc(2, route="/segment", status=200)
+    Requests.Inc(route="/segment", status=429)
+
+    assert Requests.Get(route="/segment", status=200) == 3
+    assert Requests.Get(route="/jobs", status=200) == 0
+    assert Lines(Registry) == ['requests_total{route="/segment",status="200"} 3',
+                               'requests_total{route="/segment",status="429"} 1']
+    with pytest.raises(ValueError):
+        Requests.Inc(route="/segment")
+
+
+def test_render_has_help_type_and_escaped_labels():
+    Registry = MetricsRegistry()
+    Registry.Gauge("in_flight", "Requests Being Served").Inc()
+    Registry.Counter("errors_total", "Errors", ["message"]).Inc(message='a "quoted"\\path\nline')
+    Text = Registry.Render()
+
+    assert Text.endswith("\n")
+    assert "# HELP in_flight Requests Being Served\n# TYPE in_flight gauge\nin_flight 1\n" in Text
+    assert "# TYPE errors_total counter" in Text
+    assert 'errors_total{message="a \\"quoted\\"\\\\path\\nline"} 1' in Text
+
+
+def test_gauges_go_up_and_down():
+    Registry = MetricsRegistry()
+    Gauge = Registry.Gauge("loaded", "Loaded Models", ["model"])
+    Gauge.Set(2.5, model="heart")
+    Gauge.Dec(model="heart")
+    assert Gauge.Get(model="heart") == 1.5
+
+
+def test_function_metrics_are_read_at_each_scrape():
+    Registry = MetricsRegistry()
+    State = {"in_use": 10}
+    Registry.Gauge("in_use_bytes", "Memory in Use", Function=lambda: State["in_use"])
+    Registry.Counter("rejected_total", "Rejections", ["reason"],
+                     Function=lambda: {("timeout",): 2, ("queue_full",): 0, ("skipped",): None})
+    assert Lines(Registry) == ["in_use_bytes 10", 'rejected_total{reason="timeout"} 2',
+                               'rejected_total{reason="queue_full"} 0']
+    State["in_use"] = 20
+    assert Lines(Registry)[0] == "in_use_bytes 20"
+
+
+def test_histogram_buckets_are_cumulative():
+    Registry = MetricsRegistry()
+    Seconds = Registry.Histogram("seconds", "Request Seconds", ["route"], Buckets=(0.1, 1))
+    for Value in (0.05, 0.1, 0.5, 3):
+        Seconds.Observe(Value, route="/")
+
+    assert Lines(Registry) == ['seconds_bucket{route="/",le="0.1"} 2', 'seconds_bucket{route="/",le="1"} 3',
+                               'seconds_bucket{route="/",le="+Inf"} 4', 'seconds_sum{route="/"} 3.65',
+                               'seconds_count{route="/"} 4']
+    assert Seconds.Buckets[-1] == math.inf
+
+
+def test_histogram_times_the_block_even_when_it_raises():
+    Seconds = MetricsRegistry().Histogram("seconds", "Stage Seconds", ["stage"])
+    with pytest.raises(RuntimeError):
+        with Seconds.Time(stage="decode"):
+            raise RuntimeError
+    Samples = {Suffix: Value for Suffix, _, Value in Seconds.Samples() if Suffix != "_bucket"}
+    assert Samples["_count"] == 1 and Samples["_sum"] >= 0
+
+
+def test_counted_stream_reports_every_read():
+    Counts = []
+    Stream = CountedStream(BytesIO(b"x" * 100), Counts.append)
+    assert Stream.read(30) == b"x" * 30
+    assert len(Stream.read()) == 70
+    assert Stream.read(10) == b""
+    assert Counts == [30, 70, 0]
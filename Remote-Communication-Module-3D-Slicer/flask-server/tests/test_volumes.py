@@ -0,0 +1,79 @@
+import os
+import time
+
+import numpy as np
+
+from Models import Wire
+from Volumes import VolumeStore
+
+
+def RandomVolume(Seed=0, Shape=(6, 20, 20)):
+    return np.random.default_rng(Seed).integers(-1000, 1000, Shape).astype(np.int16)
+
+
+def test_volumes_are_stored_by_digest(tmp_path):
+    Store = VolumeStore(str(tmp_path))
+    Volume = RandomVolume()
+    Digest = Wire.ArrayDigest(Volume)
+    assert Store.Get(Digest) is None and Store.Info(Digest) is None
+
+    Store.Put(Digest, Volume, (0.7, 0.7, 2.5))
+    Stored, Spacing = Store.Get(Digest)
+    np.testing.assert_array_equal(Stored, Volume)
+    assert Spacing == [0.7, 0.7, 2.5]
+    Info = Store.Info(Digest)
+    assert Info["shape"] == list(Volume.shape) and np.dtype(Info["dtype"]) == Volume.dtype
+    assert Info["size"] == os.path.getsize(tmp_path / f"{Digest}.casw")
+    assert Store.Report()["uploads"] == 1 and Store.Report()["hits"] == 1 and Store.Report()["misses"] == 1
+
+
+def test_volumes_outlive_the_store(tmp_path):
+    Volume = RandomVolume()
+    Digest = Wire.ArrayDigest(Volume)
+    VolumeStore(str(tmp_path)).Put(Digest, Volume)
+    # Files That Aren't Stored Volumes Are Skipped
+    (tmp_path / "broken.casw").write_bytes(b"not a volume")
+
+    Restarted = VolumeStore(str(tmp_path))
+    assert Restarted.Report()["volumes"] == 1
+    np.testing.assert_array_equal(Restarted.Get(Digest)[0], Volume)
+
+
+def test_volumes_expire_after_the_ttl(tmp_path, monkeypatch):
+    Store = VolumeStore(str(tmp_path), TTL=60)
+    Volumes = {Wire.ArrayDigest(Volume): Volume for Volume in (RandomVolume(0), RandomVolume(1))}
+    for Digest, Volume in Volumes.items():
+        Store.Put(Digest, Volume)
+    First, Second = Volumes
+
+    Now = time.time()
+    monkeypatch.setattr(time, "time", lambda: Now + 45)
+    # Using a Volume Restarts its TTL
+    assert Store.Get(First) is not None
+    monkeypatch.setattr(time, "time", lambda: Now + 90)
+
+    assert Store.Info(Second) is None
+    assert Store.Info(First) is not None
+    assert not os.path.exists(tmp_path / f"{Second}.casw")
+    assert Store.Report()["expired"] == 1
+
+
+def test_least_recently_used_volumes_leave_a_full_store(tmp_path):
+    Volumes = {Wire.ArrayDigest(Volume): Volume for Volume in (RandomVolume(Seed) for Seed in range(3))}
+    Size = len(Wire.EncodeArray(RandomVolume(), Wire.ChooseCompression(Wire.AvailableCompressions(), ("lz4",))))
+    Store = VolumeStore(str(tmp_path), DiskBudget=int(Size * 2.5))
+    Digests = list(Volumes)
+    Store.Put(Digests[0], Volumes[Digests[0]])
+    Store.Put(Digests[1], Volumes[Digests[1]])
+    assert Store.Get(Digests[0]) is not None
+    Store.Put(Digests[2], Volumes[Digests[2]])
+
+    assert Store.Info(Digests[1]) is None
+    assert Store.Info(Digests[0]) is not None and Store.Info(Digests[2]) is not None
+    assert Store.Report()["evictions"] == 1
+
+
+def test_only_digests_are_valid():
+    assert VolumeStore.ValidDigest(Wire.ArrayDigest(RandomVolume()))
+    for Digest in (None, "", "../../etc/passwd", "A" * 32, "0" * 31, "0" * 33):
+        assert not VolumeStore.ValidDigest(Digest)